@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Telegram escrow bot.
+Generates synthetic data stores and times the Database layer and handlers.
+Run with: python -m benchmarks.run --help
+"""
@@ -0,0 +1,67 @@
+import json
+import os
+import random
+
+STATUSES = ["pending", "in_progress", "completed", "declined"]
+
+def generate_store(directory: str, size: int, reserved: int, seed: int = 42):
+    """Write synthetic users.json, deals.json and redeem_codes.json into directory/data.
+
+    Every store gets `size` records. The first `reserved` deals of each
+    reserved block are laid out for the handler benchmarks:
+      OGESC-A<i>  pending, buyer user<i>   (approve)
+      OGESC-D<i>  pending                  (decline)
+      OGESC-C<i>  in_progress, buyer user<i> (confirm)
+      OGESC-E<i>  pending, buyer user<i>   (approve button)
+      OGESC-F<i>  in_progress, buyer user<i> (confirm button)
+      OGRDM-B<i>  unused redeem code       (redeem)
+    """
+    rng = random.Random(seed)
+    data_dir = os.path.join(directory, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    users = {}
+    for i in range(1, size + 1):
+        users[str(i)] = {
+            "id": i,
+            "username": f"user{i}",
+            "balance": 1_000_000.0,
+            "completed_deals": rng.randint(0, 50),
+            "pending_deals": 0,
+            "is_banned": False
+        }
+
+    deals = {}
+    def add_deal(deal_id: str, buyer: int, status: str):
+        price = float(rng.randint(100, 10_000))
+        deals[deal_id] = {
+            "id": deal_id,
+            "seller_id": rng.randint(1, size),
+            "buyer_username": f"user{buyer}",
+            "product_name": f"Product {deal_id}",
+            "product_description": f"Synthetic product number {deal_id}",
+            "price": price,
+            "fee": price * 0.03,
+            "status": status,
+            "product_delivered": False
+        }
+
+    for i in range(1, reserved + 1):
+        buyer = (i - 1) % size + 1
+        add_deal(f"OGESC-A{i}", buyer, "pending")
+        add_deal(f"OGESC-D{i}", buyer, "pending")
+        add_deal(f"OGESC-C{i}", buyer, "in_progress")
+        add_deal(f"OGESC-E{i}", buyer, "pending")
+        add_deal(f"OGESC-F{i}", buyer, "in_progress")
+    for i in range(max(0, size - len(deals))):
+        add_deal(f"OGESC-S{i}", rng.randint(1, size), rng.choice(STATUSES))
+
+    codes = {}
+    for i in range(1, reserved + 1):
+        codes[f"OGRDM-B{i}"] = {"amount": 100.0, "used": False, "created_by": 1, "used_by": None}
+    for i in range(max(0, size - len(codes))):
+        codes[f"OGRDM-S{i}"] = {"amount": 100.0, "used": True, "created_by": 1, "used_by": 1}
+
+    for name, data in (("users.json", users), ("deals.json", deals), ("redeem_codes.json", codes)):
+        with open(os.path.join(data_dir, name), 'w') as f:
+            json.dump(data, f, indent=4)
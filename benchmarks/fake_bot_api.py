@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from utils.http_server import HTTPServer, Request, Response
+
+class FakeBotAPI:
+    """Local stand-in for the Telegram Bot API used by the load tests.
+
+    Serves getUpdates from an in-memory queue filled with push_update(),
+    and answers sendMessage, editMessageText, copyMessage, getChatMember,
+    answerCallbackQuery and the startup calls. Every message the bot sends
+    is recorded per chat so a driver can wait for the replies it expects.
+    Point the bot at it with BOT_API_BASE_URL=<base_url>.
+    """
+
+    def __init__(self, token: str, host: str = "127.0.0.1", port: int = 0):
+        self.token = token
+        self.server = HTTPServer(host, port)
+        self.server.fallback(self._handle)
+        self.bot_user = {"id": int(token.split(":")[0]), "is_bot": True,
+                         "first_name": "Escrow", "username": "escrow_test_bot"}
+        self.calls = Counter()
+        self.polling = asyncio.Event()
+        self._updates: List[dict] = []
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._outbox: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    def push_update(self, update: dict) -> int:
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def next_event(self, chat_id: int, timeout: float) -> dict:
+        """Wait for the next call the bot made towards chat_id"""
+        return await asyncio.wait_for(self._outbox[chat_id].get(), timeout)
+
+    @staticmethod
+    def _params(request: Request) -> dict:
+        if not request.body:
+            return dict(request.query)
+        if request.headers.get("content-type", "").startswith("application/json"):
+            return json.loads(request.body)
+        # python-telegram-bot posts form fields whose values are JSON-encoded
+        params = {}
+        for key, values in parse_qs(request.body.decode()).items():
+            try:
+                params[key] = json.loads(values[-1])
+            except ValueError:
+                params[key] = values[-1]
+        return params
+
+    def _message(self, chat_id: int, text: Optional[str] = None) -> dict:
+        message = {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.bot_user
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    async def _handle(self, request: Request) -> Response:
+        prefix = f"/bot{self.token}/"
+        if not request.path.startswith(prefix):
+            return Response(404, b'{"ok":false,"error_code":404,"description":"Not Found"}')
+        method = request.path[len(prefix):]
+        params = self._params(request)
+        self.calls[method] += 1
+
+        handler = getattr(self, f"_api_{method}", None)
+        result = await handler(params) if handler else True
+        body = json.dumps({"ok": True, "result": result}).encode()
+        return Response(200, body, "application/json")
+
+    async def _api_getMe(self, params: dict):
+        return self.bot_user
+
+    async def _api_getUpdates(self, params: dict):
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _record(self, method: str, chat_id, params: dict):
+        self._outbox[int(chat_id)].put_nowait({"method": method, "time": time.perf_counter(), **params})
+
+    async def _api_sendMessage(self, params: dict):
+        self._record("sendMessage", params["chat_id"], params)
+        return self._message(int(params["chat_id"]), params.get("text"))
+
+    async def _api_editMessageText(self, params: dict):
+        self._record("editMessageText", params["chat_id"], params)
+        return self._message(int(params["chat_id"]), params.get("text"))
+
+    async def _api_copyMessage(self, params: dict):
+        self._record("copyMessage", params["chat_id"], params)
+        return {"message_id": self.next_message_id()}
+
+    async def _api_getChatMember(self, params: dict):
+        return {
+            "status": "member",
+            "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "User"}
+        }
@@ -0,0 +1,226 @@
+"""
+End-to-end load test: runs the real bot.py against a local fake Bot API.
+
+    python -m benchmarks.loadtest --flows 2000 --rate 50 --output load.json
+
+Each flow is one seller and one buyer walking through
+start -> escrow -> find_deal -> approve -> deliver -> confirm. Flows are
+started at --rate per second. Every step waits for the bot's reply, and
+its latency is measured from when the update was queued until the
+reply reached the fake API. The report holds throughput, per-step
+latency percentiles, error counts and Bot API call counts.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+TOKEN = "123456:LOADTEST"
+FIRST_USER_ID = 10_000_000
+
+class FlowError(Exception):
+    pass
+
+class Driver:
+    def __init__(self, api: FakeBotAPI, timeout: float):
+        self.api = api
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = Counter()
+        self.completed = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load{user_id}"}
+
+    def send_text(self, user_id: int, text: str):
+        message = {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        self.api.push_update({"message": message})
+
+    def press_button(self, user_id: int, data: str):
+        self.api.push_update({"callback_query": {
+            "id": str(self.api.next_message_id()),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": self.api.next_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self.api.bot_user,
+                "text": "button"
+            }
+        }})
+
+    async def expect(self, step: str, chat_id: int, started: float,
+                     match: Callable[[dict], bool]) -> dict:
+        """Wait for a bot call to chat_id that satisfies match, recording latency"""
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise FlowError(f"{step}: timed out")
+            try:
+                event = await self.api.next_event(chat_id, remaining)
+            except asyncio.TimeoutError:
+                raise FlowError(f"{step}: timed out")
+            if match(event):
+                self.latencies[step].append(event["time"] - started)
+                return event
+
+    async def step(self, step: str, user_id: int, wait_chat: int, text: Optional[str] = None,
+                   button: Optional[str] = None, contains: str = "") -> dict:
+        """Send a message or press a button, then wait for a reply containing `contains`"""
+        started = time.perf_counter()
+        if button:
+            self.press_button(user_id, button)
+        else:
+            self.send_text(user_id, text)
+        return await self.expect(step, wait_chat, started, lambda event: contains in (event.get("text") or ""))
+
+    async def flow(self, seller: int, buyer: int):
+        try:
+            await self.step("start_seller", seller, seller, "/start", contains="Welcome")
+            await self.step("start_buyer", buyer, buyer, "/start", contains="Welcome")
+            await self.step("escrow", seller, seller, "/escrow", contains="product name")
+            await self.step("product_name", seller, seller, "Load test item", contains="description")
+            await self.step("product_description", seller, seller, "Synthetic", contains="price")
+            await self.step("product_price", seller, seller, "500", contains="username")
+            created = await self.step("buyer_username", seller, seller, f"load{buyer}", contains="Deal ID")
+            deal_id = re.search(r"Deal ID: (\S+)", created["text"]).group(1)
+            await self.step("find_deal", buyer, buyer, f"/find_deal {deal_id}", contains="Deal Details")
+            await self.step("approve", buyer, seller, button=f"approve_{deal_id}", contains="approved the deal")
+            await self.step("send_product", seller, seller, button=f"send_product_{deal_id}",
+                            contains="send the product")
+            await self.step("deliver", seller, seller, "Here is the product", contains="delivered")
+            await self.step("confirm", buyer, seller, button=f"confirm_{deal_id}", contains="completed")
+            self.completed += 1
+        except FlowError as e:
+            self.errors[str(e)] += 1
+
+def seed_store(workdir: str, flows: int):
+    """Create the users up front with enough balance for every purchase"""
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    users = {}
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + 2 * flows):
+        users[str(user_id)] = {
+            "id": user_id, "username": f"load{user_id}", "balance": 1_000_000.0,
+            "completed_deals": 0, "pending_deals": 0, "is_banned": False
+        }
+    for name, data in (("users.json", users), ("deals.json", {}), ("redeem_codes.json", {})):
+        with open(os.path.join(data_dir, name), 'w') as f:
+            json.dump(data, f)
+
+def percentiles(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    def at(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"count": len(ordered), "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+async def wait_for_startup(api: FakeBotAPI, bot, log_path: str, timeout: float):
+    """Wait until the bot polls for updates; fail with its output if it exits first"""
+    polling = asyncio.create_task(api.polling.wait())
+    exited = asyncio.create_task(bot.wait())
+    done, _ = await asyncio.wait({polling, exited}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    polling.cancel()
+    exited.cancel()
+    if polling in done:
+        return
+    with open(log_path) as f:
+        output = f.read()[-4000:]
+    if exited in done:
+        raise RuntimeError(f"bot.py exited with code {bot.returncode} before polling:\n{output}")
+    raise RuntimeError(f"bot.py did not start polling within {timeout} s:\n{output}")
+
+async def run(args) -> dict:
+    api = FakeBotAPI(TOKEN)
+    await api.start()
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="escrow-load-")
+    seed_store(workdir, args.flows)
+    env = dict(os.environ, BOT_TOKEN=TOKEN, BOT_API_BASE_URL=api.base_url,
+               PYTHONPATH=os.pathsep.join(filter(None, (repo_dir, os.environ.get("PYTHONPATH")))),
+               DELIVERY_MODE="polling")
+    log_path = os.path.join(workdir, "bot.log")
+    log = open(log_path, 'w')
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(repo_dir, "bot.py"), cwd=workdir, env=env,
+        stdout=log, stderr=asyncio.subprocess.STDOUT
+    )
+
+    try:
+        await wait_for_startup(api, bot, log_path, args.startup_timeout)
+        driver = Driver(api, args.timeout)
+        started = time.perf_counter()
+        tasks = []
+        for i in range(args.flows):
+            seller = FIRST_USER_ID + 2 * i
+            tasks.append(asyncio.create_task(driver.flow(seller, seller + 1)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot.wait(), 30)
+            except asyncio.TimeoutError:
+                bot.kill()
+        log.close()
+        await api.stop()
+        if args.keep:
+            print(f"Bot data and log kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "flows": args.flows,
+        "rate": args.rate,
+        "completed": driver.completed,
+        "elapsed_s": round(elapsed, 2),
+        "flows_per_s": round(driver.completed / elapsed, 2),
+        "errors": dict(driver.errors),
+        "api_calls": dict(api.calls),
+        "steps": {step: percentiles(samples) for step, samples in driver.latencies.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test bot.py against a fake Bot API")
+    parser.add_argument("--flows", type=int, default=500, help="number of buyer/seller pairs")
+    parser.add_argument("--rate", type=float, default=20.0, help="flows started per second")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for each reply")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the bot's data directory and log")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+Microbenchmarks for the Database layer and the handler hot paths.
+
+    python -m benchmarks.run --sizes 1000,100000,1000000 --backend json \\
+        --output results.json --baseline previous.json --max-regression 0.25
+
+Each size gets a freshly generated store in a temporary directory. Every
+case is timed for --iterations runs (or until --max-seconds has passed)
+and reports p50/p99 latency plus the peak memory allocated by one extra
+traced run. Results are written as JSON; with --baseline the run exits
+with status 1 when any case's p50 got slower by more than --max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from benchmarks.datagen import generate_store
+from benchmarks.stubs import StubBot, make_context, make_update
+
+Case = Tuple[str, Callable[[int], Awaitable[None]]]
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_case(name: str, case: Callable[[int], Awaitable[None]],
+                   iterations: int, max_seconds: float) -> dict:
+    # One traced run for memory, kept apart so tracing does not skew timings
+    tracemalloc.start()
+    await case(iterations + 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    for i in range(1, iterations + 1):
+        started = time.perf_counter()
+        await case(i)
+        samples.append(time.perf_counter() - started)
+        if time.perf_counter() > deadline and len(samples) >= 5:
+            break
+
+    return {
+        "name": name,
+        "samples": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4),
+        "peak_kib": round(peak / 1024, 1)
+    }
+
+def database_cases(size: int, reserved: int, seed: int) -> List[Case]:
+    from config import USERS_FILE
+    from utils.database import Database
+
+    rng = random.Random(seed)
+    filler_deals = max(0, size - 5 * reserved)
+    filler_codes = max(0, size - reserved)
+    def user_id() -> int:
+        return rng.randint(1, size)
+    def deal_id() -> str:
+        if filler_deals:
+            return f"OGESC-S{rng.randrange(filler_deals)}"
+        return f"OGESC-A{rng.randint(1, reserved)}"
+    def code() -> str:
+        if filler_codes:
+            return f"OGRDM-S{rng.randrange(filler_codes)}"
+        return f"OGRDM-B{rng.randint(1, reserved)}"
+
+    async def load_users(i):
+        Database.invalidate(USERS_FILE)
+        Database.load_data(USERS_FILE)
+
+    async def get_user(i):
+        Database.get_user(user_id())
+
+    async def save_user(i):
+        uid = user_id()
+        record = Database.get_user(uid)
+        record["completed_deals"] += 1
+        Database.save_user(uid, record)
+
+    async def get_deal(i):
+        Database.get_deal(deal_id())
+
+    async def save_deal(i):
+        key = deal_id()
+        record = Database.get_deal(key)
+        Database.save_deal(key, record)
+
+    async def get_redeem_code(i):
+        Database.get_redeem_code(code())
+
+    async def save_redeem_code(i):
+        key = code()
+        Database.save_redeem_code(key, Database.get_redeem_code(key))
+
+    async def find_user_id(i):
+        Database.find_user_id(f"USER{user_id()}")
+
+    async def get_stats(i):
+        Database.get_stats()
+
+    return [
+        ("Database.load_data[users]", load_users),
+        ("Database.get_user", get_user),
+        ("Database.save_user", save_user),
+        ("Database.get_deal", get_deal),
+        ("Database.save_deal", save_deal),
+        ("Database.get_redeem_code", get_redeem_code),
+        ("Database.save_redeem_code", save_redeem_code),
+        ("Database.find_user_id", find_user_id),
+        ("Database.get_stats", get_stats),
+    ]
+
+def handler_cases(size: int) -> List[Case]:
+    from types import SimpleNamespace
+    from config import ADMIN_IDS
+    from importlib import import_module
+    # handlers re-exports functions named start and wallet, which shadow the
+    # submodules as package attributes, so fetch the modules themselves
+    admin, escrow, start, wallet = (
+        import_module(f"handlers.{name}") for name in ("admin", "escrow", "start", "wallet")
+    )
+
+    bot = StubBot()
+    admin_id = ADMIN_IDS[0]
+    def buyer(i: int) -> int:
+        return (i - 1) % size + 1
+
+    def command(handler, user_id: int, args: List[str]):
+        async def run():
+            await handler(make_update(user_id, f"user{user_id}"), make_context(bot, args))
+        return run
+
+    def button(handler, user_id: int, data: str):
+        async def run():
+            await handler(make_update(user_id, f"user{user_id}", callback_data=data), make_context(bot))
+        return run
+
+    async def buyer_username(i):
+        context = make_context(bot)
+        context.user_data.update(product_name="Bench", product_description="Bench deal", price=500.0)
+        await escrow.buyer_username(make_update(buyer(i), f"user{buyer(i)}", f"user{buyer(i + 1)}"), context)
+
+    async def process_product_delivery(i):
+        context = make_context(bot)
+        context.user_data["awaiting_product"] = f"OGESC-C{i}"
+        await escrow.process_product_delivery(make_update(1, "user1", "the product"), context)
+
+    async def search_page(i):
+        context = make_context(bot, ["product", "status:pending"])
+        await admin.admin_search_deals(make_update(admin_id, "admin"), context)
+        update = make_update(admin_id, "admin", callback_data="searchdeals_10")
+        await admin.handle_search_page(update, context)
+
+    # Each import credits ten users one unit
+    rows = "\n".join(f"user{buyer(j)},1" for j in range(1, 11)).encode()
+    bot.files["bench.csv"] = rows
+    async def import_balances(i):
+        update = make_update(admin_id, "admin")
+        update.message.document = SimpleNamespace(file_id="bench.csv", file_size=len(rows))
+        await admin.admin_import_balances(update, make_context(bot))
+
+    def case(factory):
+        async def run(i):
+            await factory(i)()
+        return run
+
+    return [
+        ("start.start", case(lambda i: command(start.start, buyer(i), []))),
+        ("start.check_join_callback", case(lambda i: button(start.check_join_callback, buyer(i), "check_join"))),
+        ("wallet.wallet", case(lambda i: command(wallet.wallet, buyer(i), []))),
+        ("wallet.redeem", case(lambda i: command(wallet.redeem, buyer(i), [f"OGRDM-B{i}"]))),
+        ("wallet.history", case(lambda i: command(wallet.history, buyer(i), []))),
+        ("wallet.handle_history_page",
+         case(lambda i: button(wallet.handle_history_page, buyer(i), "history_o_1000000"))),
+        ("escrow.buyer_username", buyer_username),
+        ("escrow.find_deal", case(lambda i: command(escrow.find_deal, buyer(i), [f"OGESC-A{i}"]))),
+        ("escrow.my_deals", case(lambda i: command(escrow.my_deals, buyer(i), []))),
+        ("escrow.handle_my_deals_page",
+         case(lambda i: button(escrow.handle_my_deals_page, buyer(i), "mydeals_0"))),
+        ("escrow.approve_deal_command",
+         case(lambda i: command(escrow.approve_deal_command, buyer(i), [f"OGESC-A{i}"]))),
+        ("escrow.handle_deal_response[approve]",
+         case(lambda i: button(escrow.handle_deal_response, buyer(i), f"approve_OGESC-E{i}"))),
+        ("escrow.decline_deal_command",
+         case(lambda i: command(escrow.decline_deal_command, buyer(i), [f"OGESC-D{i}"]))),
+        ("escrow.process_product_delivery", process_product_delivery),
+        ("escrow.confirm_deal_command",
+         case(lambda i: command(escrow.confirm_deal_command, buyer(i), [f"OGESC-C{i}"]))),
+        ("escrow.handle_confirmation",
+         case(lambda i: button(escrow.handle_confirmation, buyer(i), f"confirm_OGESC-F{i}"))),
+        ("admin.admin_stats", case(lambda i: command(admin.admin_stats, admin_id, []))),
+        ("admin.admin_ban", case(lambda i: command(admin.admin_ban, admin_id, [f"user{buyer(i)}"]))),
+        ("admin.admin_unban", case(lambda i: command(admin.admin_unban, admin_id, [f"user{buyer(i)}"]))),
+        ("admin.admin_add_balance",
+         case(lambda i: command(admin.admin_add_balance, admin_id, [f"user{buyer(i)}", "10"]))),
+        ("admin.admin_remove_balance",
+         case(lambda i: command(admin.admin_remove_balance, admin_id, [f"user{buyer(i)}", "10"]))),
+        ("admin.admin_generateredeem", case(lambda i: command(admin.admin_generateredeem, admin_id, ["100"]))),
+        ("admin.admin_generateredeem[1000]",
+         case(lambda i: command(admin.admin_generateredeem, admin_id, ["100", "1000"]))),
+        ("admin.admin_import_balances[10]", import_balances),
+        ("admin.admin_search_deals+page", search_page),
+    ]
+
+def reset_database():
+    from utils.database import Database
+    Database.invalidate()
+    Database._sqlite = None
+    Database._journals.clear()
+
+async def run_size(size: int, args) -> List[dict]:
+    from utils.database import Database
+    reset_database()
+    if Database._sql():
+        from utils.sqlite_store import migrate_from_json
+        migrate_from_json(Database._sql())
+
+    cases = database_cases(size, args.iterations + 1, args.seed)
+    try:
+        cases += handler_cases(size)
+    except ImportError as e:
+        print(f"Skipping handler benchmarks: {e}", file=sys.stderr)
+
+    results = []
+    for name, case in cases:
+        result = await run_case(name, case, args.iterations, args.max_seconds)
+        result["size"] = size
+        results.append(result)
+        print(f"{size:>9} {name:<34} p50 {result['p50_ms']:>10.3f} ms  "
+              f"p99 {result['p99_ms']:>10.3f} ms  peak {result['peak_kib']:>10.1f} KiB",
+              file=sys.stderr)
+    return results
+
+def compare(results: List[dict], baseline: dict, max_regression: float,
+            min_delta_ms: float) -> List[str]:
+    previous: Dict[Tuple[str, int], dict] = {
+        (r["name"], r["size"]): r for r in baseline.get("results", [])
+    }
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["size"]))
+        if (old and result["p50_ms"] > old["p50_ms"] * (1 + max_regression)
+                and result["p50_ms"] - old["p50_ms"] > min_delta_ms):
+            regressions.append(
+                f"{result['name']} @ {result['size']}: p50 {old['p50_ms']} ms -> {result['p50_ms']} ms"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Database layer and handlers")
+    parser.add_argument("--sizes", default="1000,100000,1000000",
+                        help="comma-separated record counts per store")
+    parser.add_argument("--backend", choices=["json", "journal", "sqlite"], default="json")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--max-seconds", type=float, default=10.0,
+                        help="time budget per case; at least 5 samples are always taken")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="previous --output file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed p50 slowdown against the baseline, as a fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="ignore p50 slowdowns smaller than this, to filter timer noise")
+    args = parser.parse_args()
+
+    # config reads these when first imported, which happens below
+    os.environ["STORAGE_BACKEND"] = "sqlite" if args.backend == "sqlite" else "json"
+    os.environ["JOURNAL_MODE"] = "1" if args.backend == "journal" else "0"
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    repo_dir = os.getcwd()
+    sys.path.insert(0, repo_dir)
+    results = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"escrow-bench-{size}-")
+        try:
+            generate_store(workdir, size, reserved=args.iterations + 1, seed=args.seed)
+            # Data paths in config are relative, so the store is picked up from here
+            os.chdir(workdir)
+            results += asyncio.run(run_size(size, args))
+        finally:
+            os.chdir(repo_dir)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.max_regression, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+class StubMessage:
+    """Stands in for telegram.Message; replies are recorded, not sent"""
+
+    def __init__(self, chat_id: int, text: str = ""):
+        self.chat_id = chat_id
+        self.text = text
+        self.message_id = 1
+        self.document = None
+        self.reply_to_message = None
+        self.replies: List[str] = []
+        self.reply_markup = None  # markup of the latest reply or edit
+
+    async def reply_text(self, text: str, **kwargs):
+        self.replies.append(text)
+        self.reply_markup = kwargs.get("reply_markup")
+        return StubMessage(self.chat_id)
+
+    async def reply_document(self, document=None, **kwargs):
+        self.replies.append(kwargs.get("caption", ""))
+        return StubMessage(self.chat_id)
+
+    async def copy(self, chat_id: int, **kwargs):
+        return SimpleNamespace(message_id=1)
+
+class StubFile:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    async def download_as_bytearray(self):
+        return bytearray(self.content)
+
+class StubBot:
+    """Answers every Bot API call the handlers make without any network I/O"""
+
+    def __init__(self):
+        self.calls = 0
+        # file_id -> contents returned by get_file()
+        self.files: Dict[str, bytes] = {}
+
+    async def send_message(self, chat_id=None, text=None, **kwargs):
+        self.calls += 1
+        return StubMessage(chat_id)
+
+    async def edit_message_text(self, text=None, **kwargs):
+        self.calls += 1
+        return True
+
+    async def send_document(self, chat_id=None, document=None, **kwargs):
+        self.calls += 1
+        return StubMessage(chat_id)
+
+    async def get_file(self, file_id=None, **kwargs):
+        self.calls += 1
+        return StubFile(self.files[file_id])
+
+    async def get_chat_member(self, chat_id=None, user_id=None, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(status="member")
+
+class StubCallbackQuery:
+    def __init__(self, data: str, chat_id: int):
+        self.data = data
+        self.message = StubMessage(chat_id)
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text: str, **kwargs):
+        self.message.replies.append(text)
+        self.message.reply_markup = kwargs.get("reply_markup")
+        return True
+
+def make_update(user_id: int, username: str, text: str = "", callback_data: Optional[str] = None):
+    return SimpleNamespace(
+        update_id=1,
+        effective_user=SimpleNamespace(id=user_id, username=username),
+        effective_chat=SimpleNamespace(id=user_id),
+        message=StubMessage(user_id, text),
+        callback_query=StubCallbackQuery(callback_data, user_id) if callback_data else None
+    )
+
+def make_context(bot: StubBot, args: Optional[List[str]] = None):
+    return SimpleNamespace(args=args or [], bot=bot, user_data={}, chat_data={}, application=None)
@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import os
+import signal
 import pytz
 from telegram import Update
 from telegram.ext import (
@@ -9,18 +12,39 @@ from telegram.ext import (
     ConversationHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters
 )
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, BOT_API_BASE_URL, JOURNAL_MODE, JOURNAL_COMPACT_INTERVAL, MAX_CONCURRENT_UPDATES,
+    ARCHIVE_INTERVAL, DEADLINE_SWEEP_INTERVAL,
+    DELIVERY_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+    WEBHOOK_SECRET, WEBHOOK_MAX_QUEUE, PERSISTENCE_FILE, METRICS_LISTEN, METRICS_PORT,
+    STORAGE_BACKEND, WORKERS, WORKER_INDEX
+)
 from handlers import (
-    start, help_command, wallet, redeem,
+    start, help_command, wallet, redeem, history, handle_history_page,
     start_escrow, product_name, product_description, product_price, buyer_username,
-    find_deal, approve_deal_command, decline_deal_command, confirm_deal_command,
+    find_deal, my_deals, handle_my_deals_page, approve_deal_command, decline_deal_command, confirm_deal_command,
     report_deal_command, admin_stats, admin_ban, admin_unban, admin_add_balance,
     admin_remove_balance, admin_generateredeem, admin_broadcast,
-    admin_add_channel, admin_remove_channel, id_command, admin_commands,
+    admin_add_channel, admin_remove_channel, admin_profile, admin_import_balances,
+    admin_search_deals, handle_search_page, admin_commands,
     PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, BUYER_USERNAME
 )
+from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.ledger import Ledger
+from utils.locks import locks
+from utils.update_processor import PerUserUpdateProcessor
+from utils.broadcast import Broadcast
+from utils.webhook import WebhookReceiver
+from utils.persistence import SQLitePersistence
+from utils.archive import Archive
+from utils.deadlines import DealDeadlines
+from utils.outbox import outbox
+from utils.instrumentation import InstrumentedRequest, MetricsServer, instrument_handlers
+from utils.supervisor import Supervisor
 
 # Enable logging
 logging.basicConfig(
@@ -29,25 +53,129 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
-    """Start the bot."""
-    # Create JobQueue with timezone
-    job_queue = JobQueue()
-    job_queue.scheduler.timezone = pytz.timezone('Asia/Kolkata')
+metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT) if METRICS_PORT else None
 
-    # Create the Application
-    application = (
-        Application.builder()
-        .token(BOT_TOKEN)
-        .job_queue(job_queue)
-        .build()
+# Work that must run once per deployment, not once per worker process
+PRIMARY = WORKER_INDEX in (None, 0)
+
+async def compact_journals(context: ContextTypes.DEFAULT_TYPE):
+    """Fold the storage journals into fresh snapshot files"""
+    await asyncio.to_thread(Database.compact)
+
+async def archive_deals(context: ContextTypes.DEFAULT_TYPE):
+    """Move finished deals to the compressed archive"""
+    moved = await Archive.run()
+    if moved:
+        logger.info("Archived %d deals", moved)
+
+async def sweep_deadlines(context: ContextTypes.DEFAULT_TYPE):
+    """Expire and refund deals whose deadline has passed"""
+    from handlers.escrow import notify_deadline
+    changed = await DealDeadlines.sweep(notify_deadline)
+    if changed:
+        logger.info("Expired or refunded %d deals", changed)
+
+def _repair_balance(user_id: int) -> bool:
+    user_data = Database.get_user(user_id)
+    if not user_data or not Ledger.repair(user_id, user_data):
+        return False
+    Database.save_user(user_id, user_data)
+    return True
+
+async def reconcile_balances():
+    """Apply ledger entries whose user record was never saved, e.g. after a crash"""
+    users, last_seq = await AsyncDatabase.run(Ledger.unreconciled)
+    repaired = []
+    for user_id in users:
+        # Under the user's lock a save still in flight elsewhere has landed
+        async with locks.hold(f"user:{user_id}"):
+            if await AsyncDatabase.run(_repair_balance, user_id):
+                repaired.append(user_id)
+    await AsyncDatabase.run(Ledger.mark_reconciled, last_seq)
+    if repaired:
+        logger.warning("Restored balances of %d users from the ledger: %s", len(repaired), repaired[:20])
+
+async def post_init(application: Application):
+    """Resume background work interrupted by the last restart"""
+    await reconcile_balances()
+    if metrics_server:
+        await metrics_server.start()
+        logger.info("Serving metrics on http://%s:%s/metrics", METRICS_LISTEN, METRICS_PORT)
+    outbox.start(application.bot)
+    if PRIMARY:
+        Broadcast.resume(application)
+
+async def post_stop(application: Application):
+    """Send queued notifications while the bot can still reach Telegram"""
+    await outbox.stop()
+
+async def shutdown(application: Application):
+    """Flush storage before the process exits"""
+    if Broadcast.active:
+        await Broadcast.active.stop()
+    AsyncDatabase.shutdown()
+    if JOURNAL_MODE:
+        Database.compact()
+    if metrics_server:
+        await metrics_server.stop()
+
+async def watch_supervisor(stop_event: asyncio.Event):
+    """Stop a worker whose supervisor has gone away"""
+    supervisor_pid = os.getppid()
+    while not stop_event.is_set():
+        if os.getppid() != supervisor_pid:
+            logger.warning("Supervisor exited; stopping worker %s", WORKER_INDEX)
+            stop_event.set()
+        await asyncio.sleep(5)
+
+async def serve_webhook(application: Application):
+    """Run the bot on the built-in webhook receiver until SIGINT or SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    if WORKER_INDEX is not None:
+        asyncio.create_task(watch_supervisor(stop_event))
+
+    receiver = WebhookReceiver(
+        application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET, max_queue=WEBHOOK_MAX_QUEUE
     )
 
+    # run_polling/run_webhook normally drive this lifecycle and the hooks
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    await receiver.start()
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True
+        )
+
+    try:
+        await stop_event.wait()
+    finally:
+        await receiver.stop()
+        await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await shutdown(application)
+
+def add_handlers(application: Application):
+    """Register every command, conversation and callback handler"""
+    # Keep stored usernames current before any other handler runs
+    from handlers.start import track_username
+    application.add_handler(TypeHandler(Update, track_username), group=-1)
+
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("wallet", wallet))
     application.add_handler(CommandHandler("redeem", redeem))
+    application.add_handler(CommandHandler("history", history))
     
     # Escrow conversation handler
     escrow_conv_handler = ConversationHandler(
@@ -59,16 +187,18 @@ def main():
             BUYER_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, buyer_username)],
         },
         fallbacks=[CommandHandler("cancel", lambda u, c: ConversationHandler.END)],
+        name="escrow",
+        persistent=True,
     )
     application.add_handler(escrow_conv_handler)
     
     # Deal management commands
     application.add_handler(CommandHandler("find_deal", find_deal))
+    application.add_handler(CommandHandler("my_deals", my_deals))
     application.add_handler(CommandHandler("approve_deal", approve_deal_command))
     application.add_handler(CommandHandler("decline_deal", decline_deal_command))
     application.add_handler(CommandHandler("confirm_deal", confirm_deal_command))
     application.add_handler(CommandHandler("report_deal", report_deal_command))
-    application.add_handler(CommandHandler("id", id_command))
 
     # Admin commands
     application.add_handler(CommandHandler("admin_stats", admin_stats))
@@ -80,6 +210,9 @@ def main():
     application.add_handler(CommandHandler("admin_broadcast", admin_broadcast))
     application.add_handler(CommandHandler("adminaddchannel", admin_add_channel))
     application.add_handler(CommandHandler("adminremovechannel", admin_remove_channel))
+    application.add_handler(CommandHandler("admin_profile", admin_profile))
+    application.add_handler(CommandHandler("admin_import_balances", admin_import_balances))
+    application.add_handler(CommandHandler("search_deals", admin_search_deals))
     application.add_handler(CommandHandler("og", admin_commands))
 
     # Callback handlers
@@ -87,7 +220,18 @@ def main():
     application.add_handler(CallbackQueryHandler(handle_deal_response, pattern=r"^approve_|^decline_"))
     application.add_handler(CallbackQueryHandler(handle_product_delivery, pattern=r"^send_product_"))
     application.add_handler(CallbackQueryHandler(handle_confirmation, pattern=r"^confirm_|^report_"))
+    application.add_handler(CallbackQueryHandler(handle_history_page, pattern=r"^history_[on]_\d+$"))
+    application.add_handler(CallbackQueryHandler(
+        handle_my_deals_page, pattern=r"^mydeals_\d+(_(before|after)_(seller|buyer)_.+)?$"
+    ))
+    application.add_handler(CallbackQueryHandler(handle_search_page, pattern=r"^searchdeals_\d+$"))
     
+    # CSV uploads captioned /admin_import_balances; must come before the media handler
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/admin_import_balances"),
+        admin_import_balances
+    ))
+
     # Fixed media handler with correct filters
     application.add_handler(MessageHandler(
         (filters.TEXT & ~filters.COMMAND) |
@@ -98,8 +242,61 @@ def main():
         process_product_delivery
     ))
 
+def main():
+    """Start the bot."""
+    if WORKERS > 1 and WORKER_INDEX is None:
+        if STORAGE_BACKEND != "sqlite":
+            raise SystemExit("WORKERS > 1 needs STORAGE_BACKEND=sqlite so the workers share one store")
+        print(f"Bot is starting with {WORKERS} workers...")
+        asyncio.run(Supervisor(WORKERS).run())
+        return
+
+    # Create JobQueue with timezone
+    job_queue = JobQueue()
+    job_queue.scheduler.timezone = pytz.timezone('Asia/Kolkata')
+
+    # Create the Application
+    builder = Application.builder()
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    application = (
+        builder
+        .token(BOT_TOKEN)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+        .job_queue(job_queue)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence(PERSISTENCE_FILE))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(shutdown)
+        .build()
+    )
+
+    if JOURNAL_MODE:
+        application.job_queue.run_repeating(
+            compact_journals,
+            interval=JOURNAL_COMPACT_INTERVAL,
+            first=JOURNAL_COMPACT_INTERVAL
+        )
+
+    if PRIMARY:
+        application.job_queue.run_repeating(archive_deals, interval=ARCHIVE_INTERVAL, first=60)
+        application.job_queue.run_repeating(
+            sweep_deadlines, interval=DEADLINE_SWEEP_INTERVAL, first=DEADLINE_SWEEP_INTERVAL
+        )
+
+    add_handlers(application)
+
+    # Record latency for every handler registered above
+    instrument_handlers(application)
+
     # Start the bot
     print("Bot is starting...")
+    if DELIVERY_MODE == "webhook":
+        asyncio.run(serve_webhook(application))
+        return
+
     application.run_polling(
         allowed_updates=Update.ALL_TYPES,
         drop_pending_updates=True,
@@ -1,11 +1,56 @@
 import os
+import secrets
 
 # Bot Configuration
 BOT_TOKEN = os.environ.get('BOT_TOKEN')  # Will be provided via secrets
+# Alternative Bot API server, e.g. a local one for load tests ("http://127.0.0.1:8081/bot")
+BOT_API_BASE_URL = os.environ.get('BOT_API_BASE_URL')
 ADMIN_IDS = [6459253633]  # Admin user ID
 
 # Channel Configuration
 REQUIRED_CHANNELS = ["@TMOG9"]  # Channel that users must join
+MEMBERSHIP_CACHE_TTL = 300  # seconds a positive membership check is reused
+MEMBERSHIP_NEGATIVE_TTL = 10  # seconds a failed check is reused
+
+# Update delivery: "polling" (default) or "webhook". In webhook mode updates
+# arrive on a local HTTP endpoint; put a TLS proxy or load balancer in front
+# of it and set WEBHOOK_URL to the public base URL to register it.
+DELIVERY_MODE = os.environ.get('DELIVERY_MODE', 'polling')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')  # leave unset to skip setWebhook
+# Every webhook request must carry this secret. When unset a random one is
+# generated per run and registered by setWebhook; set it to POST updates by hand.
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_MAX_QUEUE = 1000  # accepted updates not yet processed
+
+# Prometheus-style metrics served at http://METRICS_LISTEN:METRICS_PORT/metrics;
+# port 0 turns the endpoint off
+METRICS_LISTEN = os.environ.get('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+
+# Multiple worker processes: with WORKERS > 1, bot.py becomes a supervisor
+# that receives updates (DELIVERY_MODE as above) and forwards each one to
+# worker WORKER_BASE_PORT + n, chosen by user id. Requires the sqlite backend.
+# WORKER_INDEX is set by the supervisor for its workers; leave it unset.
+WORKERS = int(os.environ.get('WORKERS', '1'))
+WORKER_INDEX = int(os.environ['WORKER_INDEX']) if os.environ.get('WORKER_INDEX') else None
+WORKER_BASE_PORT = int(os.environ.get('WORKER_BASE_PORT', '8600'))
+WORKER_MAX_QUEUE = 1000  # updates waiting to be forwarded to one worker
+LOCK_FILE = "data/locks.bin"  # byte-range locks shared by the workers
+
+# Bulk admin operations
+REDEEM_BATCH_MAX = 10000  # codes per /admin_generateredeem
+IMPORT_MAX_BYTES = 1024 * 1024  # largest CSV accepted by /admin_import_balances
+
+# /admin_profile limits
+PROFILE_MAX_SECONDS = 120
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between CPU stack samples
+
+# Update processing: updates from different users run concurrently,
+# updates from the same user are still handled one at a time
+MAX_CONCURRENT_UPDATES = 64
 
 # Fee Configuration
 DEFAULT_FEE_PERCENTAGE = 3
@@ -18,6 +63,71 @@ REDEEM_CODE_PREFIX = "OGRDM-"
 USERS_FILE = "data/users.json"
 DEALS_FILE = "data/deals.json"
 REDEEM_CODES_FILE = "data/redeem_codes.json"
+STATS_FILE = "data/stats.json"
+
+# Storage backend: "json" keeps the files above, "sqlite" uses SQLITE_FILE
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+SQLITE_FILE = "data/escrow.db"
+
+# Journal mode for the JSON backend: saves append one line to <file>.journal
+# and a background job folds the journals into the files every interval
+JOURNAL_MODE = os.environ.get('JOURNAL_MODE', '0') == '1'
+JOURNAL_COMPACT_INTERVAL = 300  # seconds
+
+# Snapshot mode for the JSON backend: the files above are stored as binary
+# <file>.snap snapshots that are memory-mapped at startup and decoded one
+# record at a time. Convert with "python -m utils.snapshot export" (and back
+# to JSON with "import" before turning it off).
+SNAPSHOT_MODE = os.environ.get('SNAPSHOT_MODE', '0') == '1'
+# Rewriting a snapshot copies the whole file, so saves always go to the journal
+JOURNAL_MODE = JOURNAL_MODE or SNAPSHOT_MODE
+SNAPSHOT_LOOKUP_FIELDS = {USERS_FILE: "username"}  # field indexed for case-insensitive lookup
+
+# Deal archive: finished deals move out of the deals store into gzip files,
+# one per month, and stay reachable through /find_deal
+ARCHIVE_DIR = "data/archive"
+ARCHIVE_INDEX_FILE = "data/archive/index.tsv"
+ARCHIVE_SEARCH_FILE = "data/archive/search.db"  # full-text index for /search_deals
+ARCHIVE_STATUSES = ("completed", "declined", "expired", "refunded")
+ARCHIVE_INTERVAL = 3600  # seconds between archive runs
+ARCHIVE_GRACE = 86400  # seconds a finished deal stays in the deals store
+
+# Deal deadlines: pending deals nobody touches expire, approved deals the
+# seller never delivers are cancelled and refunded to the buyer
+DEAL_PENDING_TIMEOUT = 30 * 86400  # seconds since the deal was last saved
+DEAL_DELIVERY_TIMEOUT = 7 * 86400  # seconds since the buyer approved
+DEADLINE_SWEEP_INTERVAL = 60  # seconds between sweeps
+DEADLINE_SWEEP_BATCH = 500  # deals per storage pass
+DEADLINE_RESCAN_INTERVAL = 600  # with workers, reload deals other processes saved
+
+# Append-only ledger of balance changes, shown by /history
+LEDGER_FILE = "data/ledger.db"
+HISTORY_PAGE_SIZE = 10
+
+# Deals listed per page of /my_deals and /search_deals
+MY_DEALS_PAGE_SIZE = 10
+SEARCH_PAGE_SIZE = 10
+
+# Conversation and user_data persistence across restarts
+PERSISTENCE_FILE = "data/persistence.db"
+PERSISTENCE_INTERVAL = 10  # seconds between batched writes of changed entries
+
+# Broadcasts: the Bot API allows about 30 messages per second overall
+BROADCAST_RATE = 25  # messages per second
+BROADCAST_CONCURRENCY = 10
+BROADCAST_PROGRESS_INTERVAL = 5  # seconds between progress edits
+BROADCAST_CHECKPOINT_EVERY = 25  # messages sent between checkpoints
+BROADCAST_FILE = "data/broadcast.json"
+BROADCAST_PROGRESS_FILE = "data/broadcast_progress.json"
+
+# Outbound notifications to deal parties: at most one message per second to
+# a chat, and OUTBOX_RATE overall so that together with a broadcast the bot
+# stays under the Bot API's 30 messages per second. With WORKERS > 1 each
+# worker gets OUTBOX_RATE / WORKERS.
+OUTBOX_RATE = 5  # messages per second, across all workers
+OUTBOX_CHAT_INTERVAL = 1.0  # seconds between messages to the same chat
+OUTBOX_CONCURRENCY = 8
+OUTBOX_MAX_ATTEMPTS = 5
 
 # Ensure data directory exists
 os.makedirs("data", exist_ok=True)
\ No newline at end of file
@@ -6,15 +6,17 @@ Contains all the command and callback handlers for different bot functionalities
 from .start import start, check_join_callback
 from .escrow import (
     start_escrow, product_name, product_description, 
-    product_price, buyer_username, find_deal, handle_deal_response,
+    product_price, buyer_username, find_deal, my_deals, handle_my_deals_page, handle_deal_response,
     handle_product_delivery, process_product_delivery, handle_confirmation,
+    approve_deal_command, decline_deal_command, confirm_deal_command, report_deal_command,
     PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, BUYER_USERNAME
 )
-from .wallet import wallet, redeem
+from .wallet import wallet, redeem, history, handle_history_page
 from .admin import (
     admin_stats, admin_generateredeem, admin_ban, admin_unban,
     admin_add_balance, admin_remove_balance, admin_broadcast,
-    admin_add_channel, admin_remove_channel
+    admin_add_channel, admin_remove_channel, admin_profile, admin_import_balances,
+    admin_search_deals, handle_search_page
 )
 from .help import help_command, admin_commands
 
@@ -27,12 +29,20 @@ __all__ = [
     'product_price',
     'buyer_username',
     'find_deal',
+    'my_deals',
+    'handle_my_deals_page',
     'handle_deal_response',
     'handle_product_delivery',
     'process_product_delivery',
     'handle_confirmation',
+    'approve_deal_command',
+    'decline_deal_command',
+    'confirm_deal_command',
+    'report_deal_command',
     'wallet',
     'redeem',
+    'history',
+    'handle_history_page',
     'admin_stats',
     'admin_generateredeem',
     'admin_ban',
@@ -42,6 +52,10 @@ __all__ = [
     'admin_broadcast',
     'admin_add_channel',
     'admin_remove_channel',
+    'admin_profile',
+    'admin_import_balances',
+    'admin_search_deals',
+    'handle_search_page',
     'help_command',
     'admin_commands',
     'PRODUCT_NAME',
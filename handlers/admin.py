@@ -1,8 +1,20 @@
-from telegram import Update
+import csv
+import io
+import math
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler
 from utils.database import Database
-from utils.helpers import generate_unique_id, format_currency
-from config import ADMIN_IDS, REDEEM_CODE_PREFIX, REQUIRED_CHANNELS
+from utils.async_database import AsyncDatabase
+from utils.helpers import format_currency
+from utils.locks import locks
+from utils.broadcast import Broadcast
+from utils.profiler import Profiler
+from utils.ledger import Ledger
+from utils.search import DealSearch, parse_query, price_range
+from config import (
+    ADMIN_IDS, REDEEM_CODE_PREFIX, REQUIRED_CHANNELS, PROFILE_MAX_SECONDS,
+    PROFILE_SAMPLE_INTERVAL, REDEEM_BATCH_MAX, IMPORT_MAX_BYTES, SEARCH_PAGE_SIZE
+)
 
 async def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
@@ -14,20 +26,20 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔️ Unauthorized access.")
         return
 
-    users = Database.load_data("data/users.json")
-    deals = Database.load_data("data/deals.json")
-
-    total_users = len(users) - 1  # Excluding example_format
-    total_deals = len(deals) - 1  # Excluding example_format
-    completed_deals = len([d for d in deals.values() if d.get("status") == "completed"])
-    pending_deals = len([d for d in deals.values() if d.get("status") == "pending"])
+    stats = await AsyncDatabase.get_stats()
+    by_status = stats["deals_by_status"]
 
     await update.message.reply_text(
         f"📊 <b>Bot Statistics</b>\n\n"
-        f"Total Users: {total_users}\n"
-        f"Total Deals: {total_deals}\n"
-        f"Completed Deals: {completed_deals}\n"
-        f"Pending Deals: {pending_deals}",
+        f"Total Users: {stats['users']}\n"
+        f"Total Deals: {stats['deals']}\n"
+        f"Completed Deals: {by_status.get('completed', 0)}\n"
+        f"Pending Deals: {by_status.get('pending', 0)}\n"
+        f"In Progress Deals: {by_status.get('in_progress', 0)}\n"
+        f"Declined Deals: {by_status.get('declined', 0)}\n"
+        f"Expired Deals: {by_status.get('expired', 0)}\n"
+        f"Refunded Deals: {by_status.get('refunded', 0)}\n"
+        f"Funds in Escrow: {format_currency(stats['escrow_held'])}",
         parse_mode='HTML'
     )
 
@@ -42,21 +54,15 @@ async def admin_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     username = context.args[0].replace("@", "")
-    users = Database.load_data("data/users.json")
-
-    # Find user by username
-    user_id = None
-    for uid, data in users.items():
-        if data.get("username") == username:
-            user_id = uid
-            break
-
-    if not user_id or user_id == "example_format":
+    user_id = await AsyncDatabase.find_user_id(username)
+    if not user_id:
         await update.message.reply_text(f"User @{username} not found.")
         return
 
-    users[user_id]["is_banned"] = True
-    Database.save_data("data/users.json", users)
+    async with locks.hold(f"user:{user_id}"):
+        user_data = await AsyncDatabase.get_user(user_id)
+        user_data["is_banned"] = True
+        await AsyncDatabase.save_user(user_id, user_data)
     await update.message.reply_text(f"User @{username} has been banned.")
 
 async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -70,21 +76,15 @@ async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     username = context.args[0].replace("@", "")
-    users = Database.load_data("data/users.json")
-
-    # Find user by username
-    user_id = None
-    for uid, data in users.items():
-        if data.get("username") == username:
-            user_id = uid
-            break
-
-    if not user_id or user_id == "example_format":
+    user_id = await AsyncDatabase.find_user_id(username)
+    if not user_id:
         await update.message.reply_text(f"User @{username} not found.")
         return
 
-    users[user_id]["is_banned"] = False
-    Database.save_data("data/users.json", users)
+    async with locks.hold(f"user:{user_id}"):
+        user_data = await AsyncDatabase.get_user(user_id)
+        user_data["is_banned"] = False
+        await AsyncDatabase.save_user(user_id, user_data)
     await update.message.reply_text(f"User @{username} has been unbanned.")
 
 async def admin_add_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -106,24 +106,22 @@ async def admin_add_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please provide a valid positive amount.")
         return
 
-    users = Database.load_data("data/users.json")
-
-    # Find user by username
-    user_id = None
-    for uid, data in users.items():
-        if data.get("username") == username:
-            user_id = uid
-            break
-
-    if not user_id or user_id == "example_format":
+    user_id = await AsyncDatabase.find_user_id(username)
+    if not user_id:
         await update.message.reply_text(f"User @{username} not found.")
         return
 
-    users[user_id]["balance"] += amount
-    Database.save_data("data/users.json", users)
+    async with locks.hold(f"user:{user_id}"):
+        user_data = await AsyncDatabase.get_user(user_id)
+        user_data["balance"] += amount
+        def commit():
+            Ledger.record(user_id, user_data, amount, "admin_credit", str(update.effective_user.id))
+            Database.save_user(user_id, user_data)
+        await AsyncDatabase.run(commit)
+
     await update.message.reply_text(
         f"Added {format_currency(amount)} to @{username}'s balance.\n"
-        f"New balance: {format_currency(users[user_id]['balance'])}"
+        f"New balance: {format_currency(user_data['balance'])}"
     )
 
 async def admin_remove_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -145,28 +143,27 @@ async def admin_remove_balance(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Please provide a valid positive amount.")
         return
 
-    users = Database.load_data("data/users.json")
-
-    # Find user by username
-    user_id = None
-    for uid, data in users.items():
-        if data.get("username") == username:
-            user_id = uid
-            break
-
-    if not user_id or user_id == "example_format":
+    user_id = await AsyncDatabase.find_user_id(username)
+    if not user_id:
         await update.message.reply_text(f"User @{username} not found.")
         return
 
-    if users[user_id]["balance"] < amount:
-        await update.message.reply_text(f"Insufficient balance for @{username}.")
-        return
+    async with locks.hold(f"user:{user_id}"):
+        user_data = await AsyncDatabase.get_user(user_id)
+
+        if user_data["balance"] < amount:
+            await update.message.reply_text(f"Insufficient balance for @{username}.")
+            return
+
+        user_data["balance"] -= amount
+        def commit():
+            Ledger.record(user_id, user_data, -amount, "admin_debit", str(update.effective_user.id))
+            Database.save_user(user_id, user_data)
+        await AsyncDatabase.run(commit)
 
-    users[user_id]["balance"] -= amount
-    Database.save_data("data/users.json", users)
     await update.message.reply_text(
         f"Removed {format_currency(amount)} from @{username}'s balance.\n"
-        f"New balance: {format_currency(users[user_id]['balance'])}"
+        f"New balance: {format_currency(user_data['balance'])}"
     )
 
 async def admin_generateredeem(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -175,8 +172,8 @@ async def admin_generateredeem(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("⛔️ Unauthorized access.")
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Usage: /admin_generateredeem amount")
+    if len(context.args) not in (1, 2):
+        await update.message.reply_text("Usage: /admin_generateredeem amount [count]")
         return
 
     try:
@@ -187,20 +184,38 @@ async def admin_generateredeem(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Please provide a valid positive amount.")
         return
 
-    code = generate_unique_id(REDEEM_CODE_PREFIX)
-    code_data = {
-        "amount": amount,
-        "used": False,
-        "created_by": update.effective_user.id,
-        "used_by": None
-    }
+    try:
+        count = int(context.args[1]) if len(context.args) == 2 else 1
+        if not 1 <= count <= REDEEM_BATCH_MAX:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text(f"Count must be between 1 and {REDEEM_BATCH_MAX}.")
+        return
 
-    Database.save_redeem_code(code, code_data)
-    await update.message.reply_text(
-        f"<b>🎁 Redeem Code Generated</b>\n\n"
-        f"Code: <code>{code}</code>\n"
-        f"Amount: {format_currency(amount)}",
-        parse_mode='HTML'
+    codes = await AsyncDatabase.allocate_ids(REDEEM_CODE_PREFIX, count)
+    await AsyncDatabase.save_redeem_codes({
+        code: {
+            "amount": amount,
+            "used": False,
+            "created_by": update.effective_user.id,
+            "used_by": None
+        }
+        for code in codes
+    })
+
+    if count == 1:
+        await update.message.reply_text(
+            f"<b>🎁 Redeem Code Generated</b>\n\n"
+            f"Code: <code>{codes[0]}</code>\n"
+            f"Amount: {format_currency(amount)}",
+            parse_mode='HTML'
+        )
+        return
+
+    await update.message.reply_document(
+        document=io.BytesIO("\n".join(codes).encode()),
+        filename=f"redeem_codes_{count}.txt",
+        caption=f"🎁 {count} redeem codes generated, {format_currency(amount)} each."
     )
 
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -213,24 +228,14 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /admin_broadcast message")
         return
 
-    message = " ".join(context.args)
-    users = Database.load_data("data/users.json")
-    sent_count = 0
-
-    for user_id, user_data in users.items():
-        if user_id == "example_format":
-            continue
-        try:
-            await context.bot.send_message(
-                chat_id=int(user_id),
-                text=f"📢 <b>Broadcast Message</b>\n\n{message}",
-                parse_mode='HTML'
-            )
-            sent_count += 1
-        except Exception:
-            continue
+    if Broadcast.active:
+        await update.message.reply_text("A broadcast is already in progress.")
+        return
 
-    await update.message.reply_text(f"Broadcast sent to {sent_count} users.")
+    message = " ".join(context.args)
+    recipients = await AsyncDatabase.user_ids()
+    status = await update.message.reply_text(f"📢 Broadcast started for {len(recipients)} users.")
+    Broadcast.start(context.application, message, recipients, status.chat_id, status.message_id)
 
 async def admin_add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /adminaddchannel command"""
@@ -277,6 +282,206 @@ async def admin_remove_channel(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await update.message.reply_text("This channel is not in the list.")
 
+def _parse_balance_csv(content: bytes):
+    """Return ({user_id: (username, total amount)}, [errors]) for username,amount rows"""
+    changes = {}
+    errors = []
+    try:
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))
+    except UnicodeDecodeError:
+        return {}, ["The file is not UTF-8 text."]
+
+    for line_number, row in enumerate(rows, 1):
+        if not row or not "".join(row).strip():
+            continue
+        if len(row) < 2:
+            errors.append(f"Line {line_number}: expected username,amount")
+            continue
+        username = row[0].strip().lstrip("@")
+        try:
+            amount = float(row[1])
+        except ValueError:
+            if line_number == 1:
+                continue  # header
+            errors.append(f"Line {line_number}: invalid amount {row[1]!r}")
+            continue
+        if not math.isfinite(amount) or amount == 0:
+            errors.append(f"Line {line_number}: invalid amount {row[1]!r}")
+            continue
+        user_id = Database.find_user_id(username)
+        if not user_id:
+            errors.append(f"Line {line_number}: user @{username} not found")
+            continue
+        _, total = changes.get(user_id, (username, 0.0))
+        changes[user_id] = (username, total + amount)
+    return changes, errors
+
+async def admin_import_balances(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /admin_import_balances sent as the caption of, or a reply to, a CSV document"""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔️ Unauthorized access.")
+        return
+
+    message = update.message
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    if not document:
+        await message.reply_text(
+            "Send a CSV file of username,amount rows with the caption /admin_import_balances, "
+            "or reply to one with the command. Negative amounts remove funds."
+        )
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.reply_text(f"The file is too large (max {IMPORT_MAX_BYTES // 1024} KiB).")
+        return
+
+    file = await context.bot.get_file(document.file_id)
+    changes, errors = await AsyncDatabase.run(_parse_balance_csv, bytes(await file.download_as_bytearray()))
+    if not changes and not errors:
+        await message.reply_text("The file has no rows.")
+        return
+
+    async with locks.hold(*(f"user:{user_id}" for user_id in changes)):
+        users = await AsyncDatabase.run(lambda: {user_id: Database.get_user(user_id) for user_id in changes})
+        for user_id, (username, amount) in changes.items():
+            if users[user_id].get("balance", 0) + amount < 0:
+                errors.append(f"@{username}: balance would go below zero")
+
+        # All or nothing: one bad row rejects the whole file
+        if errors:
+            shown = "\n".join(errors[:20])
+            more = f"\n...and {len(errors) - 20} more" if len(errors) > 20 else ""
+            await message.reply_text(f"❌ Import rejected, nothing was changed:\n{shown}{more}")
+            return
+
+        admin_ref = str(update.effective_user.id)
+        ledger_changes = []
+        for user_id, (_, amount) in changes.items():
+            users[user_id]["balance"] += amount
+            kind = "admin_credit" if amount >= 0 else "admin_debit"
+            ledger_changes.append((user_id, users[user_id], amount, kind, admin_ref))
+        def commit():
+            Ledger.record_many(ledger_changes)
+            Database.save_users(users)
+        await AsyncDatabase.run(commit)
+
+    credited = sum(amount for _, amount in changes.values() if amount > 0)
+    debited = -sum(amount for _, amount in changes.values() if amount < 0)
+    await message.reply_text(
+        f"✅ Balances updated for {len(changes)} users.\n"
+        f"Added: {format_currency(credited)}\n"
+        f"Removed: {format_currency(debited)}"
+    )
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /admin_profile command"""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔️ Unauthorized access.")
+        return
+
+    usage = f"Usage: /admin_profile cpu|mem [seconds, up to {PROFILE_MAX_SECONDS}]"
+    if not context.args or context.args[0] not in ("cpu", "mem"):
+        await update.message.reply_text(usage)
+        return
+
+    try:
+        seconds = float(context.args[1]) if len(context.args) > 1 else 10.0
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        await update.message.reply_text(usage)
+        return
+
+    if Profiler.running:
+        await update.message.reply_text("A profile is already running.")
+        return
+
+    kind = context.args[0]
+    await update.message.reply_text(f"⏱ Profiling {kind} for {seconds:g} seconds...")
+    if kind == "cpu":
+        summary, report = await Profiler.cpu(seconds, PROFILE_SAMPLE_INTERVAL)
+        filename = "cpu_profile.folded"
+    else:
+        summary, report = await Profiler.memory(seconds)
+        filename = "memory_profile.txt"
+
+    await update.message.reply_text(summary[:4000])
+    await update.message.reply_document(document=io.BytesIO(report), filename=filename)
+
+SEARCH_USAGE = (
+    "Usage: /search_deals [words] [status:STATUS] [price:MIN-MAX] [seller:@user] [buyer:@user]\n"
+    "Example: /search_deals iphone status:in_progress price:1000-5000\n"
+    "Archived (finished) deals are included and listed after the live ones."
+)
+
+async def _search_page(search: dict, offset: int):
+    """Run a saved search and build the text and buttons for one page"""
+    deals, total = await AsyncDatabase.run(
+        DealSearch.search, search["words"], status=search.get("status"),
+        price=tuple(search.get("price", (None, None))), seller_id=search.get("seller_id"),
+        buyer_username=search.get("buyer"), offset=offset, limit=SEARCH_PAGE_SIZE
+    )
+    if not deals:
+        return "No matching deals.", None
+
+    lines = [f"🔎 Deals {offset + 1}-{offset + len(deals)} of {total}\n"]
+    for deal_id, deal in deals:
+        lines.append(
+            f"{deal_id} - {deal.get('product_name', '')}{' (archived)' if deal.get('archived') else ''}\n"
+            f"    {deal.get('status')} · {format_currency(deal.get('price', 0))} · "
+            f"seller {deal.get('seller_id')} · buyer @{deal.get('buyer_username')}"
+        )
+
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(
+            "◀️ Previous", callback_data=f"searchdeals_{max(0, offset - SEARCH_PAGE_SIZE)}"
+        ))
+    if offset + len(deals) < total:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"searchdeals_{offset + len(deals)}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def admin_search_deals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /search_deals command"""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔️ Unauthorized access.")
+        return
+
+    try:
+        words, filters = parse_query(" ".join(context.args))
+    except ValueError as e:
+        await update.message.reply_text(f"{e}\n\n{SEARCH_USAGE}")
+        return
+    if not words and not filters:
+        await update.message.reply_text(SEARCH_USAGE)
+        return
+
+    search = {"words": words, "status": filters.get("status"), "buyer": filters.get("buyer")}
+    if "price" in filters:
+        search["price"] = price_range(filters["price"])
+    if "seller" in filters:
+        search["seller_id"] = await AsyncDatabase.find_user_id(filters["seller"])
+        if search["seller_id"] is None:
+            await update.message.reply_text(f"No user {filters['seller']} found.")
+            return
+
+    # The buttons only carry the offset; the query stays with the admin
+    context.user_data["deal_search"] = search
+    text, markup = await _search_page(search, 0)
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def handle_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the Previous/Next buttons under /search_deals"""
+    query = update.callback_query
+    await query.answer()
+
+    search = context.user_data.get("deal_search")
+    if not search or not await is_admin(update.effective_user.id):
+        await query.edit_message_text("This search has expired. Run /search_deals again.")
+        return
+
+    text, markup = await _search_page(search, int(query.data.split('_')[1]))
+    await query.edit_message_text(text, reply_markup=markup)
 
 def add_admin_handlers(dispatcher):
     dispatcher.add_handler(CommandHandler("admin_stats", admin_stats))
@@ -287,4 +492,7 @@ def add_admin_handlers(dispatcher):
     dispatcher.add_handler(CommandHandler("admin_generateredeem", admin_generateredeem))
     dispatcher.add_handler(CommandHandler("admin_broadcast", admin_broadcast))
     dispatcher.add_handler(CommandHandler("adminaddchannel", admin_add_channel))
-    dispatcher.add_handler(CommandHandler("adminremovechannel", admin_remove_channel))
\ No newline at end of file
+    dispatcher.add_handler(CommandHandler("adminremovechannel", admin_remove_channel))
+    dispatcher.add_handler(CommandHandler("admin_profile", admin_profile))
+    dispatcher.add_handler(CommandHandler("admin_import_balances", admin_import_balances))
+    dispatcher.add_handler(CommandHandler("search_deals", admin_search_deals))
\ No newline at end of file
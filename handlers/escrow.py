@@ -1,15 +1,20 @@
+import time
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, filters
 from utils.database import Database
-from utils.helpers import generate_unique_id, calculate_fee, format_currency
-from config import ESCROW_ID_PREFIX, DEFAULT_FEE_PERCENTAGE
+from utils.async_database import AsyncDatabase
+from utils.helpers import calculate_fee, format_currency
+from utils.locks import locks
+from utils.ledger import Ledger
+from utils.outbox import outbox
+from config import ESCROW_ID_PREFIX, DEFAULT_FEE_PERCENTAGE, MY_DEALS_PAGE_SIZE
 
 # States for conversation handler
 PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, BUYER_USERNAME = range(4)
 
 async def start_escrow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start escrow creation process"""
-    user_data = Database.get_user(update.effective_user.id)
+    user_data = await AsyncDatabase.get_user(update.effective_user.id)
 
     if user_data.get("is_banned"):
         await update.message.reply_text("You are banned from using this bot.")
@@ -46,7 +51,7 @@ async def buyer_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
     buyer_username = update.message.text.strip('@')
     seller_id = update.effective_user.id
 
-    escrow_id = generate_unique_id(ESCROW_ID_PREFIX)
+    escrow_id = (await AsyncDatabase.allocate_ids(ESCROW_ID_PREFIX))[0]
     fee = calculate_fee(context.user_data['price'], DEFAULT_FEE_PERCENTAGE)
 
     deal_data = {
@@ -58,10 +63,11 @@ async def buyer_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "price": context.user_data['price'],
         "fee": fee,
         "status": "pending",
-        "product_delivered": False
+        "product_delivered": False,
+        "created_at": int(time.time())
     }
 
-    Database.save_deal(escrow_id, deal_data)
+    await AsyncDatabase.save_deal(escrow_id, deal_data)
 
     await update.message.reply_text(
         f"Escrow deal created successfully!\n\n"
@@ -89,7 +95,7 @@ async def find_deal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     deal_id = context.args[0]
-    deal_data = Database.get_deal(deal_id)
+    deal_data = await AsyncDatabase.find_deal(deal_id)
 
     if not deal_data:
         await update.message.reply_text("Deal not found.")
@@ -114,6 +120,167 @@ async def find_deal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
+STATUS_LABELS = {
+    "pending": "🕓 Pending",
+    "in_progress": "🔒 In progress",
+    "completed": "✅ Completed",
+    "declined": "❌ Declined",
+    "expired": "⌛ Expired",
+    "refunded": "↩️ Refunded",
+}
+
+async def _my_deals_page(user, offset: int = 0, after: tuple = None, before: tuple = None):
+    """Build the text and buttons for one page of a user's deals"""
+    deals, total = await AsyncDatabase.participant_deals(
+        user.id, user.username, offset, MY_DEALS_PAGE_SIZE, after, before
+    )
+    if not deals:
+        return "You have no deals yet. Start one with /escrow.", None
+
+    lines = [f"📋 Your Deals ({offset + 1}-{offset + len(deals)} of {total})\n"]
+    for role, deal_id, deal in deals:
+        status = STATUS_LABELS.get(deal.get("status"), deal.get("status"))
+        lines.append(
+            f"{deal_id} - {deal.get('product_name', '')}\n"
+            f"    {status} · {format_currency(deal.get('price', 0))} · you are the {role}"
+        )
+    lines.append("\nUse /find_deal DEAL_ID for details.")
+
+    # Each button carries the deal at the page's edge, so the next page starts from it
+    buttons = []
+    if offset > 0:
+        role, deal_id, _ = deals[0]
+        buttons.append(InlineKeyboardButton(
+            "◀️ Previous", callback_data=f"mydeals_{max(0, offset - MY_DEALS_PAGE_SIZE)}_before_{role}_{deal_id}"
+        ))
+    if offset + len(deals) < total:
+        role, deal_id, _ = deals[-1]
+        buttons.append(InlineKeyboardButton(
+            "Next ▶️", callback_data=f"mydeals_{offset + len(deals)}_after_{role}_{deal_id}"
+        ))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def my_deals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /my_deals command"""
+    text, markup = await _my_deals_page(update.effective_user)
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def handle_my_deals_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the Previous/Next buttons under /my_deals"""
+    query = update.callback_query
+    await query.answer()
+
+    # mydeals_<offset>_<after|before>_<role>_<deal id>; older buttons carry only the offset
+    _, offset, *anchor = query.data.split('_', 4)
+    after = tuple(anchor[1:]) if anchor and anchor[0] == "after" else None
+    before = tuple(anchor[1:]) if anchor and anchor[0] == "before" else None
+    text, markup = await _my_deals_page(update.effective_user, int(offset), after, before)
+    await query.edit_message_text(text, reply_markup=markup)
+
+async def _approve_deal(deal_id: str, buyer_id: int):
+    """Move the buyer's funds into escrow. Returns (deal_data, error message)"""
+    async with locks.hold(f"deal:{deal_id}", f"user:{buyer_id}"):
+        deal_data = await AsyncDatabase.get_deal(deal_id)
+        if not deal_data:
+            return None, "Deal not found."
+        if deal_data['status'] != "pending":
+            return None, "This deal is no longer pending."
+
+        buyer_data = await AsyncDatabase.get_user(buyer_id)
+        total_amount = deal_data['price'] + deal_data['fee']
+
+        def commit():
+            held = Ledger.find("escrow_hold", deal_id)
+            if not held and buyer_data.get('balance', 0) < total_amount:
+                return "❌ Insufficient balance. Please add funds to your wallet."
+
+            # Update deal status and transfer funds; a refund on timeout goes to buyer_id
+            deal_data['status'] = "in_progress"
+            deal_data['buyer_id'] = buyer_id
+            deal_data['approved_at'] = int(time.time())
+            if held:
+                # An approval whose saves failed already holds the funds; apply its entry
+                Ledger.repair(buyer_id, buyer_data)
+            else:
+                buyer_data['balance'] -= total_amount
+                Ledger.record(buyer_id, buyer_data, -total_amount, "escrow_hold", deal_id)
+            Database.save_deal(deal_id, deal_data)
+            Database.save_user(buyer_id, buyer_data)
+            return None
+        error = await AsyncDatabase.run(commit)
+        if error:
+            return None, error
+
+    return deal_data, None
+
+async def _decline_deal(deal_id: str):
+    """Mark a pending deal as declined. Returns (deal_data, error message)"""
+    async with locks.hold(f"deal:{deal_id}"):
+        deal_data = await AsyncDatabase.get_deal(deal_id)
+        if not deal_data:
+            return None, "Deal not found."
+        if deal_data['status'] != "pending":
+            return None, "This deal is no longer pending."
+
+        deal_data['status'] = "declined"
+        await AsyncDatabase.save_deal(deal_id, deal_data)
+
+    return deal_data, None
+
+async def _confirm_deal(deal_id: str, buyer_id: int):
+    """Release escrowed funds to the seller. Returns (deal_data, error message)"""
+    async with locks.hold(f"deal:{deal_id}"):
+        deal_data = await AsyncDatabase.get_deal(deal_id)
+        if not deal_data:
+            return None, "Deal not found."
+        if deal_data['status'] != "in_progress":
+            return None, "This deal is not awaiting confirmation."
+
+        seller_id = deal_data['seller_id']
+        async with locks.hold(f"user:{seller_id}", f"user:{buyer_id}"):
+            def release():
+                seller_data = Database.get_user(seller_id)
+                seller_data['completed_deals'] += 1
+
+                # Update buyer's completed deals
+                buyer_data = seller_data if buyer_id == seller_id else Database.get_user(buyer_id)
+                buyer_data['completed_deals'] += 1
+                buyer_data['pending_deals'] -= 1
+
+                # Update deal status
+                deal_data['status'] = "completed"
+
+                # Release funds to seller (price without fee), unless a confirm
+                # whose saves failed already did; then apply its entry instead
+                if Ledger.find("escrow_release", deal_id):
+                    Ledger.repair(seller_id, seller_data)
+                else:
+                    seller_data['balance'] += deal_data['price']
+                    Ledger.record(seller_id, seller_data, deal_data['price'], "escrow_release", deal_id)
+
+                # Save the deal first: once it is completed a failed user save
+                # is restored from the ledger at startup, never paid again
+                Database.save_deal(deal_id, deal_data)
+                Database.save_user(seller_id, seller_data)
+                Database.save_user(buyer_id, buyer_data)
+            await AsyncDatabase.run(release)
+
+    return deal_data, None
+
+def notify_deadline(deal_id: str, deal_data: dict):
+    """Tell the parties that a deal expired or was refunded on its deadline"""
+    if deal_data['status'] == "expired":
+        outbox.send(deal_data['seller_id'],
+                    f"⌛ Deal {deal_id} has expired because the buyer did not approve it in time.")
+        return
+    amount = format_currency(deal_data['price'] + deal_data['fee'])
+    outbox.send(deal_data['buyer_id'],
+                f"↩️ Deal {deal_id} was cancelled because the product was not delivered in time.\n"
+                f"{amount} has been returned to your wallet.")
+    outbox.send(deal_data['seller_id'],
+                f"⌛ Deal {deal_id} was cancelled because the product was not delivered in time.\n"
+                "The buyer has been refunded.")
+
 async def approve_deal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /approve_deal command"""
     if len(context.args) != 1:
@@ -121,26 +288,12 @@ async def approve_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     deal_id = context.args[0]
-    deal_data = Database.get_deal(deal_id)
-
-    if not deal_data:
-        await update.message.reply_text("Deal not found.")
-        return
+    deal_data, error = await _approve_deal(deal_id, update.effective_user.id)
 
-    # Handle approval logic
-    buyer_data = Database.get_user(update.effective_user.id)
-    total_amount = deal_data['price'] + deal_data['fee']
-
-    if buyer_data['balance'] < total_amount:
-        await update.message.reply_text("❌ Insufficient balance. Please add funds to your wallet.")
+    if error:
+        await update.message.reply_text(error)
         return
 
-    # Update deal status and transfer funds
-    deal_data['status'] = "in_progress"
-    buyer_data['balance'] -= total_amount
-    Database.save_deal(deal_id, deal_data)
-    Database.save_user(update.effective_user.id, buyer_data)
-
     await update.message.reply_text(
         "✅ Deal approved! Waiting for seller to deliver the product.\n\n"
         f"Product: {deal_data['product_name']}\n"
@@ -150,7 +303,7 @@ async def approve_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # Notify seller with inline keyboard
     keyboard = [[InlineKeyboardButton("📦 Send Product", callback_data=f"send_product_{deal_id}")]]
-    await context.bot.send_message(
+    outbox.send(
         deal_data['seller_id'],
         f"🎉 Buyer has approved the deal {deal_id} and funds have been secured.\n\n"
         "Please send the product (text, file, or any content) in your next message.",
@@ -164,15 +317,12 @@ async def decline_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     deal_id = context.args[0]
-    deal_data = Database.get_deal(deal_id)
+    deal_data, error = await _decline_deal(deal_id)
 
-    if not deal_data:
-        await update.message.reply_text("Deal not found.")
+    if error:
+        await update.message.reply_text(error)
         return
 
-    deal_data['status'] = "declined"
-    Database.save_deal(deal_id, deal_data)
-
     await update.message.reply_text(
         "❌ Deal declined.\n\n"
         f"Product: {deal_data['product_name']}\n"
@@ -180,7 +330,7 @@ async def decline_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
     )
 
     # Notify seller
-    await context.bot.send_message(
+    outbox.send(
         deal_data['seller_id'],
         f"Deal {deal_id} has been declined by the buyer."
     )
@@ -192,30 +342,12 @@ async def confirm_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     deal_id = context.args[0]
-    deal_data = Database.get_deal(deal_id)
+    deal_data, error = await _confirm_deal(deal_id, update.effective_user.id)
 
-    if not deal_data:
-        await update.message.reply_text("Deal not found.")
+    if error:
+        await update.message.reply_text(error)
         return
 
-    # Release funds to seller
-    seller_data = Database.get_user(deal_data['seller_id'])
-    seller_data['balance'] += deal_data['price']  # Add price without fee
-    seller_data['completed_deals'] += 1
-
-    # Update buyer's completed deals
-    buyer_data = Database.get_user(update.effective_user.id)
-    buyer_data['completed_deals'] += 1
-    buyer_data['pending_deals'] -= 1
-
-    # Update deal status
-    deal_data['status'] = "completed"
-
-    # Save all updates
-    Database.save_user(deal_data['seller_id'], seller_data)
-    Database.save_user(update.effective_user.id, buyer_data)
-    Database.save_deal(deal_id, deal_data)
-
     await update.message.reply_text(
         f"✅ Deal {deal_id} completed successfully!\n"
         f"Product: {deal_data['product_name']}\n"
@@ -223,7 +355,7 @@ async def confirm_deal_command(update: Update, context: ContextTypes.DEFAULT_TYP
     )
 
     # Notify seller
-    await context.bot.send_message(
+    outbox.send(
         chat_id=deal_data['seller_id'],
         text=f"🎉 Deal {deal_id} completed! The buyer has confirmed receipt.\n"
              f"Funds ({format_currency(deal_data['price'])}) have been added to your wallet."
@@ -236,7 +368,7 @@ async def report_deal_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     deal_id = context.args[0]
-    deal_data = Database.get_deal(deal_id)
+    deal_data = await AsyncDatabase.find_deal(deal_id)
 
     if not deal_data:
         await update.message.reply_text("Deal not found.")
@@ -248,7 +380,7 @@ async def report_deal_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
     # Notify seller
-    await context.bot.send_message(
+    outbox.send(
         chat_id=deal_data['seller_id'],
         text=f"⚠️ The buyer has reported an issue with deal {deal_id}.\n"
              "Please contact admin for support."
@@ -260,30 +392,13 @@ async def handle_deal_response(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     action, deal_id = query.data.split('_')
-    deal_data = Database.get_deal(deal_id)
-
-    if not deal_data:
-        await query.edit_message_text("Deal not found.", reply_markup=None)
-        return
 
     if action == "approve":
-        # Handle approval logic
-        buyer_data = Database.get_user(update.effective_user.id)
-        total_amount = deal_data['price'] + deal_data['fee']
-
-        if buyer_data['balance'] < total_amount:
-            await query.edit_message_text(
-                "❌ Insufficient balance. Please add funds to your wallet.",
-                reply_markup=None
-            )
+        deal_data, error = await _approve_deal(deal_id, update.effective_user.id)
+        if error:
+            await query.edit_message_text(error, reply_markup=None)
             return
 
-        # Update deal status and transfer funds
-        deal_data['status'] = "in_progress"
-        buyer_data['balance'] -= total_amount
-        Database.save_deal(deal_id, deal_data)
-        Database.save_user(update.effective_user.id, buyer_data)
-
         # Update message without inline keyboard
         await query.edit_message_text(
             "✅ Deal approved! Waiting for seller to deliver the product.\n\n"
@@ -295,7 +410,7 @@ async def handle_deal_response(update: Update, context: ContextTypes.DEFAULT_TYP
 
         # Notify seller with inline keyboard
         keyboard = [[InlineKeyboardButton("📦 Send Product", callback_data=f"send_product_{deal_id}")]]
-        await context.bot.send_message(
+        outbox.send(
             deal_data['seller_id'],
             f"🎉 Buyer has approved the deal {deal_id} and funds have been secured.\n\n"
             "Please send the product (text, file, or any content) in your next message.",
@@ -303,8 +418,10 @@ async def handle_deal_response(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
     elif action == "decline":
-        deal_data['status'] = "declined"
-        Database.save_deal(deal_id, deal_data)
+        deal_data, error = await _decline_deal(deal_id)
+        if error:
+            await query.edit_message_text(error, reply_markup=None)
+            return
 
         # Update message without inline keyboard
         await query.edit_message_text(
@@ -315,7 +432,7 @@ async def handle_deal_response(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
         # Notify seller
-        await context.bot.send_message(
+        outbox.send(
             deal_data['seller_id'],
             f"Deal {deal_id} has been declined by the buyer."
         )
@@ -327,7 +444,7 @@ async def handle_product_delivery(update: Update, context: ContextTypes.DEFAULT_
 
     # Fix the split to handle "send_product_DEALID" format
     _, _, deal_id = query.data.split('_')
-    deal_data = Database.get_deal(deal_id)
+    deal_data = await AsyncDatabase.get_deal(deal_id)
 
     if not deal_data or deal_data['seller_id'] != update.effective_user.id:
         await query.edit_message_text(
@@ -349,23 +466,19 @@ async def process_product_delivery(update: Update, context: ContextTypes.DEFAULT
         return
 
     deal_id = context.user_data['awaiting_product']
-    deal_data = Database.get_deal(deal_id)
+    deal_data = await AsyncDatabase.get_deal(deal_id)
 
     if not deal_data:
         await update.message.reply_text("Deal not found.", reply_markup=None)
         return
 
-    # Find buyer's user_id from username (case-insensitive)
-    users = Database.load_data("data/users.json")
-    buyer_id = None
-    buyer_username = deal_data['buyer_username'].lower()
+    if deal_data['status'] != "in_progress":
+        del context.user_data['awaiting_product']
+        await update.message.reply_text("This deal is no longer active.", reply_markup=None)
+        return
 
-    for uid, data in users.items():
-        if (uid != "example_format" and 
-            isinstance(data, dict) and 
-            data.get("username", "").lower() == buyer_username):
-            buyer_id = int(uid)
-            break
+    # Find buyer's user_id from username (case-insensitive)
+    buyer_id = await AsyncDatabase.find_user_id(deal_data['buyer_username'])
 
     if not buyer_id:
         error_msg = (
@@ -378,8 +491,18 @@ async def process_product_delivery(update: Update, context: ContextTypes.DEFAULT
         return
 
     try:
-        # Forward the message to buyer
-        forwarded = await update.message.copy(buyer_id)
+        # Hold the deal across the copy so the deadline sweep cannot refund
+        # it in between; the deal only counts as delivered once the copy
+        # (sent inline, not through the outbox) has gone through
+        async with locks.hold(f"deal:{deal_id}"):
+            deal_data = await AsyncDatabase.get_deal(deal_id)
+            if deal_data.get('status') != "in_progress":
+                del context.user_data['awaiting_product']
+                await update.message.reply_text("This deal is no longer active.", reply_markup=None)
+                return
+            await update.message.copy(buyer_id)
+            deal_data['product_delivered'] = True
+            await AsyncDatabase.save_deal(deal_id, deal_data)
 
         keyboard = [
             [
@@ -388,20 +511,17 @@ async def process_product_delivery(update: Update, context: ContextTypes.DEFAULT
             ]
         ]
 
-        await context.bot.send_message(
+        outbox.send(
             chat_id=buyer_id,
             text=f"🎁 Product received for deal {deal_id}!\n"
                  "Please confirm if you've received the product as expected:",
+            key=f"confirm_{deal_id}",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
         # Clear the awaiting product state
         del context.user_data['awaiting_product']
 
-        # Update deal status
-        deal_data['product_delivered'] = True
-        Database.save_deal(deal_id, deal_data)
-
         await update.message.reply_text(
             "✅ Product has been delivered to the buyer.\n"
             "Waiting for buyer's confirmation.",
@@ -424,33 +544,12 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
 
     action, deal_id = query.data.split('_')
-    deal_data = Database.get_deal(deal_id)
-
-    if not deal_data:
-        await query.edit_message_text(
-            "Deal not found.",
-            reply_markup=None
-        )
-        return
 
     if action == "confirm":
-        # Release funds to seller
-        seller_data = Database.get_user(deal_data['seller_id'])
-        seller_data['balance'] += deal_data['price']  # Add price without fee
-        seller_data['completed_deals'] += 1
-
-        # Update buyer's completed deals
-        buyer_data = Database.get_user(update.effective_user.id)
-        buyer_data['completed_deals'] += 1
-        buyer_data['pending_deals'] -= 1
-
-        # Update deal status
-        deal_data['status'] = "completed"
-
-        # Save all updates
-        Database.save_user(deal_data['seller_id'], seller_data)
-        Database.save_user(update.effective_user.id, buyer_data)
-        Database.save_deal(deal_id, deal_data)
+        deal_data, error = await _confirm_deal(deal_id, update.effective_user.id)
+        if error:
+            await query.edit_message_text(error, reply_markup=None)
+            return
 
         # Update the message first to remove buttons
         await query.edit_message_text(
@@ -461,13 +560,18 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
         # Then send notification to seller
-        await context.bot.send_message(
+        outbox.send(
             chat_id=deal_data['seller_id'],
             text=f"🎉 Deal {deal_id} completed! The buyer has confirmed receipt.\n"
                  f"Funds ({format_currency(deal_data['price'])}) have been added to your wallet."
         )
 
     elif action == "report":
+        deal_data = await AsyncDatabase.find_deal(deal_id)
+        if not deal_data:
+            await query.edit_message_text("Deal not found.", reply_markup=None)
+            return
+
         # Handle issue report
         await query.edit_message_text(
             f"Issue reported for deal {deal_id}.\n"
@@ -476,7 +580,7 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
         # Notify seller about the issue
-        await context.bot.send_message(
+        outbox.send(
             chat_id=deal_data['seller_id'],
             text=f"⚠️ The buyer has reported an issue with deal {deal_id}.\n"
                  "Please contact admin for support."
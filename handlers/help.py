@@ -9,10 +9,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• /start - Start the bot and check channel membership\n"
         "• /help - Show this help message\n"
         "• /wallet - Check your wallet balance\n"
-        "• /redeem - Redeem a code (Usage: /redeem CODE)\n\n"
+        "• /redeem - Redeem a code (Usage: /redeem CODE)\n"
+        "• /history - View your transaction history\n\n"
         "<b>Escrow Commands:</b>\n"
         "• /escrow - Create new escrow deal\n"
-        "• /find_deal - Find a deal by ID (Usage: /find_deal DEAL_ID)\n\n"
+        "• /find_deal - Find a deal by ID (Usage: /find_deal DEAL_ID)\n"
+        "• /my_deals - List the deals you are selling or buying\n\n"
         "For support, contact: @satsnova"
     )
 
@@ -30,18 +32,23 @@ async def admin_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "<b>👑 Admin Control Panel</b>\n\n"
         "<b>👥 User Management:</b>\n"
         "• /admin_stats - View user statistics\n"
+        "• /search_deals words status:X price:MIN-MAX seller:@u buyer:@u - Find deals\n"
         "• /admin_ban username - Ban a user\n"
         "• /admin_unban username - Unban a user\n\n"
         "<b>💰 Balance Management:</b>\n"
         "• /admin_add_balance username amount - Add funds\n"
         "• /admin_remove_balance username amount - Remove funds\n\n"
         "<b>🎁 Redeem Codes:</b>\n"
-        "• /admin_generateredeem amount - Create code\n\n"
+        "• /admin_generateredeem amount [count] - Create codes\n\n"
+        "<b>📥 Bulk Balances:</b>\n"
+        "• /admin_import_balances - Caption a username,amount CSV with this\n\n"
         "<b>📢 Communication:</b>\n"
         "• /admin_broadcast message - Message all users\n\n"
         "<b>📺 Channel Management:</b>\n"
         "• /adminaddchannel channelid name - Add channel\n"
-        "• /adminremovechannel channelid - Remove channel"
+        "• /adminremovechannel channelid - Remove channel\n\n"
+        "<b>🩺 Diagnostics:</b>\n"
+        "• /admin_profile cpu|mem seconds - Profile the running bot"
     )
 
     await update.message.reply_text(admin_help, parse_mode='HTML')
\ No newline at end of file
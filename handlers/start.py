@@ -1,21 +1,53 @@
+import asyncio
+from typing import Dict, Tuple
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from utils.helpers import format_currency
-from config import REQUIRED_CHANNELS
+from utils.locks import locks
+from utils.ttl_cache import TTLCache
+from config import REQUIRED_CHANNELS, MEMBERSHIP_CACHE_TTL, MEMBERSHIP_NEGATIVE_TTL
+
+# (user_id, channel) -> membership result, shared by /start and "I've Joined"
+_membership_cache = TTLCache()
+# Lookups currently in flight, so repeated taps wait for the same API call
+_membership_requests: Dict[Tuple[int, str], asyncio.Future] = {}
+
+async def _is_channel_member(context: ContextTypes.DEFAULT_TYPE, channel: str, user_id: int) -> bool:
+    """Check one channel, answering from the cache when possible"""
+    key = (user_id, channel)
+    cached = _membership_cache.get(key)
+    if cached is not None:
+        return cached
+    if key in _membership_requests:
+        return await asyncio.shield(_membership_requests[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _membership_requests[key] = future
+    try:
+        member = await context.bot.get_chat_member(chat_id=channel, user_id=user_id)
+        is_member = member.status not in ["left", "kicked", "restricted"]
+    except Exception:
+        is_member = False
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        del _membership_requests[key]
+
+    ttl = MEMBERSHIP_CACHE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL
+    _membership_cache.set(key, is_member, ttl)
+    future.set_result(is_member)
+    return is_member
 
 async def check_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if user is member of required channels"""
     user_id = update.effective_user.id
 
-    for channel in REQUIRED_CHANNELS:
-        try:
-            member = await context.bot.get_chat_member(chat_id=channel, user_id=user_id)
-            if member.status in ["left", "kicked", "restricted"]:
-                return False
-        except Exception:
-            return False
-    return True
+    results = await asyncio.gather(
+        *(_is_channel_member(context, channel, user_id) for channel in REQUIRED_CHANNELS)
+    )
+    return all(results)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -34,15 +66,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Initialize user in database if not exists
-    user_data = Database.get_user(user.id) or {
-        "id": user.id,
-        "username": user.username,
-        "balance": 0.0,
-        "completed_deals": 0,
-        "pending_deals": 0,
-        "is_banned": False
-    }
-    Database.save_user(user.id, user_data)
+    async with locks.hold(f"user:{user.id}"):
+        user_data = await AsyncDatabase.get_user(user.id) or {
+            "id": user.id,
+            "username": user.username,
+            "balance": 0.0,
+            "completed_deals": 0,
+            "pending_deals": 0,
+            "is_banned": False
+        }
+        await AsyncDatabase.save_user(user.id, user_data)
 
     # Show welcome message
     await update.message.reply_text(
@@ -64,4 +97,17 @@ async def check_join_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("Thank you for joining! You can now use the bot.\n\nUse /start to begin.",
                                     reply_markup=None)  # Remove buttons
     else:
-        await query.answer("Please join all required channels first!", show_alert=True)
\ No newline at end of file
+        await query.answer("Please join all required channels first!", show_alert=True)
+
+async def track_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Keep the stored username in sync when a user renames their account"""
+    user = update.effective_user
+    if not user:
+        return
+
+    user_data = await AsyncDatabase.get_user(user.id)
+    if user_data and user_data.get("username") != user.username:
+        async with locks.hold(f"user:{user.id}"):
+            user_data = await AsyncDatabase.get_user(user.id)
+            user_data["username"] = user.username
+            await AsyncDatabase.save_user(user.id, user_data)
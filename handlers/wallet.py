@@ -1,11 +1,16 @@
-from telegram import Update
+from datetime import datetime
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler
 from utils.database import Database
+from utils.async_database import AsyncDatabase
 from utils.helpers import validate_amount, format_currency
+from utils.locks import locks
+from utils.ledger import Ledger
+from config import HISTORY_PAGE_SIZE
 
 async def wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /wallet command"""
-    user_data = Database.get_user(update.effective_user.id)
+    user_data = await AsyncDatabase.get_user(update.effective_user.id)
 
     if user_data.get("is_banned"):
         await update.message.reply_text("You are banned from using this bot.")
@@ -27,27 +32,84 @@ async def redeem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     code = context.args[0]
 
-    code_data = Database.get_redeem_code(code)
-    if not code_data or code_data.get("used"):
-        await update.message.reply_text("Invalid or already used redeem code.")
-        return
+    async with locks.hold(f"code:{code}", f"user:{user_id}"):
+        code_data = await AsyncDatabase.get_redeem_code(code)
+        if not code_data or code_data.get("used"):
+            await update.message.reply_text("Invalid or already used redeem code.")
+            return
 
-    user_data = Database.get_user(user_id)
-    if user_data.get("is_banned"):
-        await update.message.reply_text("You are banned from using this bot.")
-        return
+        user_data = await AsyncDatabase.get_user(user_id)
+        if user_data.get("is_banned"):
+            await update.message.reply_text("You are banned from using this bot.")
+            return
 
-    # Update user balance and mark code as used
-    amount = code_data["amount"]
-    user_data["balance"] += amount
-    code_data["used"] = True
-    code_data["used_by"] = user_id
+        # Update user balance and mark code as used
+        amount = code_data["amount"]
+        user_data["balance"] += amount
+        code_data["used"] = True
+        code_data["used_by"] = user_id
 
-    Database.save_user(user_id, user_data)
-    Database.save_redeem_code(code, code_data)
+        def commit():
+            Ledger.record(user_id, user_data, amount, "redeem", code)
+            Database.save_user(user_id, user_data)
+            Database.save_redeem_code(code, code_data)
+        await AsyncDatabase.run(commit)
 
     await update.message.reply_text(
         f"Successfully redeemed code!\n"
         f"Amount added: {format_currency(amount)}\n"
         f"New balance: {format_currency(user_data['balance'])}"
-    )
\ No newline at end of file
+    )
+
+HISTORY_LABELS = {
+    "redeem": "Redeemed",
+    "escrow_hold": "Paid into escrow",
+    "escrow_release": "Deal payout",
+    "escrow_refund": "Escrow refund",
+    "admin_credit": "Added by admin",
+    "admin_debit": "Removed by admin",
+}
+
+async def _history_page(user_id: int, before: int = None, after: int = None):
+    """Build the text and buttons for one page of a user's transactions"""
+    entries, has_older, has_newer = await AsyncDatabase.ledger_page(
+        user_id, HISTORY_PAGE_SIZE, before=before, after=after
+    )
+    if not entries:
+        return "No transactions yet.", None
+
+    lines = ["📜 <b>Transaction History</b>\n"]
+    for entry in entries:
+        when = datetime.fromtimestamp(entry["created_at"]).strftime("%Y-%m-%d %H:%M")
+        sign = "+" if entry["amount"] >= 0 else "-"
+        label = HISTORY_LABELS.get(entry["kind"], entry["kind"])
+        # Admin entries reference the admin's id, which users need not see
+        ref = f" ({entry['ref']})" if entry["ref"] and not entry["kind"].startswith("admin_") else ""
+        lines.append(
+            f"{when}  {sign}{format_currency(abs(entry['amount']))}  {label}{ref}\n"
+            f"    Balance: {format_currency(entry['balance'])}"
+        )
+
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("◀️ Newer", callback_data=f"history_n_{entries[0]['seq']}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Older ▶️", callback_data=f"history_o_{entries[-1]['seq']}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /history command"""
+    text, markup = await _history_page(update.effective_user.id)
+    await update.message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+
+async def handle_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the Newer/Older buttons under /history"""
+    query = update.callback_query
+    await query.answer()
+
+    _, direction, seq = query.data.split('_')
+    if direction == "o":
+        text, markup = await _history_page(update.effective_user.id, before=int(seq))
+    else:
+        text, markup = await _history_page(update.effective_user.id, after=int(seq))
+    await query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.archive import Archive
+from utils.database import Database
+from utils.deadlines import DealDeadlines
+from utils.ledger import Ledger
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty data directory with every storage cache reset; config paths are relative"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    Database.invalidate()
+    Database._sqlite = None
+    Database._journals.clear()
+    Archive._index = None
+    Archive._index_read = 0
+    Archive._search_conn = None
+    Ledger._conn = None
+    DealDeadlines._heap = None
+    DealDeadlines._deadlines = {}
+    yield tmp_path
+    for conn in (Archive._search_conn, Ledger._conn):
+        if conn is not None:
+            conn.close()
+    Archive._search_conn = None
+    Ledger._conn = None
+    Database.invalidate()
+    Database._sqlite = None
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from telegram.error import RetryAfter
+from config import BROADCAST_CHECKPOINT_EVERY, BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_FILE
+import utils.broadcast as broadcast_module
+from utils.broadcast import Broadcast
+
+class CountingBot:
+    """Accepts every message; calls stop_after(sent) after each one"""
+
+    def __init__(self, flood_errors: int = 0, stop_after=None):
+        self.sent = []
+        self.flood_errors = flood_errors
+        self.stop_after = stop_after
+
+    async def send_message(self, chat_id=None, **kwargs):
+        await asyncio.sleep(0)  # a real request yields to the other workers
+        if self.flood_errors:
+            self.flood_errors -= 1
+            raise RetryAfter(0)
+        self.sent.append(chat_id)
+        if self.stop_after:
+            self.stop_after(len(self.sent))
+
+    async def edit_message_text(self, *args, **kwargs):
+        return True
+
+def test_flood_control_does_not_fail_recipients(store, monkeypatch):
+    monkeypatch.setattr(broadcast_module, "BROADCAST_RATE", 10000)
+    bot = CountingBot(flood_errors=12)
+
+    async def scenario():
+        broadcast = Broadcast.start(SimpleNamespace(bot=bot), "hi", [1, 2], 1, 1)
+        await broadcast._task
+        return broadcast
+
+    assert asyncio.run(scenario()).counts == {"sent": 2, "failed": 0, "blocked": 0}
+
+def test_restart_resends_at_most_one_checkpoint_of_messages(store, monkeypatch):
+    monkeypatch.setattr(broadcast_module, "BROADCAST_RATE", 10000)
+    recipients = list(range(1000, 1500))
+    application = SimpleNamespace(bot=None)
+
+    on_disk = {}
+
+    async def scenario():
+        def crash(sent):
+            if sent == 222:
+                with open(BROADCAST_PROGRESS_FILE) as f:
+                    on_disk["progress"] = f.read()
+                Broadcast.active._task.cancel()
+        application.bot = bot = CountingBot(stop_after=crash)
+        broadcast = Broadcast.start(application, "hi", recipients, 1, 1)
+        with pytest.raises(asyncio.CancelledError):
+            await broadcast._task
+        # A crash skips the checkpoint the cancelled run writes on the way out
+        with open(BROADCAST_PROGRESS_FILE, 'w') as f:
+            f.write(on_disk["progress"])
+
+        application.bot = resumed_bot = CountingBot()
+        resumed = Broadcast.resume(application)
+        await resumed._task
+        return bot.sent + resumed_bot.sent, resumed
+
+    sent, resumed = asyncio.run(scenario())
+    assert set(sent) == set(recipients)
+    assert len(sent) - len(recipients) <= BROADCAST_CHECKPOINT_EVERY + BROADCAST_CONCURRENCY
+    assert resumed.counts["sent"] == len(recipients)
@@ -0,0 +1,18 @@
+from utils.database import Database
+from utils.deadlines import DealDeadlines
+
+def test_heap_stays_proportional_to_open_deals(store):
+    Database.save_deal("OGESC-D1", {"seller_id": 1, "status": "pending", "price": 10, "fee": 1})
+    DealDeadlines.load()
+    deal = Database.get_deal("OGESC-D1")
+    for updated_at in range(1, 10001):
+        deal["updated_at"] = updated_at
+        DealDeadlines.track("OGESC-D1", deal)
+    assert len(DealDeadlines._heap) <= 2 * len(DealDeadlines._deadlines) + 64
+
+    due = DealDeadlines._pop_due(float("inf"), 100)
+    assert due == ["OGESC-D1"] and not DealDeadlines._deadlines
+
+    deal["status"] = "completed"
+    DealDeadlines.track("OGESC-D1", deal)
+    assert not DealDeadlines._deadlines
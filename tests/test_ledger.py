@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+import bot
+from handlers.escrow import _approve_deal, _confirm_deal
+from utils.database import Database
+
+SELLER_ID, BUYER_ID, DEAL_ID = 1, 2, "OGESC-T1"
+
+@pytest.fixture
+def deal(store):
+    for user_id, balance in ((SELLER_ID, 0), (BUYER_ID, 105)):
+        Database.save_user(user_id, {"username": f"user{user_id}", "balance": balance,
+                                     "completed_deals": 0, "pending_deals": 1})
+    Database.save_deal(DEAL_ID, {"seller_id": SELLER_ID, "buyer_username": f"user{BUYER_ID}",
+                                 "product_name": "item", "price": 100, "fee": 5, "status": "pending"})
+
+def fail_once(monkeypatch, method: str, user_id: int = None):
+    """Make the next Database.<method> call (for user_id, if given) raise OSError"""
+    original = getattr(Database, method).__func__
+
+    def failing(cls, key, record):
+        if user_id is None or key == user_id:
+            monkeypatch.setattr(Database, method, classmethod(original))
+            raise OSError("disk full")
+        return original(cls, key, record)
+    monkeypatch.setattr(Database, method, classmethod(failing))
+
+def restart():
+    Database.invalidate()
+    asyncio.run(bot.reconcile_balances())
+
+@pytest.mark.parametrize("method, user_id", [("save_deal", None), ("save_user", SELLER_ID)])
+@pytest.mark.parametrize("restarted", [True, False])
+def test_failed_confirm_never_pays_twice(deal, monkeypatch, method, user_id, restarted):
+    asyncio.run(_approve_deal(DEAL_ID, BUYER_ID))
+    fail_once(monkeypatch, method, user_id)
+    with pytest.raises(OSError):
+        asyncio.run(_confirm_deal(DEAL_ID, BUYER_ID))
+    if restarted:
+        restart()
+
+    if Database.get_deal(DEAL_ID)["status"] == "in_progress":
+        _, error = asyncio.run(_confirm_deal(DEAL_ID, BUYER_ID))
+        assert error is None
+    restart()
+
+    assert Database.get_deal(DEAL_ID)["status"] == "completed"
+    assert Database.get_user(SELLER_ID)["balance"] == 100
+    assert Database.get_user(BUYER_ID)["balance"] == 0
+
+@pytest.mark.parametrize("restarted", [True, False])
+def test_failed_approve_never_holds_twice(deal, monkeypatch, restarted):
+    fail_once(monkeypatch, "save_deal")
+    with pytest.raises(OSError):
+        asyncio.run(_approve_deal(DEAL_ID, BUYER_ID))
+    if restarted:
+        restart()
+
+    _, error = asyncio.run(_approve_deal(DEAL_ID, BUYER_ID))
+    assert error is None
+    restart()
+    assert Database.get_deal(DEAL_ID)["status"] == "in_progress"
+    assert Database.get_user(BUYER_ID)["balance"] == 0
@@ -0,0 +1,85 @@
+import asyncio
+from telegram import CallbackQuery, Update, User
+from telegram.ext import Application
+import bot
+from benchmarks.stubs import StubBot, make_context, make_update
+from config import MY_DEALS_PAGE_SIZE, PERSISTENCE_FILE
+from handlers.escrow import handle_my_deals_page, my_deals
+from utils.archive import Archive
+from utils.database import Database
+from utils.persistence import SQLitePersistence
+
+SELLER_ID = 100
+
+def make_deals(count: int, status: str) -> dict:
+    deals = {
+        f"OGESC-{status[:2].upper()}{i}": {
+            "seller_id": SELLER_ID, "buyer_username": "buyer", "product_name": f"item {i}",
+            "price": 10, "fee": 1, "status": status
+        }
+        for i in range(count)
+    }
+    Database.save_deals(deals)
+    return deals
+
+def button_data(markup) -> list:
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+def routed_callback(callback_data: str):
+    """The callback bot.py's handlers pick for a button press, as Application.process_update would"""
+    application = Application.builder().token("1:TEST").persistence(SQLitePersistence(PERSISTENCE_FILE)).build()
+    bot.add_handlers(application)
+    user = User(SELLER_ID, "Seller", False, username="seller")
+    update = Update(1, callback_query=CallbackQuery("1", user, "chat", data=callback_data))
+    for handler in application.handlers[0]:
+        if handler.check_update(update) not in (None, False):
+            return handler.callback
+    return None
+
+def test_my_deals_buttons_reach_the_page_handler(store):
+    make_deals(MY_DEALS_PAGE_SIZE + 5, "pending")
+    update = make_update(SELLER_ID, "seller", "/my_deals")
+    asyncio.run(my_deals(update, make_context(StubBot())))
+    next_data, = button_data(update.message.reply_markup)
+
+    assert routed_callback(next_data) is handle_my_deals_page
+
+    update = make_update(SELLER_ID, "seller", callback_data=next_data)
+    asyncio.run(handle_my_deals_page(update, make_context(StubBot())))
+    page = update.callback_query.message.replies[-1]
+    assert f"({MY_DEALS_PAGE_SIZE + 1}-{MY_DEALS_PAGE_SIZE + 5} of {MY_DEALS_PAGE_SIZE + 5})" in page
+    assert routed_callback(button_data(update.callback_query.message.reply_markup)[0]) is handle_my_deals_page
+
+def test_my_deals_lists_archived_deals(store):
+    make_deals(3, "pending")
+    finished = make_deals(4, "completed")
+    Archive.write({deal_id: Database.get_deal(deal_id) for deal_id in finished})
+    Database.delete_deals(list(finished))
+
+    deals, total = Database.participant_deals(SELLER_ID, "seller", 0, MY_DEALS_PAGE_SIZE)
+    assert total == 7
+    assert [deal["status"] for _, _, deal in deals] == ["pending"] * 3 + ["completed"] * 4
+    assert {deal_id for _, deal_id, _ in deals[3:]} == set(finished)
+
+    deals, total = Database.participant_deals(SELLER_ID, "seller", 5, MY_DEALS_PAGE_SIZE)
+    assert len(deals) == 2 and all(deal.get("archived") for _, _, deal in deals)
+
+def test_my_deals_keyset_paging_continues_into_the_archive(store):
+    make_deals(MY_DEALS_PAGE_SIZE + 2, "pending")
+    finished = make_deals(4, "completed")
+    Archive.write({deal_id: Database.get_deal(deal_id) for deal_id in finished})
+    Database.delete_deals(list(finished))
+
+    first, _ = Database.participant_deals(SELLER_ID, "seller", 0, MY_DEALS_PAGE_SIZE)
+    role, anchor, _ = first[-1]
+    second, total = Database.participant_deals(
+        SELLER_ID, "seller", MY_DEALS_PAGE_SIZE, MY_DEALS_PAGE_SIZE, after=(role, anchor)
+    )
+    by_offset, _ = Database.participant_deals(SELLER_ID, "seller", MY_DEALS_PAGE_SIZE, MY_DEALS_PAGE_SIZE)
+    assert total == MY_DEALS_PAGE_SIZE + 6
+    assert [deal_id for _, deal_id, _ in second] == [deal_id for _, deal_id, _ in by_offset]
+    assert sum(1 for _, _, deal in second if deal.get("archived")) == 4
+
+    role, anchor, _ = second[0]
+    back, _ = Database.participant_deals(SELLER_ID, "seller", 0, MY_DEALS_PAGE_SIZE, before=(role, anchor))
+    assert [deal_id for _, deal_id, _ in back] == [deal_id for _, deal_id, _ in first]
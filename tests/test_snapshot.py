@@ -0,0 +1,22 @@
+import json
+from utils.snapshot import SnapshotRecords, write_snapshot
+
+def test_rewrite_copies_untouched_records_and_lookups(tmp_path, monkeypatch):
+    first, second = str(tmp_path / "a.snap"), str(tmp_path / "b.snap")
+    write_snapshot(first, {str(i): {"username": f"User{i}"} for i in range(100)}, "username")
+    records = SnapshotRecords(first, "username")
+    records["5"] = {"username": "Renamed"}
+    records["new"] = {"username": "Newcomer"}
+    del records["7"]
+
+    decoded = []
+    monkeypatch.setattr(json, "loads", lambda raw, **kwargs: decoded.append(raw))
+    write_snapshot(second, records, "username")
+    monkeypatch.undo()
+    assert decoded == []
+
+    rewritten = SnapshotRecords(second, "username")
+    assert len(rewritten) == 100
+    assert rewritten.lookup("renamed") == "5" and rewritten.lookup("user5") is None
+    assert rewritten.lookup("NEWCOMER") == "new" and rewritten.lookup("user7") is None
+    assert rewritten.lookup("user42") == "42" and rewritten["42"] == {"username": "User42"}
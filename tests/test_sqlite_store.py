@@ -0,0 +1,18 @@
+import threading
+import pytest
+from config import USERS_FILE
+from utils.sqlite_store import SQLiteStore
+
+def test_transaction_does_not_take_in_other_threads_writes(tmp_path):
+    store = SQLiteStore(str(tmp_path / "escrow.db"))
+    other = threading.Thread(target=store.put, args=(USERS_FILE, "2", {"balance": 2}))
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.put(USERS_FILE, "1", {"balance": 1})
+            # Blocks on the write lock until this transaction ends
+            other.start()
+            other.join(0.2)
+            raise RuntimeError("rolled back")
+    other.join()
+    assert store.get(USERS_FILE, "1") == {}
+    assert store.get(USERS_FILE, "2") == {"balance": 2}
@@ -0,0 +1,32 @@
+import asyncio
+from telegram import Message, Update, User, Chat
+from utils.update_processor import PerUserUpdateProcessor
+
+def update_from(user_id: int) -> Update:
+    user = User(user_id, "User", False)
+    return Update(user_id, message=Message(1, None, Chat(user_id, "private"), from_user=user))
+
+def test_one_users_burst_does_not_take_every_slot():
+    async def scenario():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        order = []
+
+        async def slow(index):
+            await release.wait()
+            order.append(("busy", index))
+
+        async def quick():
+            order.append(("other", 0))
+
+        busy = [asyncio.create_task(processor.process_update(update_from(1), slow(i))) for i in range(5)]
+        await asyncio.sleep(0)
+        # Only the head of user 1's queue holds a slot, so user 2 still gets one
+        await asyncio.wait_for(processor.process_update(update_from(2), quick()), 1)
+        release.set()
+        await asyncio.gather(*busy)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[0] == ("other", 0)
+    assert order[1:] == [("busy", index) for index in range(5)]
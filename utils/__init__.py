@@ -6,6 +6,7 @@ Contains helper functions and database management utilities.
 from .database import Database
 from .helpers import (
     generate_unique_id,
+    generate_unique_ids,
     calculate_fee,
     format_currency,
     validate_amount
@@ -14,6 +15,7 @@ from .helpers import (
 __all__ = [
     'Database',
     'generate_unique_id',
+    'generate_unique_ids',
     'calculate_fee',
     'format_currency',
     'validate_amount'
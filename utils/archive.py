@@ -0,0 +1,274 @@
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+from config import (
+    ARCHIVE_DIR, ARCHIVE_INDEX_FILE, ARCHIVE_SEARCH_FILE, ARCHIVE_STATUSES, ARCHIVE_GRACE
+)
+from utils.async_database import AsyncDatabase
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+class Archive:
+    """Compressed, append-only cold storage for finished deals.
+
+    Deals are written to one gzip file per month (deals-YYYY-MM.jsonl.gz).
+    Every archive run appends a new gzip member to each partition it
+    touches, so files are never rewritten. index.tsv holds one line per
+    archived deal with its partition, the byte offset of its member and
+    its status; a lookup decompresses only that member. A deal is removed
+    from the hot store only after it and its index line are on disk, so a
+    crash can at worst archive it twice, which is harmless.
+
+    search.db is a SQLite full-text index of the archived deals, so that
+    /search_deals still finds them. write() adds each batch to it, and
+    partitions archived before it existed are indexed when it is created.
+    """
+    # deal id -> (month, member offset, status), loaded on first use
+    _index: Optional[Dict[str, tuple]] = None
+    _index_read = 0  # bytes of index.tsv already loaded
+    _search_conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def _load_index(cls) -> Dict[str, tuple]:
+        """Return the index, first reading any lines another process appended"""
+        if cls._index is None:
+            cls._index = {}
+            cls._index_read = 0
+        try:
+            size = os.path.getsize(ARCHIVE_INDEX_FILE)
+        except FileNotFoundError:
+            return cls._index
+        if size > cls._index_read:
+            with open(ARCHIVE_INDEX_FILE, 'rb') as f:
+                f.seek(cls._index_read)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # still being written; read it next time
+                    cls._index_read += len(raw)
+                    fields = raw.decode().rstrip("\n").split("\t")
+                    if len(fields) == 4:
+                        deal_id, month, offset, status = fields
+                        cls._index[deal_id] = (month, int(offset), status)
+        return cls._index
+
+    @staticmethod
+    def _partition(month: str) -> str:
+        return os.path.join(ARCHIVE_DIR, f"deals-{month}.jsonl.gz")
+
+    @classmethod
+    def statuses(cls) -> Dict[str, str]:
+        """Return the status of every archived deal"""
+        return {deal_id: entry[2] for deal_id, entry in cls._load_index().items()}
+
+    @classmethod
+    def contains(cls, deal_id: str) -> bool:
+        return deal_id in cls._load_index()
+
+    @classmethod
+    def get(cls, deal_id: str) -> dict:
+        entry = cls._load_index().get(deal_id)
+        if not entry:
+            return {}
+        month, offset, _ = entry
+        with open(cls._partition(month), 'rb') as raw:
+            raw.seek(offset)
+            with gzip.GzipFile(fileobj=raw) as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["k"] == deal_id:
+                        return record["v"]
+        return {}
+
+    @classmethod
+    def write(cls, deals: Dict[str, dict]):
+        """Append deals to their month partitions and index them"""
+        by_month: Dict[str, Dict[str, dict]] = {}
+        for deal_id, deal in deals.items():
+            month = time.strftime("%Y-%m", time.gmtime(deal.get("updated_at") or time.time()))
+            by_month.setdefault(month, {})[deal_id] = deal
+
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        index_lines = []
+        for month, batch in sorted(by_month.items()):
+            with open(cls._partition(month), 'ab') as raw:
+                offset = raw.tell()
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    for deal_id, deal in batch.items():
+                        f.write((json.dumps({"k": deal_id, "v": deal}, separators=(',', ':')) + "\n").encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+            index_lines += [f"{deal_id}\t{month}\t{offset}\t{deal.get('status')}\n"
+                            for deal_id, deal in batch.items()]
+
+        with open(ARCHIVE_INDEX_FILE, 'a') as f:
+            f.writelines(index_lines)
+            f.flush()
+            os.fsync(f.fileno())
+        # Lookups pick up the new lines from the file, in this process and others
+
+        # write() runs on its own thread, so it does not share the search connection
+        conn = cls._open_search()
+        try:
+            cls._index_search(conn, deals)
+        finally:
+            conn.close()
+
+    @classmethod
+    def _open_search(cls) -> sqlite3.Connection:
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        conn = sqlite3.connect(ARCHIVE_SEARCH_FILE, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS archived (id TEXT PRIMARY KEY, status TEXT, seller_id INTEGER, "
+            "buyer_username TEXT COLLATE NOCASE, price REAL, product_name TEXT, updated_at INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_archived_seller_status ON archived (seller_id, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_archived_buyer_status ON archived (buyer_username, status)")
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS archived_text USING fts5(text)")
+        # user_version 1: every partition written before the index existed is in it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                indexed = 0
+                for path in sorted(glob.glob(os.path.join(ARCHIVE_DIR, "deals-*.jsonl.gz"))):
+                    with gzip.open(path, 'rb') as f:
+                        batch = {}
+                        for line in f:
+                            record = json.loads(line)
+                            batch[record["k"]] = record["v"]
+                    cls._index_search(conn, batch, transaction=False)
+                    indexed += len(batch)
+                conn.execute("PRAGMA user_version = 1")
+                if indexed:
+                    logger.info("Indexed %d archived deals for search", indexed)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return conn
+
+    @staticmethod
+    def _index_search(conn: sqlite3.Connection, deals: Dict[str, dict], transaction: bool = True):
+        """Add or replace deals in the search index"""
+        if transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            for deal_id, deal in deals.items():
+                old = conn.execute("SELECT rowid FROM archived WHERE id = ?", (deal_id,)).fetchone()
+                if old:
+                    conn.execute("DELETE FROM archived_text WHERE rowid = ?", old)
+                    conn.execute("DELETE FROM archived WHERE rowid = ?", old)
+                cursor = conn.execute(
+                    "INSERT INTO archived (id, status, seller_id, buyer_username, price, product_name, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (deal_id, deal.get("status"), deal.get("seller_id"),
+                     deal.get("buyer_username"), deal.get("price", 0),
+                     deal.get("product_name"), deal.get("updated_at"))
+                )
+                conn.execute(
+                    "INSERT INTO archived_text (rowid, text) VALUES (?, ?)",
+                    (cursor.lastrowid, f"{deal.get('product_name') or ''} {deal.get('product_description') or ''}")
+                )
+        except BaseException:
+            if transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if transaction:
+            conn.execute("COMMIT")
+
+    @classmethod
+    def search(cls, words: List[str], status: Optional[str] = None,
+               price: Tuple[Optional[float], Optional[float]] = (None, None),
+               seller_id: Optional[int] = None, buyer_username: Optional[str] = None,
+               offset: int = 0, limit: int = 10) -> Tuple[List[Tuple[str, dict]], int]:
+        """Return one page of matching archived deals, most recent first, and the total.
+
+        The deals hold only the fields a result line shows, plus "archived": True.
+        """
+        source, conditions, params = "archived a", [], []
+        if words:
+            source = "archived_text t JOIN archived a ON a.rowid = t.rowid"
+            conditions.append("archived_text MATCH ?")
+            params.append(" ".join('"' + word.replace('"', '""') + '"' for word in words))
+        for column, value in (("status", status), ("seller_id", seller_id),
+                              ("buyer_username", buyer_username and buyer_username.lstrip('@'))):
+            if value is not None:
+                conditions.append(f"a.{column} = ?")
+                params.append(value)
+        low, high = price
+        if low is not None:
+            conditions.append("a.price >= ?")
+            params.append(low)
+        if high is not None:
+            conditions.append("a.price <= ?")
+            params.append(high)
+        query = f"FROM {source} WHERE {' AND '.join(conditions) or '1'}"
+        total = cls._search_db().execute(f"SELECT COUNT(*) {query}", params).fetchone()[0]
+        rows = cls._search_db().execute(
+            f"SELECT {cls._SUMMARY} {query} ORDER BY a.updated_at DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset]
+        )
+        return [cls._summary(row) for row in rows], total
+
+    @classmethod
+    def participant_counts(cls, column: str, who) -> Dict[str, int]:
+        """Archived deals per status for a seller_id or buyer_username"""
+        rows = cls._search_db().execute(
+            f"SELECT status, COUNT(*) FROM archived WHERE {column} = ? GROUP BY status", (who,)
+        )
+        return dict(rows.fetchall())
+
+    @classmethod
+    def participant_page(cls, column: str, who, status: str, offset: int, limit: int) -> Dict[str, dict]:
+        """One status's archived deals for a seller_id or buyer_username, last archived first"""
+        rows = cls._search_db().execute(
+            f"SELECT {cls._SUMMARY} FROM archived a WHERE {column} = ? AND status = ? "
+            f"ORDER BY a.rowid DESC LIMIT ? OFFSET ?",
+            (who, status, limit, offset)
+        )
+        return dict(cls._summary(row) for row in rows)
+
+    # Columns read by _summary
+    _SUMMARY = "a.id, a.status, a.seller_id, a.buyer_username, a.price, a.product_name, a.updated_at"
+
+    @staticmethod
+    def _summary(row: tuple) -> Tuple[str, dict]:
+        """(deal id, deal) holding only the fields listings show, plus "archived": True"""
+        fields = ("status", "seller_id", "buyer_username", "price", "product_name", "updated_at")
+        return row[0], dict(zip(fields, row[1:]), archived=True)
+
+    @classmethod
+    def _search_db(cls) -> sqlite3.Connection:
+        if cls._search_conn is None:
+            cls._search_conn = cls._open_search()
+        return cls._search_conn
+
+    @classmethod
+    async def run(cls) -> int:
+        """Move finished deals to cold storage, returning how many moved"""
+        now = time.time()
+
+        # Deals saved before timestamps existed count as old
+        deals = {
+            deal_id: deal
+            for deal_id, deal in (await AsyncDatabase.deals_with_status(list(ARCHIVE_STATUSES))).items()
+            if deal.get("updated_at", 0) <= now - ARCHIVE_GRACE
+        }
+        if not deals:
+            return 0
+        await asyncio.to_thread(cls.write, deals)
+
+        # Skip anything saved again while the archive was being written
+        moved = await AsyncDatabase.run(
+            lambda: [deal_id for deal_id, deal in deals.items() if Database.get_deal(deal_id) == deal]
+        )
+        await AsyncDatabase.delete_deals(moved)
+        return len(moved)
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from utils.database import Database
+from utils.ledger import Ledger
+
+T = TypeVar("T")
+
+class AsyncDatabase:
+    """Awaitable Database API for use on the event loop.
+
+    Every call runs on one dedicated storage thread, so file parsing,
+    rewrites, fsyncs and SQLite queries never block other updates, and
+    calls made through here never overlap each other. Use run() to group
+    several calls into one hop, for example a ledger entry and the save
+    it belongs to.
+
+    Two jobs run on threads of their own because they can take seconds:
+    Database.compact(), which rotates the journals before copying the
+    cache and leaves concurrent saves to the new journal, and
+    Archive.write(), which only touches the archive files. SQLiteStore
+    gives every thread its own connection, so its transactions stay
+    separate as well.
+    """
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+
+    @classmethod
+    async def run(cls, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run func(*args, **kwargs) on the storage thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._executor, functools.partial(func, *args, **kwargs))
+
+    @classmethod
+    def shutdown(cls):
+        """Wait for queued storage work to finish"""
+        cls._executor.shutdown(wait=True)
+
+    @classmethod
+    async def get_user(cls, user_id: int) -> dict:
+        return await cls.run(Database.get_user, user_id)
+
+    @classmethod
+    async def save_user(cls, user_id: int, user_data: dict):
+        await cls.run(Database.save_user, user_id, user_data)
+
+    @classmethod
+    async def save_users(cls, users: Dict[int, dict]):
+        await cls.run(Database.save_users, users)
+
+    @classmethod
+    async def find_user_id(cls, username: str) -> Optional[int]:
+        return await cls.run(Database.find_user_id, username)
+
+    @classmethod
+    async def user_ids(cls) -> List[int]:
+        return await cls.run(Database.user_ids)
+
+    @classmethod
+    async def get_deal(cls, deal_id: str) -> dict:
+        return await cls.run(Database.get_deal, deal_id)
+
+    @classmethod
+    async def find_deal(cls, deal_id: str) -> dict:
+        return await cls.run(Database.find_deal, deal_id)
+
+    @classmethod
+    async def save_deal(cls, deal_id: str, deal_data: dict):
+        await cls.run(Database.save_deal, deal_id, deal_data)
+
+    @classmethod
+    async def participant_deals(cls, user_id: int, username: Optional[str], offset: int, limit: int,
+                                after: Optional[Tuple[str, str]] = None,
+                                before: Optional[Tuple[str, str]] = None) -> Tuple[List[Tuple[str, str, dict]], int]:
+        return await cls.run(Database.participant_deals, user_id, username, offset, limit, after, before)
+
+    @classmethod
+    async def deals_with_status(cls, statuses: List[str]) -> Dict[str, dict]:
+        return await cls.run(Database.deals_with_status, statuses)
+
+    @classmethod
+    async def delete_deals(cls, deal_ids: List[str]):
+        await cls.run(Database.delete_deals, deal_ids)
+
+    @classmethod
+    async def get_stats(cls) -> dict:
+        return await cls.run(Database.get_stats)
+
+    @classmethod
+    async def allocate_ids(cls, prefix: str, count: int = 1) -> List[str]:
+        return await cls.run(Database.allocate_ids, prefix, count)
+
+    @classmethod
+    async def get_redeem_code(cls, code: str) -> dict:
+        return await cls.run(Database.get_redeem_code, code)
+
+    @classmethod
+    async def save_redeem_codes(cls, codes: Dict[str, dict]):
+        await cls.run(Database.save_redeem_codes, codes)
+
+    @classmethod
+    async def ledger_page(cls, user_id: int, limit: int, before: Optional[int] = None,
+                          after: Optional[int] = None):
+        return await cls.run(Ledger.page, user_id, limit, before=before, after=after)
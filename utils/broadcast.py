@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+from typing import List, Optional
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from config import (
+    BROADCAST_FILE, BROADCAST_PROGRESS_FILE, BROADCAST_RATE,
+    BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL, BROADCAST_CHECKPOINT_EVERY
+)
+
+class TokenBucket:
+    """Async token bucket allowing `rate` acquisitions per second"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = None
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self._updated is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while, e.g. after a RetryAfter"""
+        resume_at = asyncio.get_running_loop().time() + seconds
+        self._paused_until = max(self._paused_until, resume_at)
+        self._tokens = 0
+
+class Broadcast:
+    """A broadcast sent in the background with bounded concurrency.
+
+    The job (text, recipients, status message) is written to BROADCAST_FILE
+    once, and progress is checkpointed to BROADCAST_PROGRESS_FILE after every
+    BROADCAST_CHECKPOINT_EVERY messages. The checkpoint stores the position
+    before which every recipient has been handled and the outcomes already
+    known past it. A restart skips all of those, so it re-sends at most
+    BROADCAST_CHECKPOINT_EVERY + BROADCAST_CONCURRENCY messages.
+    """
+    active: Optional['Broadcast'] = None
+
+    def __init__(self, bot, text: str, recipients: List[int], admin_chat_id: int,
+                 status_message_id: int, position: int = 0, counts: Optional[dict] = None,
+                 finished: Optional[dict] = None):
+        self.bot = bot
+        self.text = text
+        self.recipients = recipients
+        self.admin_chat_id = admin_chat_id
+        self.status_message_id = status_message_id
+        self.position = position
+        self.counts = counts or {"sent": 0, "failed": 0, "blocked": 0}
+        self._next = position
+        # Outcomes of recipients past `position`, counted once it reaches them
+        self._finished = finished or {}
+        self._unsaved = 0  # outcomes since the last checkpoint
+        self._bucket = TokenBucket(BROADCAST_RATE)
+        self._task = None
+
+    @classmethod
+    def start(cls, application, text: str, recipients: List[int],
+              admin_chat_id: int, status_message_id: int) -> 'Broadcast':
+        broadcast = cls(application.bot, text, recipients, admin_chat_id, status_message_id)
+        with open(BROADCAST_FILE, 'w') as f:
+            json.dump({
+                "text": text,
+                "recipients": recipients,
+                "admin_chat_id": admin_chat_id,
+                "status_message_id": status_message_id
+            }, f)
+        broadcast._checkpoint()
+        broadcast._launch()
+        return broadcast
+
+    @classmethod
+    def resume(cls, application) -> Optional['Broadcast']:
+        """Continue a broadcast that was interrupted by a restart"""
+        if not os.path.exists(BROADCAST_FILE):
+            return None
+        with open(BROADCAST_FILE, 'r') as f:
+            job = json.load(f)
+        progress = {"position": 0, "counts": None}
+        if os.path.exists(BROADCAST_PROGRESS_FILE):
+            with open(BROADCAST_PROGRESS_FILE, 'r') as f:
+                progress = json.load(f)
+        finished = {int(index): outcome for index, outcome in progress.get("finished", {}).items()}
+        broadcast = cls(
+            application.bot, job["text"], job["recipients"], job["admin_chat_id"],
+            job["status_message_id"], progress["position"], progress["counts"], finished
+        )
+        broadcast._launch()
+        return broadcast
+
+    def _launch(self):
+        # Not Application.create_task: stopping the bot must not wait for
+        # the broadcast to finish, it is checkpointed and resumed instead
+        Broadcast.active = self
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Cancel the broadcast, keeping its checkpoint for resume()"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        Broadcast.active = None
+
+    def _checkpoint(self):
+        tmp_path = BROADCAST_PROGRESS_FILE + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"position": self.position, "counts": self.counts, "finished": self._finished}, f)
+        os.replace(tmp_path, BROADCAST_PROGRESS_FILE)
+        self._unsaved = 0
+
+    def progress_text(self, done: bool = False) -> str:
+        handled = sum(self.counts.values())
+        header = "✅ <b>Broadcast finished</b>" if done else "📢 <b>Broadcast in progress</b>"
+        return (
+            f"{header}\n\n"
+            f"Progress: {handled}/{len(self.recipients)}\n"
+            f"Sent: {self.counts['sent']}\n"
+            f"Failed: {self.counts['failed']}\n"
+            f"Blocked: {self.counts['blocked']}"
+        )
+
+    async def _report(self, done: bool = False):
+        try:
+            await self.bot.edit_message_text(
+                self.progress_text(done),
+                chat_id=self.admin_chat_id,
+                message_id=self.status_message_id,
+                parse_mode='HTML'
+            )
+        except TelegramError:
+            pass
+
+    async def _send(self, chat_id: int) -> str:
+        attempt = 0
+        while attempt < 5:
+            await self._bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"📢 <b>Broadcast Message</b>\n\n{self.text}",
+                    parse_mode='HTML'
+                )
+                return "sent"
+            except RetryAfter as e:
+                # Flood control delays the broadcast; it does not use up an attempt
+                self._bucket.pause(e.retry_after)
+            except Forbidden:
+                return "blocked"
+            except BadRequest:
+                # A subclass of NetworkError, but retrying will not help
+                return "failed"
+            except NetworkError:
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+            except TelegramError:
+                return "failed"
+        return "failed"
+
+    async def _worker(self):
+        while self._next < len(self.recipients):
+            index = self._next
+            self._next += 1
+            # Recipients handled before a restart are in the checkpoint already
+            if index not in self._finished:
+                self._finished[index] = await self._send(self.recipients[index])
+                self._unsaved += 1
+            while self.position in self._finished:
+                self.counts[self._finished.pop(self.position)] += 1
+                self.position += 1
+            if self._unsaved >= BROADCAST_CHECKPOINT_EVERY:
+                self._checkpoint()
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            await self._report()
+
+    async def run(self):
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(BROADCAST_CONCURRENCY)))
+        finally:
+            reporter.cancel()
+            self._checkpoint()
+            # Keep the files of a failed run for resume, but allow a new broadcast
+            Broadcast.active = None
+        os.remove(BROADCAST_FILE)
+        os.remove(BROADCAST_PROGRESS_FILE)
+        await self._report(done=True)
@@ -1,50 +1,593 @@
 import json
 import os
-from typing import Dict, List, Union
-from config import USERS_FILE, DEALS_FILE, REDEEM_CODES_FILE
+import secrets
+import time
+from contextlib import nullcontext
+from itertools import islice
+from typing import Dict, List, Optional, Tuple, Union
+from config import (
+    USERS_FILE, DEALS_FILE, REDEEM_CODES_FILE, STATS_FILE, STORAGE_BACKEND, SQLITE_FILE,
+    JOURNAL_MODE, SNAPSHOT_MODE, SNAPSHOT_LOOKUP_FIELDS
+)
+from utils.journal import Journal
+from utils.metrics import record_db
+
+# Deal statuses whose price and fee are held in escrow
+ESCROW_HELD_STATUSES = ("in_progress",)
+
+# Order in which a participant's deals are listed, open deals first
+DEAL_STATUS_ORDER = ("pending", "in_progress", "completed", "declined", "expired", "refunded")
 
 class Database:
-    @staticmethod
-    def load_data(file_path: str) -> dict:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        return {}
+    """Record storage for users, deals and redeem codes.
+
+    With the default JSON backend each data file is parsed once, on first
+    access, and kept in memory. Reads are served from the cache and every
+    save updates the cache before writing the file, so the cache never holds
+    data that is not on disk. Call invalidate() after editing the files
+    outside the bot.
+
+    In JOURNAL_MODE saves append a single line to the file's journal
+    instead of rewriting it, and compact() folds the journals back into
+    the files. Loading a file replays its journal on top of it.
+
+    In SNAPSHOT_MODE each file is kept as a binary snapshot instead
+    (utils.snapshot): loading it maps the file without parsing it and
+    records are decoded as they are first read, so startup does not slow
+    down as the files grow. Snapshot mode turns on JOURNAL_MODE, so saves
+    append to the journal and only compact() rewrites the snapshot, copying
+    the records that were not changed without decoding them.
+
+    With STORAGE_BACKEND = "sqlite" the same methods go to an indexed SQLite
+    database instead and nothing is cached here.
+
+    save_user and save_deal also keep the counters returned by get_stats()
+    up to date and store them with the data. Run rebuild_stats() after
+    editing users or deals outside the bot.
+
+    Finished deals are moved out of the deals store by utils.archive;
+    find_deal() also looks them up there.
+
+    participant_deals() pages through one user's deals, archived ones
+    included. The JSON backend keeps an index from seller id and buyer
+    username to live deal ids per status, built on first use and updated
+    by every deal save, and does the same for utils.search.
+    """
+    _cache: Dict[str, dict] = {}
+    _sqlite = None
+    _journals: Dict[str, Journal] = {}
+    # Lower-cased username -> users.json key, built on first lookup
+    _username_index: Optional[Dict[str, str]] = None
+    # "seller:<id>" or "buyer:<username>" -> status -> deal ids (as dict keys), oldest first
+    _participant_index: Optional[Dict[str, Dict[str, Dict[str, None]]]] = None
+
+    @classmethod
+    def _sql(cls):
+        """Return the SQLite store, or None when the JSON backend is in use"""
+        if STORAGE_BACKEND != "sqlite":
+            return None
+        if cls._sqlite is None:
+            from utils.sqlite_store import SQLiteStore
+            cls._sqlite = SQLiteStore(SQLITE_FILE)
+        return cls._sqlite
 
     @staticmethod
-    def save_data(file_path: str, data: dict):
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=4)
+    def _read_file(file_path: str) -> dict:
+        if SNAPSHOT_MODE:
+            from utils.snapshot import SnapshotRecords, snapshot_path
+            if os.path.exists(snapshot_path(file_path)):
+                return SnapshotRecords(snapshot_path(file_path), SNAPSHOT_LOOKUP_FIELDS.get(file_path))
+        if not os.path.exists(file_path):
+            return {}
+        started = time.perf_counter()
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        record_db("read", os.path.basename(file_path), started, os.path.getsize(file_path))
+        return data
+
+    @classmethod
+    def _write_file(cls, file_path: str, data: dict):
+        started = time.perf_counter()
+        if SNAPSHOT_MODE:
+            from utils.snapshot import SnapshotRecords, snapshot_path, write_snapshot
+            path = snapshot_path(file_path)
+            size = write_snapshot(path, data, SNAPSHOT_LOOKUP_FIELDS.get(file_path))
+            # Serve the cache from the new file so changed records need not stay in memory
+            cached = cls._cache.get(file_path)
+            if isinstance(cached, SnapshotRecords) and isinstance(data, SnapshotRecords):
+                cached.rebase(path, data)
+            elif cached is not None and cached is data:
+                cls._cache[file_path] = SnapshotRecords(path, SNAPSHOT_LOOKUP_FIELDS.get(file_path))
+            record_db("write", os.path.basename(path), started, size)
+            return
+        # Write a temporary file and swap it in so a crash never leaves half a file
+        payload = json.dumps(data, indent=4)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        record_db("write", os.path.basename(file_path), started, len(payload))
+
+    @classmethod
+    def load_data(cls, file_path: str) -> dict:
+        """Return the cached contents of a data file, loading it on first use"""
+        if cls._sql():
+            return cls._sql().load_table(file_path)
+        if file_path not in cls._cache:
+            data = cls._read_file(file_path)
+            if JOURNAL_MODE:
+                journal = cls._journals.setdefault(file_path, Journal(file_path))
+                journal.replay(data)
+                if journal.has_rotated():
+                    # Finish a compaction that was interrupted
+                    cls._write_file(file_path, data)
+                    journal.drop_rotated()
+            cls._cache[file_path] = data
+        return cls._cache[file_path]
+
+    @classmethod
+    def save_data(cls, file_path: str, data: dict):
+        """Replace the contents of a data file"""
+        if cls._sql():
+            cls._sql().replace_table(file_path, data)
+        elif JOURNAL_MODE:
+            cls._cache[file_path] = data
+            journal = cls._journals.setdefault(file_path, Journal(file_path))
+            journal.rotate()
+            cls._write_file(file_path, data)
+            journal.drop_rotated()
+        else:
+            cls._cache[file_path] = data
+            cls._write_file(file_path, data)
+        if file_path == USERS_FILE:
+            cls._username_index = None
+        if file_path == DEALS_FILE:
+            cls._participant_index = None
+            from utils.search import DealSearch
+            DealSearch.invalidate()
+        if file_path in (USERS_FILE, DEALS_FILE):
+            cls.rebuild_stats()
+
+    @classmethod
+    def invalidate(cls, file_path: Optional[str] = None):
+        """Drop cached data so the next read goes back to disk"""
+        if file_path is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(file_path, None)
+        if file_path in (None, USERS_FILE):
+            cls._username_index = None
+        if file_path in (None, DEALS_FILE):
+            cls._participant_index = None
+            from utils.search import DealSearch
+            DealSearch.invalidate()
+
+    @classmethod
+    def _get_record(cls, file_path: str, key: str) -> dict:
+        if cls._sql():
+            return cls._sql().get(file_path, key)
+        # Hand out copies so callers cannot change the cache without saving
+        return dict(cls.load_data(file_path).get(key, {}))
+
+    @classmethod
+    def _save_record(cls, file_path: str, key: str, record: dict):
+        if cls._sql():
+            cls._sql().put(file_path, key, record)
+            return
+        data = cls.load_data(file_path)
+        data[key] = dict(record)
+        if JOURNAL_MODE:
+            cls._journals[file_path].append(key, data[key])
+        else:
+            cls._write_file(file_path, data)
+
+    @classmethod
+    def _save_records(cls, file_path: str, records: Dict[str, dict]):
+        """Save many records with one write of the file, journal or database"""
+        if cls._sql():
+            cls._sql().put_many(file_path, records)
+            return
+        data = cls.load_data(file_path)
+        for key, record in records.items():
+            data[key] = dict(record)
+        if JOURNAL_MODE:
+            cls._journals[file_path].append_many({key: data[key] for key in records})
+        else:
+            cls._write_file(file_path, data)
+
+    @classmethod
+    def _peek(cls, file_path: str, key: str) -> Optional[dict]:
+        """Return the stored record without copying it, or None"""
+        if cls._sql():
+            return cls._sql().get(file_path, key) or None
+        return cls.load_data(file_path).get(key)
+
+    @classmethod
+    def _transaction(cls):
+        """Group writes that must land together; a no-op for the JSON files"""
+        return cls._sql().transaction() if cls._sql() else nullcontext()
+
+    @classmethod
+    def compact(cls):
+        """Fold every journal into a fresh snapshot of its data file.
+
+        Safe to run from a worker thread: the journal is rotated before the
+        cache is copied, so a concurrent save lands in the copy, the new
+        journal, or both, and replaying a record twice is harmless.
+        """
+        for file_path, journal in list(cls._journals.items()):
+            if file_path not in cls._cache or not journal.rotate():
+                continue
+            snapshot = cls._cache[file_path].copy()
+            cls._write_file(file_path, snapshot)
+            journal.drop_rotated()
 
     @classmethod
     def get_user(cls, user_id: int) -> dict:
-        users = cls.load_data(USERS_FILE)
-        return users.get(str(user_id), {})
+        return cls._get_record(USERS_FILE, str(user_id))
 
     @classmethod
     def save_user(cls, user_id: int, user_data: dict):
-        users = cls.load_data(USERS_FILE)
-        users[str(user_id)] = user_data
-        cls.save_data(USERS_FILE, users)
+        key = str(user_id)
+        with cls._transaction():
+            old = cls._peek(USERS_FILE, key)
+            # Read the counters first: if they have to be rebuilt, the
+            # rebuild must not already include this save
+            stats = cls.get_stats() if old is None and key != "example_format" else None
+            if not cls._sql() and cls._username_index is not None:
+                old_name = ((old or {}).get("username") or "").lower()
+                if cls._username_index.get(old_name) == key:
+                    del cls._username_index[old_name]
+                if user_data.get("username"):
+                    cls._username_index[user_data["username"].lower()] = key
+            cls._save_record(USERS_FILE, key, user_data)
+            if stats is not None:
+                stats["users"] += 1
+                cls._save_record(STATS_FILE, "counters", stats)
+
+    @classmethod
+    def save_users(cls, users: Dict[int, dict]):
+        """Save several users in one write"""
+        records = {str(user_id): user_data for user_id, user_data in users.items()}
+        with cls._transaction():
+            stats = cls.get_stats()
+            added = 0
+            for key, user_data in records.items():
+                old = cls._peek(USERS_FILE, key)
+                if not cls._sql() and cls._username_index is not None:
+                    old_name = ((old or {}).get("username") or "").lower()
+                    if cls._username_index.get(old_name) == key:
+                        del cls._username_index[old_name]
+                    if user_data.get("username"):
+                        cls._username_index[user_data["username"].lower()] = key
+                if old is None and key != "example_format":
+                    added += 1
+            cls._save_records(USERS_FILE, records)
+            if added:
+                stats["users"] += added
+                cls._save_record(STATS_FILE, "counters", stats)
+
+    @classmethod
+    def _usernames(cls) -> Dict[str, str]:
+        if cls._username_index is None:
+            cls._username_index = {}
+            for key, user in cls.load_data(USERS_FILE).items():
+                if key != "example_format" and isinstance(user, dict) and user.get("username"):
+                    cls._username_index[user["username"].lower()] = key
+        return cls._username_index
+
+    @classmethod
+    def find_user_id(cls, username: str) -> Optional[int]:
+        """Return the id of the user with this username, ignoring case and a leading @"""
+        username = username.lstrip('@')
+        if not username:
+            return None
+        if cls._sql():
+            key = cls._sql().find_key(USERS_FILE, "username", username)
+        elif SNAPSHOT_MODE and hasattr(cls.load_data(USERS_FILE), "lookup"):
+            key = cls.load_data(USERS_FILE).lookup(username)
+        else:
+            key = cls._usernames().get(username.lower())
+        return int(key) if key and key != "example_format" else None
+
+    @classmethod
+    def user_ids(cls) -> List[int]:
+        """Return the ids of all registered users"""
+        if cls._sql():
+            keys = cls._sql().keys(USERS_FILE)
+        else:
+            keys = cls.load_data(USERS_FILE).keys()
+        return [int(key) for key in keys if key != "example_format"]
 
     @classmethod
     def get_deal(cls, deal_id: str) -> dict:
-        deals = cls.load_data(DEALS_FILE)
-        return deals.get(deal_id, {})
+        return cls._get_record(DEALS_FILE, deal_id)
+
+    @classmethod
+    def find_deal(cls, deal_id: str) -> dict:
+        """Like get_deal, but also returns archived deals"""
+        deal = cls.get_deal(deal_id)
+        if not deal:
+            from utils.archive import Archive
+            deal = Archive.get(deal_id)
+        return deal
 
     @classmethod
     def save_deal(cls, deal_id: str, deal_data: dict):
+        deal_data["updated_at"] = int(time.time())
+        with cls._transaction():
+            old = cls._peek(DEALS_FILE, deal_id)
+            stats = cls.get_stats() if deal_id != "example_format" else None
+            cls._reindex_deal(deal_id, old, deal_data)
+            cls._save_record(DEALS_FILE, deal_id, deal_data)
+            if stats is not None:
+                cls._count_deal(stats, old, -1)
+                cls._count_deal(stats, deal_data, 1)
+                if old is None:
+                    stats["deals"] += 1
+                cls._save_record(STATS_FILE, "counters", stats)
+        from utils.deadlines import DealDeadlines
+        DealDeadlines.track(deal_id, deal_data)
+
+    @classmethod
+    def save_deals(cls, deals: Dict[str, dict]):
+        """Save several deals in one write"""
+        now = int(time.time())
+        with cls._transaction():
+            stats = cls.get_stats()
+            for deal_id, deal_data in deals.items():
+                deal_data["updated_at"] = now
+                old = cls._peek(DEALS_FILE, deal_id)
+                cls._reindex_deal(deal_id, old, deal_data)
+                cls._count_deal(stats, old, -1)
+                cls._count_deal(stats, deal_data, 1)
+                if old is None:
+                    stats["deals"] += 1
+            cls._save_records(DEALS_FILE, deals)
+            cls._save_record(STATS_FILE, "counters", stats)
+        from utils.deadlines import DealDeadlines
+        for deal_id, deal_data in deals.items():
+            DealDeadlines.track(deal_id, deal_data)
+
+    @classmethod
+    def deals_with_status(cls, statuses: List[str]) -> Dict[str, dict]:
+        """Return copies of the stored deals whose status is one of statuses"""
+        if cls._sql():
+            return cls._sql().find_records(DEALS_FILE, "status", statuses)
+        return {
+            key: dict(deal) for key, deal in cls.load_data(DEALS_FILE).items()
+            if key != "example_format" and isinstance(deal, dict) and deal.get("status") in statuses
+        }
+
+    @classmethod
+    def delete_deals(cls, deal_ids: List[str]):
+        """Remove deals from the store; the counters still include them"""
+        if not deal_ids:
+            return
+        if cls._sql():
+            cls._sql().delete(DEALS_FILE, deal_ids)
+            return
+        data = cls.load_data(DEALS_FILE)
+        for deal_id in deal_ids:
+            cls._reindex_deal(deal_id, data.pop(deal_id, None), None)
+            if JOURNAL_MODE:
+                cls._journals[DEALS_FILE].append(deal_id, None)
+        if not JOURNAL_MODE:
+            cls._write_file(DEALS_FILE, data)
+
+    @staticmethod
+    def _participant_keys(deal: dict) -> List[str]:
+        keys = [f"seller:{deal.get('seller_id')}"]
+        if deal.get("buyer_username"):
+            keys.append(f"buyer:{deal['buyer_username'].lower()}")
+        return keys
+
+    @classmethod
+    def _reindex_deal(cls, deal_id: str, old: Optional[dict], new: Optional[dict]):
+        """Update the in-memory participant and search indexes; JSON backend only"""
+        from utils.search import DealSearch
+        DealSearch.update(deal_id, new)
+        if cls._participant_index is None or deal_id == "example_format":
+            return
+        old_entries = [(key, old.get("status")) for key in cls._participant_keys(old)] if old else []
+        new_entries = [(key, new.get("status")) for key in cls._participant_keys(new)] if new else []
+        if old_entries == new_entries:
+            return
+        for key, status in old_entries:
+            ids = cls._participant_index.get(key, {}).get(status)
+            if ids is not None:
+                ids.pop(deal_id, None)
+        for key, status in new_entries:
+            cls._participant_index.setdefault(key, {}).setdefault(status, {})[deal_id] = None
+
+    @classmethod
+    def _participants(cls) -> Dict[str, Dict[str, Dict[str, None]]]:
+        if cls._participant_index is None:
+            cls._participant_index = {}
+            for key, deal in cls.load_data(DEALS_FILE).items():
+                if isinstance(deal, dict):
+                    cls._reindex_deal(key, None, deal)
+        return cls._participant_index
+
+    @classmethod
+    def participant_deals(cls, user_id: int, username: Optional[str], offset: int, limit: int,
+                          after: Optional[Tuple[str, str]] = None,
+                          before: Optional[Tuple[str, str]] = None) -> Tuple[List[Tuple[str, str, dict]], int]:
+        """Return one page of the deals a user sells or buys, and how many there are.
+
+        Deals are grouped by DEAL_STATUS_ORDER, most recent first within a
+        group, and returned as (role, deal id, deal). Only the group sizes
+        and the deals on the page are read, so the cost depends on the
+        user's own deals, not on the size of the store. With SQLite, after
+        (or before) gives the (role, deal id) just above (or below) the
+        wanted page, which is then read by rowid instead of skipping offset
+        rows; the offset is used when that deal has since changed status.
+
+        Archived deals come from the archive's index (Archive.participant_counts
+        and participant_page), after the live deals of the same status, and
+        hold only the fields a listing shows.
+        """
+        from utils.archive import Archive
+        roles = [("seller", user_id)]
+        if username:
+            roles.append(("buyer", username.lstrip('@')))
+        groups = []
+        for role, who in roles:
+            column = "seller_id" if role == "seller" else "buyer_username"
+            if cls._sql():
+                counts = cls._sql().count_by(DEALS_FILE, column, who, "status")
+            else:
+                counts = {status: len(ids) for status, ids in
+                          cls._participants().get(f"{role}:{str(who).lower()}", {}).items()}
+            groups += [(status, role, who, count, False) for status, count in counts.items() if count]
+            groups += [(status, role, who, count, True)
+                       for status, count in Archive.participant_counts(column, who).items()]
+        rank = {status: position for position, status in enumerate(DEAL_STATUS_ORDER)}
+        groups.sort(key=lambda group: (rank.get(group[0], len(rank)), group[0], group[1] == "buyer", group[4]))
+        total = sum(group[3] for group in groups)
+
+        if cls._sql() and (after or before):
+            page = cls._keyset_page(groups, limit, after, before)
+            if page is not None:
+                return page, total
+
+        page: List[Tuple[str, str, dict]] = []
+        skip = offset
+        for status, role, who, count, archived in groups:
+            if len(page) >= limit:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            take = min(count - skip, limit - len(page))
+            column = "seller_id" if role == "seller" else "buyer_username"
+            if archived:
+                records = Archive.participant_page(column, who, status, skip, take)
+            elif cls._sql():
+                records = cls._sql().find_page(DEALS_FILE, {column: who, "status": status}, take + skip)
+                records = dict(list(records.items())[skip:])
+            else:
+                ids = cls._participants()[f"{role}:{str(who).lower()}"][status]
+                records = {deal_id: cls.get_deal(deal_id) for deal_id in islice(reversed(ids), skip, skip + take)}
+            page += [(role, deal_id, deal) for deal_id, deal in records.items()]
+            skip = 0
+        return page, total
+
+    @classmethod
+    def _keyset_page(cls, groups: List[tuple], limit: int, after: Optional[Tuple[str, str]],
+                     before: Optional[Tuple[str, str]]) -> Optional[List[Tuple[str, str, dict]]]:
+        """The page next to the anchor deal, or None if it is no longer where it was.
+
+        Only live deals can be anchors; the archived groups are read by offset.
+        """
+        from utils.archive import Archive
+        anchor_role, anchor = after or before
+        status = cls._sql().get(DEALS_FILE, anchor).get("status")
+        position = next((index for index, group in enumerate(groups)
+                         if group[0] == status and group[1] == anchor_role and not group[4]), None)
+        if position is None:
+            return None
+
+        page: List[Tuple[str, str, dict]] = []
+        step = 1 if after else -1
+        index, key = position, anchor
+        while 0 <= index < len(groups) and len(page) < limit:
+            status, role, who, count, archived = groups[index]
+            column = "seller_id" if role == "seller" else "buyer_username"
+            where = {column: who, "status": status}
+            if archived:
+                take = min(count, limit - len(page))
+                records = Archive.participant_page(column, who, status, 0 if after else count - take, take)
+                found = [(role, deal_id, record) for deal_id, record in records.items()]
+                page = page + found if after else found + page
+            elif after:
+                records = cls._sql().find_page(DEALS_FILE, where, limit - len(page), after=key)
+                page += [(role, deal_id, record) for deal_id, record in records.items()]
+            else:
+                records = cls._sql().find_page(DEALS_FILE, where, limit - len(page), before=key,
+                                               oldest=key is None)
+                page = [(role, deal_id, record) for deal_id, record in records.items()] + page
+            index, key = index + step, None
+        return page
+
+    @staticmethod
+    def _count_deal(stats: dict, deal: Optional[dict], sign: int):
+        """Add (sign=1) or remove (sign=-1) a deal's share of the status counters"""
+        if not deal:
+            return
+        by_status = stats["deals_by_status"]
+        status = deal.get("status")
+        by_status[status] = by_status.get(status, 0) + sign
+        if not by_status[status]:
+            del by_status[status]
+        if status in ESCROW_HELD_STATUSES:
+            held = deal.get("price", 0) + deal.get("fee", 0)
+            stats["escrow_held"] = round(stats["escrow_held"] + sign * held, 2)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        """Return the counters: users, deals, deals_by_status and escrow_held"""
+        stats = cls._get_record(STATS_FILE, "counters")
+        if not stats:
+            stats = cls.rebuild_stats()
+        stats["deals_by_status"] = dict(stats["deals_by_status"])
+        return stats
+
+    @classmethod
+    def rebuild_stats(cls) -> dict:
+        """Recount everything with one pass over users, deals and the archive index"""
+        from utils.archive import Archive
+        stats = {"users": 0, "deals": 0, "deals_by_status": {}, "escrow_held": 0.0}
+        stats["users"] = len(cls.user_ids())
         deals = cls.load_data(DEALS_FILE)
-        deals[deal_id] = deal_data
-        cls.save_data(DEALS_FILE, deals)
+        for key, deal in deals.items():
+            if key != "example_format" and isinstance(deal, dict):
+                stats["deals"] += 1
+                cls._count_deal(stats, deal, 1)
+        for key, status in Archive.statuses().items():
+            if key not in deals:
+                stats["deals"] += 1
+                cls._count_deal(stats, {"status": status}, 1)
+        cls._save_record(STATS_FILE, "counters", stats)
+        return dict(stats)
+
+    @classmethod
+    def allocate_ids(cls, prefix: str, count: int = 1) -> List[str]:
+        """Reserve count new ids that no deal or redeem code uses yet.
+
+        Ids come from a per-prefix counter stored with the stats, so each
+        allocation costs one counter write plus an index lookup per id to
+        skip ids handed out before the counter existed.
+        """
+        from utils.archive import Archive
+        from utils.ids import IdSequence
+        ids = []
+        with cls._transaction():
+            state = cls._get_record(STATS_FILE, "ids") or {"key": secrets.token_hex(16), "next": {}}
+            sequence = IdSequence(prefix, bytes.fromhex(state["key"]))
+            counter = state["next"].get(prefix, 0)
+            while len(ids) < count:
+                candidate = sequence.id_for(counter)
+                counter += 1
+                if (cls._peek(DEALS_FILE, candidate) is None
+                        and cls._peek(REDEEM_CODES_FILE, candidate) is None
+                        and not Archive.contains(candidate)):
+                    ids.append(candidate)
+            state["next"] = dict(state["next"], **{prefix: counter})
+            cls._save_record(STATS_FILE, "ids", state)
+        return ids
 
     @classmethod
     def get_redeem_code(cls, code: str) -> dict:
-        codes = cls.load_data(REDEEM_CODES_FILE)
-        return codes.get(code, {})
+        return cls._get_record(REDEEM_CODES_FILE, code)
 
     @classmethod
     def save_redeem_code(cls, code: str, code_data: dict):
-        codes = cls.load_data(REDEEM_CODES_FILE)
-        codes[code] = code_data
-        cls.save_data(REDEEM_CODES_FILE, codes)
+        cls._save_record(REDEEM_CODES_FILE, code, code_data)
+
+    @classmethod
+    def save_redeem_codes(cls, codes: Dict[str, dict]):
+        """Save several redeem codes in one write"""
+        cls._save_records(REDEEM_CODES_FILE, codes)
@@ -0,0 +1,168 @@
+import heapq
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from config import (
+    DEAL_PENDING_TIMEOUT, DEAL_DELIVERY_TIMEOUT, DEADLINE_SWEEP_BATCH, DEADLINE_RESCAN_INTERVAL,
+    WORKER_INDEX
+)
+from utils.async_database import AsyncDatabase
+from utils.database import Database
+from utils.ledger import Ledger
+from utils.locks import locks
+
+logger = logging.getLogger(__name__)
+
+class DealDeadlines:
+    """Deadlines of all open deals in one heap, swept in batches.
+
+    A pending deal expires DEAL_PENDING_TIMEOUT after it was last saved. An
+    approved deal whose product is not delivered within DEAL_DELIVERY_TIMEOUT
+    is cancelled and the buyer refunded. A save that moves a deal's deadline
+    pushes the new one; superseded heap entries are skipped when popped,
+    and the heap is rebuilt from the current deadlines once they outnumber
+    them. Due deals are re-read under their locks before anything changes. The heap
+    is only touched on the storage thread and is filled by load() on the
+    first sweep; other worker processes' deals are picked up by a reload
+    every DEADLINE_RESCAN_INTERVAL. Open deals saved before updated_at
+    existed are re-saved by load(), so their clock starts then.
+    """
+    _heap: Optional[List[Tuple[float, str]]] = None
+    _deadlines: Dict[str, float] = {}
+    _loaded_at = 0.0
+
+    @staticmethod
+    def deadline(deal: dict) -> Optional[Tuple[float, str]]:
+        """Return (due time, "expire" or "refund") for an open deal, else None"""
+        if deal.get("status") == "pending" and deal.get("updated_at"):
+            return deal["updated_at"] + DEAL_PENDING_TIMEOUT, "expire"
+        if deal.get("status") == "in_progress" and not deal.get("product_delivered"):
+            approved_at = deal.get("approved_at") or deal.get("updated_at")
+            if approved_at:
+                return approved_at + DEAL_DELIVERY_TIMEOUT, "refund"
+        return None
+
+    @classmethod
+    def track(cls, deal_id: str, deal: dict):
+        """Record a deal's deadline after it was saved; a no-op until load()"""
+        if cls._heap is None:
+            return
+        entry = cls.deadline(deal)
+        due = entry[0] if entry else None
+        if cls._deadlines.get(deal_id) == due:
+            return
+        if due is None:
+            del cls._deadlines[deal_id]
+        else:
+            cls._deadlines[deal_id] = due
+            heapq.heappush(cls._heap, (due, deal_id))
+        # Keep the heap proportional to the open deals, not to the saves
+        if len(cls._heap) > 2 * len(cls._deadlines) + 64:
+            cls._rebuild()
+
+    @classmethod
+    def _rebuild(cls):
+        cls._heap = [(due, deal_id) for deal_id, due in cls._deadlines.items()]
+        heapq.heapify(cls._heap)
+
+    @classmethod
+    def load(cls):
+        """Rebuild the heap from the open deals in the store"""
+        deals = Database.deals_with_status(["pending", "in_progress"])
+        unstamped = {deal_id: deal for deal_id, deal in deals.items() if not deal.get("updated_at")}
+        if unstamped:
+            # save_deals stamps updated_at (in place), which starts the deadline
+            Database.save_deals(unstamped)
+            logger.info("Started deadlines for %d deals saved before updated_at existed", len(unstamped))
+        cls._deadlines = {}
+        for deal_id, deal in deals.items():
+            entry = cls.deadline(deal)
+            if entry:
+                cls._deadlines[deal_id] = entry[0]
+        cls._rebuild()
+        cls._loaded_at = time.time()
+
+    @classmethod
+    def _pop_due(cls, now: float, limit: int) -> List[str]:
+        if cls._heap is None or (WORKER_INDEX is not None
+                                 and now - cls._loaded_at > DEADLINE_RESCAN_INTERVAL):
+            cls.load()
+        due = []
+        while cls._heap and cls._heap[0][0] <= now and len(due) < limit:
+            when, deal_id = heapq.heappop(cls._heap)
+            if cls._deadlines.get(deal_id) == when:
+                del cls._deadlines[deal_id]
+                due.append(deal_id)
+        return due
+
+    @classmethod
+    def _due_deals(cls, deal_ids: List[str], now: float) -> Dict[str, dict]:
+        """Re-read deals popped from the heap and keep those still due"""
+        deals = {}
+        for deal_id in deal_ids:
+            deal = Database.get_deal(deal_id)
+            entry = cls.deadline(deal)
+            if entry is None:
+                continue
+            if entry[0] > now:
+                # Saved by another process since the heap was loaded
+                cls.track(deal_id, deal)
+            elif entry[1] == "refund" and deal.get("buyer_id") is None:
+                logger.warning("Deal %s is overdue but predates buyer_id; refund it by hand", deal_id)
+            else:
+                deals[deal_id] = deal
+        return deals
+
+    @staticmethod
+    def _apply(deals: Dict[str, dict]):
+        """Expire or refund every deal in one batch of ledger entries and saves"""
+        users: Dict[int, dict] = {}
+        changes = []
+        for deal_id, deal in deals.items():
+            if deal["status"] == "pending":
+                deal["status"] = "expired"
+                continue
+            buyer_id = deal["buyer_id"]
+            if buyer_id not in users:
+                users[buyer_id] = Database.get_user(buyer_id)
+            buyer = users[buyer_id]
+            amount = deal["price"] + deal["fee"]
+            deal["status"] = "refunded"
+            if Ledger.find("escrow_refund", deal_id):
+                # A sweep whose saves failed already refunded it; apply that entry
+                Ledger.repair(buyer_id, buyer)
+                continue
+            buyer["balance"] += amount
+            # Each entry needs the balance right after it, even for repeat buyers
+            changes.append((buyer_id, {"balance": buyer["balance"]}, amount, "escrow_refund", deal_id))
+        if changes:
+            Ledger.record_many(changes)
+            for buyer_id, snapshot, *_ in changes:
+                users[buyer_id]["ledger_seq"] = snapshot["ledger_seq"]
+        # Deals first: a refunded deal is never refunded again, and its buyer is restored from the ledger
+        Database.save_deals(deals)
+        if users:
+            Database.save_users(users)
+
+    @classmethod
+    async def sweep(cls, notify: Callable[[str, dict], None]) -> int:
+        """Apply every deadline that has passed, returning how many deals changed.
+
+        notify(deal_id, deal) is called for each deal after its batch is saved.
+        """
+        changed = 0
+        while True:
+            now = time.time()
+            due = await AsyncDatabase.run(cls._pop_due, now, DEADLINE_SWEEP_BATCH)
+            if not due:
+                return changed
+            async with locks.hold(*(f"deal:{deal_id}" for deal_id in due)):
+                deals = await AsyncDatabase.run(cls._due_deals, due, now)
+                buyers = {deal["buyer_id"] for deal in deals.values() if deal["status"] == "in_progress"}
+                async with locks.hold(*(f"user:{buyer_id}" for buyer_id in buyers)):
+                    await AsyncDatabase.run(cls._apply, deals)
+            changed += len(deals)
+            for deal_id, deal in deals.items():
+                notify(deal_id, deal)
+            if len(due) < DEADLINE_SWEEP_BATCH:
+                return changed
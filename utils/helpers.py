@@ -1,12 +1,14 @@
-import random
-import string
+from typing import List
 from config import ESCROW_ID_PREFIX, REDEEM_CODE_PREFIX
+from utils.database import Database
 
-def generate_unique_id(prefix: str, length: int = 5) -> str:
+def generate_unique_id(prefix: str) -> str:
     """Generate a unique ID with the given prefix"""
-    chars = string.ascii_uppercase + string.digits
-    random_str = ''.join(random.choices(chars, k=length))
-    return f"{prefix}{random_str}"
+    return Database.allocate_ids(prefix)[0]
+
+def generate_unique_ids(prefix: str, count: int) -> List[str]:
+    """Generate count unique IDs with the given prefix in one allocation"""
+    return Database.allocate_ids(prefix, count)
 
 def calculate_fee(amount: float, percentage: float) -> float:
     """Calculate fee based on percentage"""
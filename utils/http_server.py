@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+class Request:
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers  # lower-cased names
+        self.body = body
+
+class Response:
+    def __init__(self, status: int = 200, body: bytes = b"",
+                 content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+class HTTPServer:
+    """Minimal asyncio HTTP/1.1 server for the bot's local endpoints.
+
+    Supports Content-Length bodies and keep-alive, which is all Telegram
+    webhooks and metric scrapers need, without pulling in a web framework.
+    """
+
+    def __init__(self, host: str, port: int, max_body: int = 1 << 20):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._fallback: Optional[Handler] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    def route(self, method: str, path: str, handler: Handler):
+        self._routes[(method, path)] = handler
+
+    def fallback(self, handler: Handler):
+        """Handle every request that matches no route"""
+        self._fallback = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        if not self.port:
+            # Port 0 picks a free port; report the real one
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop accepting connections and close idle keep-alive connections"""
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    await self._write(writer, request, keep_alive=False)
+                    break
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # The loop is shutting down with a request still in progress (a long poll)
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return Response(400, b"Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            return Response(400, b"Invalid Content-Length")
+        if length > self.max_body:
+            return Response(413, b"Payload too large")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method, target, headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path), self._fallback)
+        if handler is None:
+            known_path = any(path == request.path for _, path in self._routes)
+            return Response(405 if known_path else 404, b"")
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Error handling %s %s", request.method, request.path)
+            return Response(500, b"Internal error")
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        reason = REASONS.get(response.status, "Error")
+        head = (
+            f"HTTP/1.1 {response.status} {reason}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
+        await writer.drain()
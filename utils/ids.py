@@ -0,0 +1,47 @@
+import hashlib
+import string
+
+ALPHABET = string.ascii_uppercase + string.digits
+
+class IdSequence:
+    """Maps counter values 0, 1, 2, ... to distinct, unguessable-looking ids.
+
+    The counter is run through a keyed Feistel permutation of the
+    len(ALPHABET) ** length id space and the result is written in base 36,
+    so two counter values can never give the same id and consecutive ids
+    look unrelated. Values the permutation maps outside the id space are
+    walked forward until they land inside it (cycle walking).
+    """
+    ROUNDS = 4
+
+    def __init__(self, prefix: str, key: bytes, length: int = 5):
+        self.prefix = prefix
+        self.length = length
+        self.size = len(ALPHABET) ** length
+        self._key = hashlib.blake2b(prefix.encode(), key=key, digest_size=32).digest()
+        self._half_bits = ((self.size - 1).bit_length() + 1) // 2
+        self._mask = (1 << self._half_bits) - 1
+
+    def _round(self, number: int, value: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(8, "big"), key=self._key, digest_size=8, salt=number.to_bytes(16, "big")
+        ).digest()
+        return int.from_bytes(digest, "big") & self._mask
+
+    def _permute(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._mask
+        for number in range(self.ROUNDS):
+            left, right = right, left ^ self._round(number, right)
+        return (left << self._half_bits) | right
+
+    def id_for(self, counter: int) -> str:
+        if not 0 <= counter < self.size:
+            raise ValueError(f"All {self.size} ids with prefix {self.prefix} are used up")
+        value = self._permute(counter)
+        while value >= self.size:
+            value = self._permute(value)
+        chars = []
+        for _ in range(self.length):
+            value, digit = divmod(value, len(ALPHABET))
+            chars.append(ALPHABET[digit])
+        return self.prefix + "".join(reversed(chars))
@@ -0,0 +1,60 @@
+import time
+from telegram.ext import CommandHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+from utils.http_server import HTTPServer, Request, Response
+from utils.metrics import API_LATENCY, API_RESPONSES, registry, timed_handler
+
+def _handler_name(handler, prefix: str = "") -> str:
+    if isinstance(handler, CommandHandler):
+        name = "/" + sorted(handler.commands)[0]
+    else:
+        name = getattr(handler.callback, "__name__", type(handler).__name__)
+    return prefix + name
+
+def instrument_handlers(application):
+    """Time every registered handler, including the steps of conversations"""
+    def wrap(handler, prefix: str = ""):
+        if isinstance(handler, ConversationHandler):
+            inner = f"{handler.name or 'conversation'}:"
+            for step in handler.entry_points + handler.fallbacks:
+                wrap(step, inner)
+            for steps in handler.states.values():
+                for step in steps:
+                    wrap(step, inner)
+        else:
+            handler.callback = timed_handler(_handler_name(handler, prefix), handler.callback)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            wrap(handler)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and status of every Bot API call"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            status_code, payload = await super().do_request(url, method, *args, **kwargs)
+            status = str(status_code)
+            return status_code, payload
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, api_method)
+            API_RESPONSES.inc(api_method, status)
+
+class MetricsServer:
+    """Serves registry.render() at GET /metrics"""
+
+    def __init__(self, host: str, port: int):
+        self.server = HTTPServer(host, port)
+        self.server.route("GET", "/metrics", self._metrics)
+
+    async def _metrics(self, request: Request) -> Response:
+        return Response(200, registry.render().encode(), "text/plain; version=0.0.4; charset=utf-8")
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
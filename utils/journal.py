@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+from utils.metrics import record_db
+
+class Journal:
+    """Append-only log of record writes for one JSON data file.
+
+    Each line holds one record as compact JSON. Lines are only ever
+    appended, so a crash can at worst leave a torn last line, which replay()
+    discards. compact() in Database folds the journal into the snapshot file:
+    rotate() moves the live journal aside so new writes keep appending while
+    the snapshot is written, and drop_rotated() removes it afterwards.
+    """
+
+    def __init__(self, file_path: str):
+        self.path = file_path + ".journal"
+        self.rotated_path = file_path + ".journal.1"
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, key: str, record: Optional[dict]):
+        """Record a write, or a deletion when record is None"""
+        self.append_many({key: record})
+
+    def append_many(self, records: Dict[str, Optional[dict]]):
+        """Record several writes or deletions with a single flush"""
+        started = time.perf_counter()
+        lines = "".join(
+            json.dumps({"k": key, "v": record} if record is not None else {"k": key, "d": 1},
+                       separators=(',', ':')) + "\n"
+            for key, record in records.items()
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(lines)
+            self._file.flush()
+        record_db("journal", os.path.basename(self.path), started, len(lines))
+
+    def replay(self, data: dict) -> int:
+        """Apply the rotated and live journals to data, returning the entry count"""
+        applied = 0
+        for path in (self.rotated_path, self.path):
+            if os.path.exists(path):
+                applied += self._replay_file(path, data)
+        return applied
+
+    @staticmethod
+    def _replay_file(path: str, data: dict) -> int:
+        applied = 0
+        good_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn write")
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get("d"):
+                    data.pop(entry["k"], None)
+                else:
+                    data[entry["k"]] = entry["v"]
+                good_size += len(line)
+                applied += 1
+        # Cut off a torn tail so later appends start on a clean line
+        if good_size < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_size)
+        return applied
+
+    def has_rotated(self) -> bool:
+        return os.path.exists(self.rotated_path)
+
+    def rotate(self) -> bool:
+        """Move the live journal aside; returns False if it was empty"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return False
+            if os.path.exists(self.rotated_path):
+                # A previous compaction did not finish; keep its entries
+                with open(self.path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+            return True
+
+    def drop_rotated(self):
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
@@ -0,0 +1,154 @@
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+from config import LEDGER_FILE
+
+class Ledger:
+    """Append-only record of every balance movement.
+
+    Each entry holds the user, the signed amount, the balance right after
+    it, what caused it (kind and a reference such as a deal id or redeem
+    code) and a sequence number. Triggers reject updates and deletes.
+    An entry is written before the user's new balance is saved, and the
+    user record keeps the seq of its latest entry in "ledger_seq". The
+    balance in users.json is therefore a snapshot, and repair() adds the
+    entries after it to recover the true balance if the bot stopped
+    between the two writes. bot.py does that at startup for every
+    user with entries after the last reconciled seq (see unreconciled()).
+
+    Escrow entries are written at most once per deal and kind: a transition
+    retried after a failed save finds its entry with find() and applies it
+    with repair() instead of moving the money again.
+    """
+    _conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def _db(cls) -> sqlite3.Connection:
+        if cls._conn is None:
+            conn = sqlite3.connect(LEDGER_FILE, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                "amount REAL NOT NULL, balance REAL NOT NULL, kind TEXT NOT NULL, "
+                "ref TEXT, created_at INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (user_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_ref ON ledger (ref, kind)")
+            conn.execute("CREATE TABLE IF NOT EXISTS ledger_meta (name TEXT PRIMARY KEY, value INTEGER)")
+            for action in ("UPDATE", "DELETE"):
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS ledger_no_{action.lower()} BEFORE {action} ON ledger "
+                    "BEGIN SELECT RAISE(ABORT, 'ledger entries are immutable'); END"
+                )
+            cls._conn = conn
+        return cls._conn
+
+    @classmethod
+    def record(cls, user_id: int, user_data: dict, amount: float, kind: str, ref: str = None) -> int:
+        """Log a change of amount that was just applied to user_data["balance"].
+
+        Call before saving user_data; it stores the entry's seq in the record.
+        """
+        cursor = cls._db().execute(
+            "INSERT INTO ledger (user_id, amount, balance, kind, ref, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, amount, user_data["balance"], kind, ref, int(time.time()))
+        )
+        user_data["ledger_seq"] = cursor.lastrowid
+        return cursor.lastrowid
+
+    @classmethod
+    def record_many(cls, changes: List[Tuple[int, dict, float, str, Optional[str]]]):
+        """record() for several (user_id, user_data, amount, kind, ref) in one transaction"""
+        conn = cls._db()
+        now = int(time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, user_data, amount, kind, ref in changes:
+                cursor = conn.execute(
+                    "INSERT INTO ledger (user_id, amount, balance, kind, ref, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (user_id, amount, user_data["balance"], kind, ref, now)
+                )
+                user_data["ledger_seq"] = cursor.lastrowid
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _entry(row: Tuple) -> dict:
+        seq, amount, balance, kind, ref, created_at = row
+        return {"seq": seq, "amount": amount, "balance": balance, "kind": kind,
+                "ref": ref, "created_at": created_at}
+
+    @classmethod
+    def page(cls, user_id: int, limit: int, before: Optional[int] = None,
+             after: Optional[int] = None) -> Tuple[List[dict], bool, bool]:
+        """Return up to limit entries newest first, plus whether older and newer ones exist.
+
+        before/after are seq numbers from a previous page; each page is one
+        index range scan, so the cost does not grow with the user's history.
+        """
+        columns = "seq, amount, balance, kind, ref, created_at"
+        if after is not None:
+            rows = cls._db().execute(
+                f"SELECT {columns} FROM ledger WHERE user_id = ? AND seq > ? ORDER BY seq ASC LIMIT ?",
+                (user_id, after, limit + 1)
+            ).fetchall()
+            has_newer = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+            has_older = True
+        else:
+            rows = cls._db().execute(
+                f"SELECT {columns} FROM ledger WHERE user_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (user_id, before if before is not None else 2 ** 63 - 1, limit + 1)
+            ).fetchall()
+            has_older = len(rows) > limit
+            rows = rows[:limit]
+            has_newer = before is not None
+        return [cls._entry(row) for row in rows], has_older, has_newer
+
+    @classmethod
+    def repair(cls, user_id: int, user_data: dict) -> bool:
+        """Apply the entries after user_data["ledger_seq"] to its balance; False if there are none"""
+        tail, seq = cls._db().execute(
+            "SELECT COALESCE(SUM(amount), 0), MAX(seq) FROM ledger WHERE user_id = ? AND seq > ?",
+            (user_id, user_data.get("ledger_seq", 0))
+        ).fetchone()
+        if seq is None:
+            return False
+        user_data["balance"] = round(user_data.get("balance", 0) + tail, 2)
+        user_data["ledger_seq"] = seq
+        return True
+
+    @classmethod
+    def find(cls, kind: str, ref: str) -> Optional[dict]:
+        """The first entry of a kind for a reference, e.g. the escrow release of a deal"""
+        row = cls._db().execute(
+            "SELECT seq, amount, balance, kind, ref, created_at FROM ledger "
+            "WHERE ref = ? AND kind = ? ORDER BY seq LIMIT 1",
+            (ref, kind)
+        ).fetchone()
+        return cls._entry(row) if row else None
+
+    @classmethod
+    def unreconciled(cls) -> Tuple[Dict[int, int], int]:
+        """Return {user_id: latest seq} for users with entries after the reconciled mark,
+        and the highest seq seen"""
+        conn = cls._db()
+        row = conn.execute("SELECT value FROM ledger_meta WHERE name = 'reconciled_seq'").fetchone()
+        mark = row[0] if row else 0
+        users = dict(conn.execute(
+            "SELECT user_id, MAX(seq) FROM ledger WHERE seq > ? GROUP BY user_id", (mark,)
+        ).fetchall())
+        return users, max(users.values(), default=mark)
+
+    @classmethod
+    def mark_reconciled(cls, seq: int):
+        cls._db().execute(
+            "INSERT INTO ledger_meta (name, value) VALUES ('reconciled_seq', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+            (seq,)
+        )
@@ -0,0 +1,90 @@
+import asyncio
+import errno
+import fcntl
+import hashlib
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from config import LOCK_FILE, WORKER_INDEX
+
+class LockManager:
+    """Async locks keyed by entity, such as "user:123" or "deal:OGESC-XXXXX".
+
+    Handlers that read, change and save a record hold its lock for the whole
+    read-modify-write so concurrent updates cannot interleave. Locks are
+    created on demand and dropped once nobody holds or waits for them.
+
+    With a lock_file the locks also hold across processes: after the local
+    lock, the holder takes a one-byte fcntl lock in that file at an offset
+    derived from the key. The kernel drops these locks when a process dies,
+    so a crashed worker cannot leave a record locked.
+    """
+
+    def __init__(self, lock_file: Optional[str] = None):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refs: Dict[str, int] = {}
+        self.lock_file = lock_file
+        self._fd: Optional[int] = None
+
+    @asynccontextmanager
+    async def hold(self, *keys: str, shared: bool = True):
+        """Hold the locks for all keys, taken in sorted order to avoid deadlocks.
+
+        shared=False keeps them within this process, for keys that only one
+        process ever uses.
+        """
+        held = []
+        file_held = []
+        try:
+            for key in sorted(set(keys)):
+                lock = self._locks.setdefault(key, asyncio.Lock())
+                self._refs[key] = self._refs.get(key, 0) + 1
+                try:
+                    await lock.acquire()
+                except BaseException:
+                    self._unref(key)
+                    raise
+                held.append(key)
+                if shared and self.lock_file:
+                    await self._lock_range(key)
+                    file_held.append(key)
+            yield
+        finally:
+            for key in reversed(held):
+                if key in file_held:
+                    self._unlock_range(key)
+                self._locks[key].release()
+                self._unref(key)
+
+    def _unref(self, key: str):
+        self._refs[key] -= 1
+        if not self._refs[key]:
+            del self._refs[key]
+            del self._locks[key]
+
+    @staticmethod
+    def _offset(key: str) -> int:
+        # 63 bits keeps the offset a valid off_t; collisions only cause extra waiting
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") >> 1
+
+    async def _lock_range(self, key: str):
+        if self._fd is None:
+            self._fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        offset = self._offset(key)
+        delay = 0.001
+        # fcntl locks would block the event loop, so poll without blocking
+        while True:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _unlock_range(self, key: str):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset(key))
+
+# Workers started by the supervisor share their locks through LOCK_FILE
+locks = LockManager(LOCK_FILE if WORKER_INDEX is not None else None)
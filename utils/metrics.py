@@ -0,0 +1,142 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[labels] = self._sums.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    label_text = _format_labels(self.labelnames, labels, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {self._sums[labels]}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.histogram(
+    "escrow_handler_duration_seconds", "Time spent in each command and callback handler", ["handler"]
+)
+HANDLER_ERRORS = registry.counter(
+    "escrow_handler_errors_total", "Handler calls that raised an exception", ["handler"]
+)
+DB_OPERATIONS = registry.counter(
+    "escrow_db_operations_total", "Storage reads and writes", ["operation", "store"]
+)
+DB_BYTES = registry.counter(
+    "escrow_db_bytes_total", "Bytes read from or written to storage", ["operation", "store"]
+)
+DB_LATENCY = registry.histogram(
+    "escrow_db_operation_duration_seconds", "Time spent in storage reads and writes",
+    ["operation", "store"]
+)
+API_LATENCY = registry.histogram(
+    "escrow_bot_api_duration_seconds", "Outbound Bot API request latency", ["method"]
+)
+API_RESPONSES = registry.counter(
+    "escrow_bot_api_responses_total", "Outbound Bot API responses by HTTP status", ["method", "status"]
+)
+OUTBOX_MESSAGES = registry.counter(
+    "escrow_outbox_messages_total", "Queued notifications by outcome", ["result"]
+)
+
+def record_db(operation: str, store: str, started: float, size: int = 0):
+    """Record one storage operation that began at time.perf_counter() == started"""
+    DB_LATENCY.observe(time.perf_counter() - started, operation, store)
+    DB_OPERATIONS.inc(operation, store)
+    if size:
+        DB_BYTES.inc(operation, store, amount=size)
+
+def timed_handler(name: str, callback):
+    """Wrap a handler callback so its latency and errors are recorded"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            result = callback(update, context)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
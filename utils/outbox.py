@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from config import (
+    OUTBOX_RATE, OUTBOX_CHAT_INTERVAL, OUTBOX_CONCURRENCY, OUTBOX_MAX_ATTEMPTS, WORKERS, WORKER_INDEX
+)
+from utils.broadcast import TokenBucket
+from utils.metrics import OUTBOX_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+class OutboundMessage:
+    def __init__(self, chat_id: int, text: str, key: str, kwargs: dict):
+        self.chat_id = chat_id
+        self.text = text
+        self.key = key
+        self.kwargs = kwargs
+        self.attempts = 0
+
+class Outbox:
+    """Background queue for notifications to deal parties.
+
+    send() returns at once, so a handler finishes its state change without
+    waiting on Telegram. Messages to one chat go out in order and at most one
+    per OUTBOX_CHAT_INTERVAL; all chats together share a TokenBucket of
+    OUTBOX_RATE. A RetryAfter pauses the bucket, network errors are retried
+    with backoff up to OUTBOX_MAX_ATTEMPTS, and blocked or unknown chats are
+    dropped. A message with the same key as one still queued for that chat
+    replaces it instead of being sent twice.
+    """
+
+    def __init__(self):
+        self.bot = None
+        # Each worker sends its own shard's notifications, so share the rate
+        self._bucket = TokenBucket(OUTBOX_RATE / WORKERS if WORKER_INDEX is not None else OUTBOX_RATE)
+        self._chats: Dict[int, Deque[OutboundMessage]] = {}
+        self._queued: Dict[Tuple[int, str], OutboundMessage] = {}
+        self._last_sent: Dict[int, float] = {}
+        # Chats waiting in _ready or being sent to; each is handled by one worker at a time
+        self._scheduled: Set[int] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self, bot):
+        self.bot = bot
+        self._ready = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(OUTBOX_CONCURRENCY)]
+        for chat_id in self._chats:
+            self._schedule(chat_id)
+
+    async def stop(self, timeout: float = 10):
+        """Give queued messages a chance to go out, then stop the workers"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d unsent notifications", len(self._queued))
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def send(self, chat_id: int, text: str, key: Optional[str] = None, **kwargs):
+        """Queue a send_message(chat_id, text, **kwargs); key defaults to the text"""
+        key = key or text
+        queued = self._queued.get((chat_id, key))
+        if queued:
+            queued.text, queued.kwargs = text, kwargs
+            OUTBOX_MESSAGES.inc("coalesced")
+            return
+        message = OutboundMessage(chat_id, text, key, kwargs)
+        self._queued[(chat_id, key)] = message
+        self._chats.setdefault(chat_id, deque()).append(message)
+        self._idle.clear()
+        self._schedule(chat_id)
+
+    def _schedule(self, chat_id: int, delay: float = 0):
+        if chat_id in self._scheduled or self._ready is None:
+            return
+        self._scheduled.add(chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self._ready.get()
+            wait = self._last_sent.get(chat_id, 0) + OUTBOX_CHAT_INTERVAL - loop.time()
+            if wait > 0:
+                # Too soon for this chat; free the worker and come back later
+                self._scheduled.discard(chat_id)
+                self._schedule(chat_id, wait)
+                continue
+
+            message = self._chats[chat_id][0]
+            # Once sending starts the text is fixed; a new duplicate queues behind it
+            if self._queued.get((chat_id, message.key)) is message:
+                del self._queued[(chat_id, message.key)]
+            retry_in = await self._deliver(message)
+            self._last_sent[chat_id] = loop.time()
+            self._scheduled.discard(chat_id)
+            if retry_in is None:
+                self._chats[chat_id].popleft()
+            if self._chats[chat_id]:
+                self._schedule(chat_id, retry_in or OUTBOX_CHAT_INTERVAL)
+            else:
+                del self._chats[chat_id]
+                loop.call_later(OUTBOX_CHAT_INTERVAL, self._forget, chat_id)
+                if not self._chats:
+                    self._idle.set()
+
+    def _forget(self, chat_id: int):
+        if chat_id not in self._chats:
+            self._last_sent.pop(chat_id, None)
+
+    async def _deliver(self, message: OutboundMessage) -> Optional[float]:
+        """Try to send once; return seconds until a retry, or None when done with it"""
+        await self._bucket.acquire()
+        message.attempts += 1
+        try:
+            await self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+            OUTBOX_MESSAGES.inc("sent")
+            return None
+        except RetryAfter as e:
+            self._bucket.pause(e.retry_after)
+            message.attempts -= 1
+            return e.retry_after
+        except (Forbidden, BadRequest) as e:
+            logger.info("Dropping notification to %s: %s", message.chat_id, e)
+            OUTBOX_MESSAGES.inc("rejected")
+            return None
+        except (NetworkError, TelegramError) as e:
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                logger.warning("Giving up on notification to %s: %s", message.chat_id, e)
+                OUTBOX_MESSAGES.inc("failed")
+                return None
+            return 2 ** message.attempts
+        except Exception:
+            logger.exception("Dropping notification to %s", message.chat_id)
+            OUTBOX_MESSAGES.inc("failed")
+            return None
+
+outbox = Outbox()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import sqlite3
+from typing import Dict, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+from config import PERSISTENCE_FILE, PERSISTENCE_INTERVAL
+
+class SQLitePersistence(BasePersistence):
+    """Application persistence that writes only the entries that changed.
+
+    Keeps user_data, chat_data, bot_data and conversation states in SQLite,
+    one row per user, chat or conversation key. The Application reports
+    changed entries every PERSISTENCE_INTERVAL seconds; each one is encoded
+    once and marked dirty, and all dirty rows are written in a single
+    transaction right after the batch. Nothing is re-serialised as a whole.
+    """
+
+    def __init__(self, path: str = PERSISTENCE_FILE, update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval
+        )
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Worker processes share this file; wait for each other's batches
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        # (kind, key) -> encoded value, or None to delete the row
+        self._dirty: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_scheduled = False
+
+    def _load(self, kind: str) -> Dict[str, object]:
+        rows = self.conn.execute("SELECT key, data FROM state WHERE kind = ?", (kind,))
+        return {key: json.loads(data) for key, data in rows}
+
+    def _mark(self, kind: str, key, value):
+        self._dirty[(kind, str(key))] = None if value is None else json.dumps(value)
+        if not self._flush_scheduled:
+            # Runs once the Application has reported the whole batch
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._write_dirty)
+
+    def _write_dirty(self):
+        self._flush_scheduled = False
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        self.conn.execute("BEGIN")
+        try:
+            for (kind, key), data in dirty.items():
+                if data is None:
+                    self.conn.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, key))
+                else:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO state (kind, key, data) VALUES (?, ?, ?)",
+                        (kind, key, data)
+                    )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in self._load("user_data").items()}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in self._load("chat_data").items()}
+
+    async def get_bot_data(self) -> dict:
+        return self._load("bot_data").get("bot", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        states = self._load(f"conversation:{name}")
+        return {tuple(json.loads(key)): state for key, state in states.items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        self._mark(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._mark("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._mark("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: dict):
+        self._mark("bot_data", "bot", data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._mark("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark("chat_data", chat_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        self._write_dirty()
+        self.conn.close()
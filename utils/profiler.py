@@ -0,0 +1,114 @@
+import asyncio
+import linecache
+import selectors
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Tuple
+
+class Profiler:
+    """Runs one CPU or memory profile at a time inside the live bot.
+
+    cpu() samples the stack of every thread (the event loop and any worker
+    threads) at a fixed interval from a background thread, so the code
+    being profiled is never instrumented. memory() traces allocations with
+    tracemalloc for the duration and reports where the memory still held
+    at the end was allocated. Both return a short text summary and a full
+    report to send as a file.
+    """
+    running = False
+
+    @classmethod
+    async def cpu(cls, seconds: float, interval: float, top: int = 15) -> Tuple[str, bytes]:
+        cls._begin()
+        try:
+            stacks, samples = await asyncio.to_thread(cls._sample, seconds, interval)
+        finally:
+            cls.running = False
+
+        own = Counter()
+        total = Counter()
+        idle = 0
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            # A thread blocked in select() or on a lock is waiting, not working
+            if selectors.__file__ in stack[-1] or threading.__file__ in stack[-1]:
+                idle += count
+                continue
+            for frame in set(stack):
+                total[frame] += count
+
+        lines = [f"CPU profile: {samples} samples over {seconds:g}s", "", "Top functions (own time):"]
+        for frame, count in own.most_common(top):
+            lines.append(f"{count / samples:6.1%}  {frame}")
+        lines += ["", f"Waiting: {idle / samples:.1%}", "Top functions while busy (including callees):"]
+        for frame, count in total.most_common(top):
+            lines.append(f"{count / samples:6.1%}  {frame}")
+
+        # Collapsed stacks, one per line, as read by flamegraph.pl and speedscope
+        folded = "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common())
+        return "\n".join(lines), folded.encode()
+
+    @staticmethod
+    def _sample(seconds: float, interval: float) -> Tuple[Counter, int]:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, max(samples, 1)
+
+    @classmethod
+    async def memory(cls, seconds: float, top: int = 15) -> Tuple[str, bytes]:
+        cls._begin()
+        already_tracing = tracemalloc.is_tracing()
+        try:
+            if not already_tracing:
+                tracemalloc.start(25)
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+            cls.running = False
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+        ))
+        lines = [
+            f"Memory profile over {seconds:g}s: {current / 1024:.1f} KiB held, "
+            f"peak {peak / 1024:.1f} KiB", "", "Top allocation sites:"
+        ]
+        for stat in snapshot.statistics("lineno")[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:9.1f} KiB {stat.count:7}  {frame.filename}:{frame.lineno}")
+
+        report = []
+        for stat in snapshot.statistics("traceback")[:100]:
+            report.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            report.extend(stat.traceback.format())
+            report.append("")
+        return "\n".join(lines), "\n".join(report).encode()
+
+    @classmethod
+    def _begin(cls):
+        if cls.running:
+            raise RuntimeError("A profile is already running")
+        cls.running = True
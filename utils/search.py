@@ -0,0 +1,153 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+from config import DEALS_FILE
+from utils.database import Database
+
+FILTERS = ("status", "price", "seller", "buyer")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words, split the way SQLite's default FTS5 tokenizer does"""
+    return re.findall(r"\w+", text.lower())
+
+def parse_query(text: str) -> Tuple[List[str], Dict[str, str]]:
+    """Split "red phone status:pending price:100-500" into words and filters.
+
+    Raises ValueError for an unknown filter or a malformed price range.
+    """
+    words, filters = [], {}
+    for part in text.split():
+        name, sep, value = part.partition(":")
+        if sep and name.lower() in FILTERS and value:
+            filters[name.lower()] = value
+        elif sep and name.isalpha() and value:
+            raise ValueError(f"Unknown filter {name}:")
+        else:
+            words += tokenize(part)
+    if "price" in filters and not re.fullmatch(r"\d*(\.\d+)?-?\d*(\.\d+)?", filters["price"]):
+        raise ValueError("Price must look like 500, 100-500, 100- or -500")
+    return words, filters
+
+def price_range(value: str) -> Tuple[Optional[float], Optional[float]]:
+    low, sep, high = value.partition("-")
+    if not sep:
+        return float(low), float(low)
+    return (float(low) if low else None), (float(high) if high else None)
+
+class DealSearch:
+    """Keyword and filter search over the deals in the store.
+
+    With the SQLite backend the store keeps a full-text index of product
+    names and descriptions. For the JSON files this class keeps the
+    equivalent in memory: word -> ids of deals containing it, built on
+    first search and updated through Database on every deal save. A query
+    intersects the posting sets of its words, smallest first, and only
+    then applies the status, price and participant filters, so its cost
+    follows the rarest word rather than the number of deals. Queries
+    without words use the participant index when they name a seller or
+    buyer, and otherwise read every deal.
+
+    Deals moved to the archive are searched in its own index (Archive.search)
+    and listed after all the matching live deals.
+    """
+    _index: Optional[Dict[str, Set[str]]] = None
+    _words: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _deal_words(deal: dict) -> Set[str]:
+        return set(tokenize(f"{deal.get('product_name') or ''} {deal.get('product_description') or ''}"))
+
+    @classmethod
+    def update(cls, deal_id: str, deal: Optional[dict]):
+        """Re-index a saved deal, or drop a deleted one (deal=None); JSON only"""
+        if cls._index is None or deal_id == "example_format":
+            return
+        new_words = cls._deal_words(deal) if deal else set()
+        old_words = cls._words.pop(deal_id, set())
+        for word in old_words - new_words:
+            postings = cls._index[word]
+            postings.discard(deal_id)
+            if not postings:
+                del cls._index[word]
+        for word in new_words - old_words:
+            cls._index.setdefault(word, set()).add(deal_id)
+        if new_words:
+            cls._words[deal_id] = new_words
+
+    @classmethod
+    def _load(cls) -> Dict[str, Set[str]]:
+        if cls._index is None:
+            cls._index, cls._words = {}, {}
+            for deal_id, deal in Database.load_data(DEALS_FILE).items():
+                if isinstance(deal, dict):
+                    cls.update(deal_id, deal)
+        return cls._index
+
+    @classmethod
+    def invalidate(cls):
+        cls._index = None
+        cls._words = {}
+
+    @classmethod
+    def search(cls, words: List[str], status: Optional[str] = None,
+               price: Tuple[Optional[float], Optional[float]] = (None, None),
+               seller_id: Optional[int] = None, buyer_username: Optional[str] = None,
+               offset: int = 0, limit: int = 10) -> Tuple[List[Tuple[str, dict]], int]:
+        """Return one page of matching (deal id, deal), live deals first, and the total.
+
+        Archived deals carry "archived": True and only the fields a result shows.
+        """
+        from utils.archive import Archive
+        live, live_total = cls._search_live(words, status, price, seller_id, buyer_username, offset, limit)
+        archived, archived_total = Archive.search(
+            words, status, price, seller_id, buyer_username,
+            offset=max(0, offset - live_total), limit=limit - len(live)
+        )
+        return live + archived, live_total + archived_total
+
+    @classmethod
+    def _search_live(cls, words: List[str], status: Optional[str],
+                     price: Tuple[Optional[float], Optional[float]], seller_id: Optional[int],
+                     buyer_username: Optional[str], offset: int, limit: int) -> Tuple[List[Tuple[str, dict]], int]:
+        """One page of matching deals in the store, most recently saved first, and the total"""
+        where = {}
+        if status:
+            where["status"] = status
+        if seller_id is not None:
+            where["seller_id"] = seller_id
+        if buyer_username:
+            where["buyer_username"] = buyer_username.lstrip('@')
+        if Database._sql():
+            records, total = Database._sql().search(
+                DEALS_FILE, words, where, {"price": price}, limit, offset
+            )
+            return list(records.items()), total
+
+        deals = Database.load_data(DEALS_FILE)
+        if words:
+            index = cls._load()
+            postings = sorted((index.get(word, set()) for word in set(words)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        elif seller_id is not None or buyer_username:
+            participants = Database._participants()
+            key = f"seller:{seller_id}" if seller_id is not None else f"buyer:{where['buyer_username'].lower()}"
+            candidates = {deal_id for ids in participants.get(key, {}).values() for deal_id in ids}
+        else:
+            candidates = deals.keys()
+
+        low, high = price
+        matches = []
+        for deal_id in candidates:
+            deal = deals.get(deal_id)
+            if deal_id == "example_format" or not isinstance(deal, dict):
+                continue
+            if status and deal.get("status") != status:
+                continue
+            if seller_id is not None and deal.get("seller_id") != seller_id:
+                continue
+            if buyer_username and (deal.get("buyer_username") or "").lower() != where["buyer_username"].lower():
+                continue
+            if (low is not None and deal.get("price", 0) < low) or (high is not None and deal.get("price", 0) > high):
+                continue
+            matches.append(deal_id)
+        matches.sort(key=lambda deal_id: deals[deal_id].get("updated_at", 0), reverse=True)
+        return [(deal_id, dict(deals[deal_id])) for deal_id in matches[offset:offset + limit]], len(matches)
@@ -0,0 +1,327 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+MAGIC = b"OGSNAP01"
+# magic, record count, records offset, key table offset, lookup count, lookup table offset
+HEADER = struct.Struct("<8sQQQQQ")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+class SnapshotRecords(MutableMapping):
+    """A data file's records, served from a memory-mapped binary snapshot.
+
+    The file holds every record as compact JSON behind its key, in the
+    original order, followed by a table of record offsets sorted by key and
+    optionally a second table sorted by one lower-cased field (the username
+    for users). Opening it reads only the header; a lookup is a binary
+    search over the mapped table and decodes just that record, so the cost
+    of the first request does not grow with the file. Writes and deletes
+    stay in memory on top of the snapshot until the next write_snapshot().
+    """
+
+    def __init__(self, path: str, lookup_field: Optional[str] = None):
+        self.lookup_field = lookup_field
+        # Compaction rebases the cache from a worker thread while the storage thread uses it
+        self._lock = threading.RLock()
+        self._open(path)
+
+    def _open(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._records_at, self._keys_at, self._lookup_count, self._lookup_at = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        self.path = path
+        # Decoded or written records, keys written or deleted since opening,
+        # snapshot keys deleted, and new keys in the order they were added
+        self._records: Dict[str, dict] = {}
+        self._changed: Set[str] = set()
+        self._deleted: Set[str] = set()
+        self._added: Dict[str, None] = {}
+        # Lower-cased lookup field -> key, for records written since opening
+        self._lookup_overlay: Dict[str, str] = {}
+
+    def _entry(self, position: int) -> Tuple[str, int, int]:
+        """Return (key, data start, data end) of the record entry at position"""
+        key_length, = LENGTH.unpack_from(self._map, position)
+        key_end = position + LENGTH.size + key_length
+        data_length, = LENGTH.unpack_from(self._map, key_end)
+        data_start = key_end + LENGTH.size
+        return self._map[position + LENGTH.size:key_end].decode(), data_start, data_start + data_length
+
+    def _search(self, table_at: int, count: int, target: str, read):
+        """Binary search a table of offsets; read(offset) returns (sort value, result)"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            position, = OFFSET.unpack_from(self._map, table_at + middle * OFFSET.size)
+            value, result = read(position)
+            if value < target:
+                low = middle + 1
+            elif value > target:
+                high = middle
+            else:
+                return result
+        return None
+
+    def _locate(self, key: str) -> Optional[Tuple[int, int]]:
+        """Return the (start, end) of key's data in the snapshot"""
+        def read(position):
+            found, start, end = self._entry(position)
+            return found, (start, end)
+        return self._search(self._keys_at, self._count, key, read)
+
+    def _has(self, key: str) -> bool:
+        if key in self._records:
+            return True
+        return key not in self._deleted and key not in self._changed and self._locate(key) is not None
+
+    def _set(self, key: str, record: dict):
+        if key not in self._records:
+            if self._locate(key) is None:
+                self._added[key] = None
+            else:
+                self._deleted.discard(key)
+        self._records[key] = record
+        self._changed.add(key)
+        if self.lookup_field and isinstance(record, dict) and record.get(self.lookup_field):
+            self._lookup_overlay[str(record[self.lookup_field]).lower()] = key
+
+    def _discard(self, key: str):
+        self._records.pop(key, None)
+        self._changed.add(key)
+        if key in self._added:
+            del self._added[key]
+        else:
+            self._deleted.add(key)
+
+    def __getitem__(self, key: str) -> dict:
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                return record
+            if key in self._deleted or key in self._changed:
+                raise KeyError(key)
+            span = self._locate(key)
+            if span is None:
+                raise KeyError(key)
+            record = json.loads(self._map[span[0]:span[1]])
+            self._records[key] = record
+            return record
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._has(key)
+
+    def __setitem__(self, key: str, record: dict):
+        with self._lock:
+            self._set(key, record)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            if not self._has(key):
+                raise KeyError(key)
+            self._discard(key)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = self.copy()
+        position = snapshot._records_at
+        for _ in range(snapshot._count):
+            key, _, position = snapshot._entry(position)
+            if key not in snapshot._deleted:
+                yield key
+        yield from snapshot._added
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count - len(self._deleted) + len(self._added)
+
+    def raw_items(self) -> Iterator[Tuple[str, bytes]]:
+        """(key, compact JSON) of every record, in file order, then the added ones.
+
+        Records not written since opening are read from the file in one
+        sequential pass and not decoded.
+        """
+        position = self._records_at
+        for _ in range(self._count):
+            key, start, position = self._entry(position)
+            if key not in self._changed:
+                yield key, self._map[start:position]
+            elif key in self._records:
+                yield key, json.dumps(self._records[key], separators=(',', ':')).encode()
+        for key in self._added:
+            yield key, json.dumps(self._records[key], separators=(',', ':')).encode()
+
+    def _lookup_entry(self, position: int) -> Tuple[str, str]:
+        """Return (lower-cased lookup value, key) of the lookup entry at position"""
+        length, = LENGTH.unpack_from(self._map, position)
+        key_at = position + LENGTH.size + length
+        key_length, = LENGTH.unpack_from(self._map, key_at)
+        return (self._map[position + LENGTH.size:key_at].decode(),
+                self._map[key_at + LENGTH.size:key_at + LENGTH.size + key_length].decode())
+
+    def lookup_entries(self) -> Iterator[Tuple[str, str]]:
+        """Every (lower-cased lookup value, key), sorted.
+
+        The entries of records not written since opening are copied from
+        the file's lookup table; only the written records are looked at.
+        """
+        written = sorted(
+            (str(self._records[key][self.lookup_field]).lower(), key) for key in self._changed
+            if isinstance(self._records.get(key), dict) and self._records[key].get(self.lookup_field)
+        )
+
+        def stored():
+            for index in range(self._lookup_count):
+                position, = OFFSET.unpack_from(self._map, self._lookup_at + index * OFFSET.size)
+                value, key = self._lookup_entry(position)
+                if key not in self._changed:
+                    yield value, key
+        return heapq.merge(stored(), written)
+
+    def lookup(self, value: str) -> Optional[str]:
+        """Return the key of the record whose lookup field equals value, ignoring case"""
+        value = value.lower()
+        with self._lock:
+            key = self._lookup_overlay.get(value)
+            if key is not None and key in self._records:
+                if str(self._records[key].get(self.lookup_field) or "").lower() == value:
+                    return key
+            key = self._search(self._lookup_at, self._lookup_count, value, self._lookup_entry)
+            # The snapshot's answer is stale once the record was written or deleted
+            return key if key is not None and key not in self._changed else None
+
+    def copy(self) -> 'SnapshotRecords':
+        """A view of the current contents that later writes do not affect"""
+        other = SnapshotRecords.__new__(SnapshotRecords)
+        with self._lock:
+            other.__dict__.update(self.__dict__)
+            other._lock = threading.RLock()
+            other._records = dict(self._records)
+            other._changed = set(self._changed)
+            other._deleted = set(self._deleted)
+            other._added = dict(self._added)
+            other._lookup_overlay = dict(self._lookup_overlay)
+        return other
+
+    def rebase(self, path: str, written: 'SnapshotRecords'):
+        """Switch to the snapshot just written from written, a copy() of self or self.
+
+        Changes made after that copy was taken are kept on top of the new file.
+        """
+        with self._lock:
+            kept = {}
+            if written is not self:
+                for key in self._changed:
+                    if key in self._records:
+                        if written._records.get(key) is not self._records[key]:
+                            kept[key] = self._records[key]
+                    elif key in written:
+                        kept[key] = None
+            self._open(path)
+            for key, record in kept.items():
+                if record is not None:
+                    self._set(key, record)
+                elif self._has(key):
+                    self._discard(key)
+
+def write_snapshot(path: str, data, lookup_field: Optional[str] = None) -> int:
+    """Write data (a dict or SnapshotRecords) to path atomically, returning its size.
+
+    From a SnapshotRecords, records and lookup entries still untouched are
+    copied as stored bytes in one pass over the old file, so rewriting a
+    large snapshot decodes only the records written since it was opened.
+    """
+    entries: List[Tuple[bytes, int]] = []
+    lookups: List[Tuple[str, str]] = []
+    snapshot = isinstance(data, SnapshotRecords)
+    copy_lookups = snapshot and data.lookup_field == lookup_field
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b"\0" * HEADER.size)
+        position = HEADER.size
+        for key, raw in (data.raw_items() if snapshot else ((key, None) for key in data)):
+            record = None
+            if raw is None:
+                record = data[key]
+                raw = json.dumps(record, separators=(',', ':')).encode()
+            if lookup_field and not copy_lookups:
+                record = json.loads(raw) if record is None else record
+                if isinstance(record, dict) and record.get(lookup_field):
+                    lookups.append((str(record[lookup_field]).lower(), key))
+            encoded_key = key.encode()
+            f.write(LENGTH.pack(len(encoded_key)) + encoded_key + LENGTH.pack(len(raw)))
+            f.write(raw)
+            entries.append((encoded_key, position))
+            position += 2 * LENGTH.size + len(encoded_key) + len(raw)
+
+        keys_at = position
+        entries.sort()
+        f.write(b"".join(OFFSET.pack(offset) for _, offset in entries))
+        position += len(entries) * OFFSET.size
+
+        lookup_entries = []
+        if not lookup_field:
+            lookup_rows = []
+        elif copy_lookups:
+            lookup_rows = data.lookup_entries()
+        else:
+            lookup_rows = sorted(lookups)
+        for value, key in lookup_rows:
+            encoded_value, encoded_key = value.encode(), key.encode()
+            lookup_entries.append(position)
+            chunk = LENGTH.pack(len(encoded_value)) + encoded_value + LENGTH.pack(len(encoded_key)) + encoded_key
+            f.write(chunk)
+            position += len(chunk)
+        lookup_at = position
+        f.write(b"".join(OFFSET.pack(offset) for offset in lookup_entries))
+        position += len(lookup_entries) * OFFSET.size
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(entries), HEADER.size, keys_at, len(lookup_entries), lookup_at))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return position
+
+def snapshot_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".snap"
+
+if __name__ == '__main__':
+    # python -m utils.snapshot export|import: convert the data files to or from snapshots.
+    # Run it with the bot stopped; pending journal entries are folded into the result.
+    from config import USERS_FILE, DEALS_FILE, REDEEM_CODES_FILE, STATS_FILE, SNAPSHOT_LOOKUP_FIELDS
+    from utils.journal import Journal
+    if len(sys.argv) != 2 or sys.argv[1] not in ("export", "import"):
+        sys.exit("Usage: python -m utils.snapshot export|import")
+    for file_path in (USERS_FILE, DEALS_FILE, REDEEM_CODES_FILE, STATS_FILE):
+        target = snapshot_path(file_path)
+        if not os.path.exists(file_path if sys.argv[1] == "export" else target):
+            continue
+        journal = Journal(file_path)
+        if sys.argv[1] == "export":
+            with open(file_path, 'r') as f:
+                records = json.load(f)
+            journal.replay(records)
+            write_snapshot(target, records, SNAPSHOT_LOOKUP_FIELDS.get(file_path))
+            print(f"Wrote {len(records)} records from {file_path} to {target}")
+        else:
+            records = SnapshotRecords(target)
+            journal.replay(records)
+            with open(file_path + ".tmp", 'w') as f:
+                json.dump({key: records[key] for key in records}, f, indent=4)
+            os.replace(file_path + ".tmp", file_path)
+            print(f"Wrote {len(records)} records from {target} to {file_path}")
+        # The entries are in the converted file now; replaying them later could undo newer writes
+        for path in (journal.rotated_path, journal.path):
+            if os.path.exists(path):
+                os.remove(path)
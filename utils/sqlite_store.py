@@ -0,0 +1,292 @@
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import USERS_FILE, DEALS_FILE, REDEEM_CODES_FILE, STATS_FILE, SQLITE_FILE
+from utils.metrics import record_db
+
+# Table name and indexed columns for each data file. Indexed columns are
+# copied out of the record on every write; the record itself is stored as JSON.
+TABLES = {
+    USERS_FILE: ("users", {"username": "TEXT COLLATE NOCASE"}),
+    DEALS_FILE: ("deals", {
+        "seller_id": "INTEGER",
+        "buyer_username": "TEXT COLLATE NOCASE",
+        "status": "TEXT"
+    }),
+    REDEEM_CODES_FILE: ("redeem_codes", {}),
+    STATS_FILE: ("stats", {}),
+}
+
+# Multi-column indexes, for queries that filter on several indexed columns
+COMPOSITE_INDEXES = {
+    DEALS_FILE: [("seller_id", "status"), ("buyer_username", "status")],
+}
+
+# Record fields kept in a full-text (FTS5) index next to the table
+SEARCH_FIELDS = {
+    DEALS_FILE: ("product_name", "product_description"),
+}
+
+def _search_rowid(key: str) -> int:
+    # Full-text rows are addressed by a hash of the key, so an update can
+    # delete the old row by rowid instead of scanning for it
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") >> 1
+
+class SQLiteStore:
+    """SQLite storage engine with the same record layout as the JSON files"""
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._create_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection.
+
+        Each thread has its own, so a transaction opened on one thread never
+        takes in writes made on another; they wait for it instead.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; multi-statement writes use transaction()
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        for table, columns in TABLES.values():
+            extra = "".join(f", {name} {kind}" for name, kind in columns.items())
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY{extra}, data TEXT NOT NULL)"
+            )
+            for name in columns:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table} ({name})")
+        for file_path, fields in SEARCH_FIELDS.items():
+            table, _ = TABLES[file_path]
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (f"{table}_search",)
+            ).fetchone()
+            if not exists:
+                self.conn.execute(f"CREATE VIRTUAL TABLE {table}_search USING fts5(id UNINDEXED, text)")
+                # Index the records written before the search table existed
+                with self.transaction():
+                    for key, data in self.conn.execute(f"SELECT id, data FROM {table}").fetchall():
+                        self._index_text(file_path, key, json.loads(data))
+        for file_path, indexes in COMPOSITE_INDEXES.items():
+            table, _ = TABLES[file_path]
+            for names in indexes:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(names)} ON {table} ({', '.join(names)})"
+                )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several writes atomically; joins a transaction this thread already has open"""
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def get(self, file_path: str, key: str) -> dict:
+        table, _ = TABLES[file_path]
+        started = time.perf_counter()
+        row = self.conn.execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+        record_db("read", table, started, len(row[0]) if row else 0)
+        return json.loads(row[0]) if row else {}
+
+    def put(self, file_path: str, key: str, record: dict):
+        table, columns = TABLES[file_path]
+        started = time.perf_counter()
+        data = json.dumps(record)
+        names = ["id", *columns, "data"]
+        values = [key, *(record.get(name) for name in columns), data]
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' * len(names))})",
+            values
+        )
+        if file_path in SEARCH_FIELDS:
+            self._index_text(file_path, key, record)
+        record_db("write", table, started, len(data))
+
+    def _index_text(self, file_path: str, key: str, record: Optional[dict]):
+        """Replace the full-text row of a record; None just removes it"""
+        table, _ = TABLES[file_path]
+        rowid = _search_rowid(key)
+        self.conn.execute(f"DELETE FROM {table}_search WHERE rowid = ?", (rowid,))
+        if record is not None and key != "example_format":
+            text = " ".join(str(record.get(field) or "") for field in SEARCH_FIELDS[file_path])
+            self.conn.execute(
+                f"INSERT INTO {table}_search (rowid, id, text) VALUES (?, ?, ?)", (rowid, key, text)
+            )
+
+    def put_many(self, file_path: str, records: Dict[str, dict]):
+        with self.transaction():
+            for key, record in records.items():
+                self.put(file_path, key, record)
+
+    def find_key(self, file_path: str, column: str, value) -> Optional[str]:
+        """Return the key of a record whose indexed column equals value"""
+        table, columns = TABLES[file_path]
+        if column not in columns:
+            raise ValueError(f"{column} is not an indexed column of {table}")
+        row = self.conn.execute(
+            f"SELECT id FROM {table} WHERE {column} = ? AND id != 'example_format' LIMIT 1",
+            (value,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_records(self, file_path: str, column: str, values: List) -> Dict[str, dict]:
+        """Return every record whose indexed column is one of values"""
+        table, columns = TABLES[file_path]
+        if column not in columns:
+            raise ValueError(f"{column} is not an indexed column of {table}")
+        rows = self.conn.execute(
+            f"SELECT id, data FROM {table} WHERE {column} IN ({', '.join('?' * len(values))}) "
+            f"AND id != 'example_format'",
+            list(values)
+        )
+        return {key: json.loads(data) for key, data in rows}
+
+    def count_by(self, file_path: str, column: str, value, group_column: str) -> Dict[str, int]:
+        """Count the records whose column equals value, per value of group_column"""
+        table, columns = TABLES[file_path]
+        if column not in columns or group_column not in columns:
+            raise ValueError(f"{column} and {group_column} must be indexed columns of {table}")
+        rows = self.conn.execute(
+            f"SELECT {group_column}, COUNT(*) FROM {table} WHERE {column} = ? "
+            f"AND id != 'example_format' GROUP BY {group_column}",
+            (value,)
+        )
+        return dict(rows.fetchall())
+
+    def find_page(self, file_path: str, where: Dict[str, object], limit: int,
+                  after: Optional[str] = None, before: Optional[str] = None,
+                  oldest: bool = False) -> Dict[str, dict]:
+        """Return records matching every indexed column in where, newest write first.
+
+        Pages by rowid rather than OFFSET, so each page is one index range
+        scan: after/before name the record just past either end of the page
+        wanted, and oldest=True returns the last page.
+        """
+        table, columns = TABLES[file_path]
+        unknown = set(where) - set(columns)
+        if unknown:
+            raise ValueError(f"{', '.join(sorted(unknown))} not indexed in {table}")
+        conditions = [f"{name} = ?" for name in where]
+        params = list(where.values())
+        if after is not None:
+            conditions.append(f"rowid < (SELECT rowid FROM {table} WHERE id = ?)")
+            params.append(after)
+        if before is not None:
+            conditions.append(f"rowid > (SELECT rowid FROM {table} WHERE id = ?)")
+            params.append(before)
+        # Walk towards the newer end for a previous page, then put it back in order
+        ascending = before is not None or oldest
+        rows = self.conn.execute(
+            f"SELECT id, data FROM {table} WHERE {' AND '.join(conditions)} AND id != 'example_format' "
+            f"ORDER BY rowid {'ASC' if ascending else 'DESC'} LIMIT ?",
+            [*params, limit]
+        ).fetchall()
+        if ascending:
+            rows.reverse()
+        return {key: json.loads(data) for key, data in rows}
+
+    def search(self, file_path: str, words: List[str], where: Dict[str, object],
+               ranges: Dict[str, Tuple[Optional[float], Optional[float]]], limit: int,
+               offset: int = 0) -> Tuple[Dict[str, dict], int]:
+        """Return one page of records containing all words and matching the filters, and the total.
+
+        where compares indexed columns for equality; ranges bounds record
+        fields, either end may be None. Newest write first.
+        """
+        table, columns = TABLES[file_path]
+        unknown = set(where) - set(columns)
+        if unknown:
+            raise ValueError(f"{', '.join(sorted(unknown))} not indexed in {table}")
+        source = f"{table} d"
+        conditions, params = ["d.id != 'example_format'"], []
+        if words:
+            source = f"{table}_search s JOIN {table} d ON d.id = s.id"
+            conditions.append(f"{table}_search MATCH ?")
+            params.append(" ".join('"' + word.replace('"', '""') + '"' for word in words))
+        for name, value in where.items():
+            conditions.append(f"d.{name} = ?")
+            params.append(value)
+        for field, (low, high) in ranges.items():
+            if low is not None:
+                conditions.append("json_extract(d.data, ?) >= ?")
+                params += [f"$.{field}", low]
+            if high is not None:
+                conditions.append("json_extract(d.data, ?) <= ?")
+                params += [f"$.{field}", high]
+        query = f"FROM {source} WHERE {' AND '.join(conditions)}"
+        total = self.conn.execute(f"SELECT COUNT(*) {query}", params).fetchone()[0]
+        rows = self.conn.execute(
+            f"SELECT d.id, d.data {query} ORDER BY d.rowid DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset]
+        )
+        return {key: json.loads(data) for key, data in rows}, total
+
+    def delete(self, file_path: str, keys: List[str]):
+        table, _ = TABLES[file_path]
+        with self.transaction():
+            self.conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(key,) for key in keys])
+            if file_path in SEARCH_FIELDS:
+                for key in keys:
+                    self._index_text(file_path, key, None)
+
+    def keys(self, file_path: str) -> List[str]:
+        table, _ = TABLES[file_path]
+        return [row[0] for row in self.conn.execute(f"SELECT id FROM {table} ORDER BY rowid")]
+
+    def load_table(self, file_path: str) -> dict:
+        table, _ = TABLES[file_path]
+        started = time.perf_counter()
+        rows = self.conn.execute(f"SELECT id, data FROM {table} ORDER BY rowid").fetchall()
+        result = {key: json.loads(data) for key, data in rows}
+        record_db("load", table, started, sum(len(data) for _, data in rows))
+        return result
+
+    def replace_table(self, file_path: str, data: dict):
+        table, _ = TABLES[file_path]
+        with self.transaction():
+            self.conn.execute(f"DELETE FROM {table}")
+            if file_path in SEARCH_FIELDS:
+                self.conn.execute(f"DELETE FROM {table}_search")
+            for key, record in data.items():
+                self.put(file_path, key, record)
+
+def migrate_from_json(store: SQLiteStore) -> Dict[str, int]:
+    """Copy every record from the JSON data files into the SQLite store"""
+    counts = {}
+    for file_path in TABLES:
+        try:
+            with open(file_path, 'r') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            records = {}
+        store.put_many(file_path, records)
+        counts[file_path] = len(records)
+    return counts
+
+if __name__ == '__main__':
+    # One-shot migration: python -m utils.sqlite_store [database path]
+    target = sys.argv[1] if len(sys.argv) > 1 else SQLITE_FILE
+    for file_path, count in migrate_from_json(SQLiteStore(target)).items():
+        print(f"Migrated {count} records from {file_path}")
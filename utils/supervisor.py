@@ -0,0 +1,223 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+from typing import List, Optional
+import httpx
+from telegram import Bot, Update
+from telegram.error import RetryAfter, TelegramError
+from config import (
+    BOT_TOKEN, BOT_API_BASE_URL, DELIVERY_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_URL, WEBHOOK_SECRET, WORKER_BASE_PORT, WORKER_MAX_QUEUE, METRICS_PORT
+)
+from utils.http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+def shard_key(update: dict) -> int:
+    """Return the id an update is sharded by: its user, else its chat, else 0.
+
+    Matches Update.effective_user, so every update a user sends, and with it
+    their conversation state, lands on the same worker.
+    """
+    for field, value in update.items():
+        if field == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return 0
+
+class Worker:
+    """One bot.py process and the queue of updates waiting for it"""
+
+    def __init__(self, index: int, secret: str):
+        self.index = index
+        self.port = WORKER_BASE_PORT + index
+        self.url = f"http://127.0.0.1:{self.port}{WEBHOOK_PATH}"
+        self.secret = secret
+        self.queue: asyncio.Queue = asyncio.Queue(WORKER_MAX_QUEUE)
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    def environment(self) -> dict:
+        env = dict(
+            os.environ,
+            WORKER_INDEX=str(self.index),
+            DELIVERY_MODE="webhook",
+            WEBHOOK_LISTEN="127.0.0.1",
+            WEBHOOK_PORT=str(self.port),
+            WEBHOOK_SECRET=self.secret,
+            WEBHOOK_URL="",
+        )
+        if METRICS_PORT:
+            env["METRICS_PORT"] = str(METRICS_PORT + 1 + self.index)
+        return env
+
+    async def spawn(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(sys.argv[0]), env=self.environment(),
+            # Keep Ctrl+C away from the workers; the supervisor stops them after draining
+            start_new_session=True
+        )
+        logger.info("Started worker %d (pid %d) on port %d", self.index, self.process.pid, self.port)
+
+    async def forward(self, client: httpx.AsyncClient):
+        """POST queued updates to the worker one at a time, in order.
+
+        An update is retried until the worker accepts it, so a restarting or
+        busy worker (503) delays its shard instead of losing updates.
+        """
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret}
+        while True:
+            body = await self.queue.get()
+            delay = 0.1
+            while True:
+                try:
+                    response = await client.post(self.url, content=body, headers=headers)
+                    if response.status_code == 200:
+                        break
+                    if response.status_code in (400, 403):
+                        logger.error("Worker %d rejected an update: %s", self.index, response.status_code)
+                        break
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+            self.queue.task_done()
+
+class Supervisor:
+    """Receives updates once and spreads them over worker processes.
+
+    Each update goes to worker shard_key(update) % workers, and each worker's
+    updates are forwarded in arrival order, one at a time, so a user's
+    updates are still handled in order and by the process that holds their
+    conversation. The workers are ordinary bot.py processes in webhook mode
+    on local ports. They share the SQLite store, the persistence file, the
+    ledger and the archive, and take record locks through LOCK_FILE.
+    Crashed workers are restarted; on SIGINT or SIGTERM the supervisor stops
+    receiving, lets the queues drain and then stops the workers.
+    """
+
+    def __init__(self, workers: int):
+        secret = secrets.token_urlsafe(32)
+        self.workers: List[Worker] = [Worker(index, secret) for index in range(workers)]
+        self._stopping = asyncio.Event()
+
+    async def _dispatch(self, update: dict) -> bool:
+        """Queue an update for its worker; False if the queue is full"""
+        worker = self.workers[shard_key(update) % len(self.workers)]
+        if DELIVERY_MODE == "webhook":
+            if worker.queue.full():
+                return False
+            worker.queue.put_nowait(json.dumps(update).encode())
+        else:
+            await worker.queue.put(json.dumps(update).encode())
+        return True
+
+    async def _receive(self, request: Request) -> Response:
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return Response(403, b"Invalid secret token")
+        try:
+            update = json.loads(request.body)
+        except ValueError:
+            return Response(400, b"Invalid update")
+        if not isinstance(update, dict):
+            return Response(400, b"Invalid update")
+        if not await self._dispatch(update):
+            return Response(503, b"Too many pending updates")
+        return Response(200, b"")
+
+    async def _poll(self, bot: Bot):
+        """Fetch updates with getUpdates; the offset moves only past queued ones"""
+        await bot.delete_webhook(drop_pending_updates=True)
+        offset = None
+        while not self._stopping.is_set():
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=50, read_timeout=60, allowed_updates=Update.ALL_TYPES
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self._dispatch(update.to_dict())
+                offset = update.update_id + 1
+
+    async def _watch(self, worker: Worker):
+        """Restart the worker whenever it exits, until shutdown"""
+        delay = 1
+        while not self._stopping.is_set():
+            await worker.spawn()
+            if self._stopping.is_set():
+                worker.process.terminate()
+            code = await worker.process.wait()
+            if self._stopping.is_set():
+                return
+            logger.error("Worker %d exited with %s; restarting in %ds", worker.index, code, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=len(self.workers)))
+        bot = Bot(BOT_TOKEN, **({"base_url": BOT_API_BASE_URL} if BOT_API_BASE_URL else {}))
+        watchers = [asyncio.create_task(self._watch(worker)) for worker in self.workers]
+        forwarders = [asyncio.create_task(worker.forward(client)) for worker in self.workers]
+
+        server = None
+        async with bot:
+            if DELIVERY_MODE == "webhook":
+                server = HTTPServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+                server.route("POST", WEBHOOK_PATH, self._receive)
+                await server.start()
+                if WEBHOOK_URL:
+                    await bot.set_webhook(
+                        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                        secret_token=WEBHOOK_SECRET,
+                        allowed_updates=Update.ALL_TYPES,
+                        drop_pending_updates=True
+                    )
+                receiver = None
+            else:
+                receiver = asyncio.create_task(self._poll(bot))
+            logger.info("Supervising %d workers", len(self.workers))
+
+            await self._stopping.wait()
+            if server:
+                await server.stop()
+            if receiver:
+                receiver.cancel()
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(worker.queue.join() for worker in self.workers)), 30
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Stopping with %d updates not forwarded",
+                           sum(worker.queue.qsize() for worker in self.workers))
+        for task in forwarders:
+            task.cancel()
+        await client.aclose()
+
+        for worker in self.workers:
+            if worker.process and worker.process.returncode is None:
+                worker.process.terminate()
+        await asyncio.gather(*watchers)
+        for worker in self.workers:
+            if worker.process:
+                await worker.process.wait()
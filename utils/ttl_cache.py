@@ -0,0 +1,39 @@
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+class TTLCache:
+    """Dict-backed cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + ttl, value)
+        if len(self._data) > self.max_size:
+            self._evict()
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+        # Still full: drop the oldest entries, dicts keep insertion order
+        while len(self._data) > self.max_size:
+            del self._data[next(iter(self._data))]
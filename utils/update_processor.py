@@ -0,0 +1,34 @@
+from typing import Any, Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from utils.locks import locks
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each user's updates in order.
+
+    Updates from different users run in parallel up to max_concurrent_updates.
+    Updates from the same user wait for each other, which keeps the escrow
+    ConversationHandler and user_data consistent. They wait before taking
+    one of the max_concurrent_updates slots, so a burst from one user
+    occupies a single slot and cannot hold up everyone else.
+    """
+
+    # BaseUpdateProcessor marks this final for type checkers only; it would
+    # take the slot first and wait for the user's lock while holding it
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await super().process_update(update, coroutine)
+            return
+        # The supervisor sends each user to one worker, so this lock stays local
+        async with locks.hold(f"update:{user.id}", shared=False):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
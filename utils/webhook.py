@@ -0,0 +1,80 @@
+import asyncio
+import hmac
+import json
+import logging
+from telegram import Update
+from utils.http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+class WebhookReceiver:
+    """Receives Telegram updates over HTTP and hands them to the Application.
+
+    Requests must carry the secret in the X-Telegram-Bot-Api-Secret-Token
+    header; anything else could forge updates from an admin. At most
+    max_queue updates are accepted but not yet processed; beyond that the
+    receiver answers 503 and Telegram retries later. For local testing,
+    POST a recorded update:
+
+        curl -H 'X-Telegram-Bot-Api-Secret-Token: <secret>' \\
+             --data @update.json http://127.0.0.1:8443/telegram
+    """
+
+    def __init__(self, application, host: str, port: int, path: str,
+                 secret_token: str, max_queue: int = 1000):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.max_queue = max_queue
+        self.server = HTTPServer(host, port)
+        self.server.route("POST", path, self._receive)
+        self._backlog = 0
+        self._tasks = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def start(self):
+        await self.server.start()
+        logger.info("Webhook receiver listening on %s:%s%s", self.server.host, self.server.port, self.path)
+
+    async def stop(self, timeout: float = 30):
+        """Stop accepting updates and wait for the accepted ones to finish"""
+        await self.server.stop()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with %s updates still in progress", self._backlog)
+
+    async def _receive(self, request: Request) -> Response:
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token, self.secret_token):
+            return Response(403, b"Invalid secret token")
+
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return Response(400, b"Invalid update")
+
+        if self._backlog >= self.max_queue:
+            return Response(503, b"Too many pending updates")
+
+        self._backlog += 1
+        self._idle.clear()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return Response(200, b"")
+
+    async def _process(self, update: Update):
+        # Same path the polling fetcher takes, so the update processor still
+        # bounds concurrency and keeps each user's updates in order
+        try:
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception:
+            logger.exception("Error while processing webhook update")
+        finally:
+            self._backlog -= 1
+            if not self._backlog:
+                self._idle.set()